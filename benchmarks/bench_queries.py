@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Benchmarks of building the metric queries and parsing their responses
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+from datetime import timedelta
+
+from manuscripts.esclient import ClientRegistry
+from manuscripts.esquery import ElasticQuery
+from manuscripts.metrics import git
+from manuscripts2.elasticsearch import buckets_to_df
+
+from .common import ES_URL, START, END, set_synthetic_client
+
+
+class TimeElasticQuery():
+    """Building the DSL queries of the metrics"""
+
+    def setup(self):
+        self.filters = {"project": "grimoirelab", "*author_bot": "true"}
+
+    def time_get_agg(self):
+        ElasticQuery.get_agg(field="hash", date_field="grimoire_creation_date",
+                             start=START, end=END, filters=self.filters,
+                             agg_type="cardinality")
+
+    def time_get_agg_evolutionary(self):
+        ElasticQuery.get_agg(field="hash", date_field="grimoire_creation_date",
+                             start=START, end=END, filters=self.filters,
+                             agg_type="cardinality", interval="month")
+
+
+class TimeParseTs():
+    """Parsing the time series of a metric from the Elasticsearch response"""
+
+    params = ['month', 'day']
+    param_names = ['interval']
+
+    def setup(self, interval):
+        client = set_synthetic_client()
+        self.commits = git.Commits(ES_URL, "git", start=START, end=END, interval=interval)
+        self.res = client.get_response("git", self.commits.get_query(evolutionary=True))[0]
+
+    def teardown(self, interval):
+        ClientRegistry.reset()
+
+    def time_parse_ts(self, interval):
+        self.commits.parse_ts(self.res)
+
+
+class TimeBucketsToDf():
+    """Converting the buckets of a manuscripts2 time series to a DataFrame"""
+
+    params = [100, 10000]
+    param_names = ['buckets']
+
+    def setup(self, buckets):
+        self.buckets = []
+        for day in range(buckets):
+            date = START + timedelta(days=day)
+            self.buckets.append({"key": int(date.timestamp() * 1000),
+                                 "key_as_string": date.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                                 "doc_count": day, "1": {"value": day}})
+
+    def time_buckets_to_df(self, buckets):
+        buckets_to_df(self.buckets)
+
+
+class TimeNestedBucketsToDf():
+    """Converting the buckets of a manuscripts2 time series by authors to a DataFrame"""
+
+    params = [1000, 100000]
+    param_names = ['authors']
+
+    def setup(self, authors):
+        # Authors spread over 24 months
+        self.buckets = []
+        for month in range(24):
+            date = START + timedelta(days=31 * month)
+            authors_buckets = [{"key": "author-%i" % author, "doc_count": author, "0": {"value": author}}
+                               for author in range(month, authors, 24)]
+            self.buckets.append({"key": int(date.timestamp() * 1000),
+                                 "key_as_string": date.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                                 "doc_count": len(authors_buckets), "0": {"buckets": authors_buckets}})
+
+    def time_buckets_to_df(self, authors):
+        buckets_to_df(self.buckets)
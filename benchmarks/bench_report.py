@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Benchmarks of generating the reports with synthetic Elasticsearch responses
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import os
+import shutil
+import tempfile
+
+from manuscripts.esbatch import QueryBatch
+from manuscripts.esclient import ClientRegistry
+from manuscripts.metrics import git
+from manuscripts.report import CHART_BACKENDS, Report, render_chart
+from manuscripts2.report import Report as Report2
+
+from .common import DATA_SOURCES, ES_URL, END, MONTHS, START, set_synthetic_client
+
+
+class TimeCharts():
+    """Drawing the charts of the report with each backend"""
+
+    params = sorted(CHART_BACKENDS)
+    param_names = ['backend']
+
+    def setup(self, backend):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        self.backend = CHART_BACKENDS[backend]
+        self.labels = ["%02i-%02i" % (16 + month // 12, month % 12 + 1) for month in range(MONTHS)]
+        self.values = [[month * factor % 50 for month in range(MONTHS)] for factor in (3, 7, 11)]
+
+    def teardown(self, backend):
+        shutil.rmtree(self.data_dir)
+
+    def time_bar_chart(self, backend):
+        render_chart(self.backend.bar_chart, "Commits", self.labels, self.values[0],
+                     os.path.join(self.data_dir, "bar.eps"), self.values[1],
+                     legend=["Commits", "Authors"])
+
+    def time_bar3_chart(self, backend):
+        render_chart(self.backend.bar3_chart, "Submitted", self.labels, self.values[0],
+                     os.path.join(self.data_dir, "bar3.eps"), self.values[1], self.values[2],
+                     legend=["Submitted", "Merged", "Abandoned"])
+
+
+class TimeCSV():
+    """Writing the CSV files with the time series of the metrics"""
+
+    params = ['month', 'quarter']
+    param_names = ['interval']
+
+    def setup(self, interval):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        set_synthetic_client()
+        self.report = Report(ES_URL, START, END, data_dir=self.data_dir, data_sources=['git'],
+                             interval=interval, render_workers=0)
+        # Just the CSV files are written
+        self.report.draw_chart = lambda *args, **kwargs: None
+
+        self.commits = git.Commits(ES_URL, "git", start=START, end=END)
+        self.authors = git.Authors(ES_URL, "git", start=START, end=END)
+        batch = QueryBatch(ES_URL)
+        items = [batch.add(self.commits, 'ts'), batch.add(self.authors, 'ts')]
+        batch.execute()
+        self.commits_ts, self.authors_ts = [item.result for item in items]
+
+    def teardown(self, interval):
+        ClientRegistry.reset()
+        shutil.rmtree(self.data_dir)
+
+    def time_write_csv(self, interval):
+        self.report._Report__write_csv_eps(self.commits, self.commits_ts, self.authors,
+                                           self.authors_ts, "labels,commits,authors",
+                                           "git_commits_git_authors", "Commits", "grimoirelab")
+
+
+class TimeReport():
+    """Generating all the data and charts of a report with projects"""
+
+    params = [1, 50, 500]
+    param_names = ['projects']
+    number = 1  # the charts with the same data are not drawn again
+    repeat = 3
+    timeout = 1800
+
+    def setup(self, projects):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        self.client = set_synthetic_client(projects)
+        self.report = Report(ES_URL, START, END, data_dir=self.data_dir, data_sources=DATA_SOURCES,
+                             projects=True, render_workers=0, chart_backend='eps')
+
+    def teardown(self, projects):
+        ClientRegistry.reset()
+        shutil.rmtree(self.data_dir)
+
+    def time_create_data_figs(self, projects):
+        self.report.create_data_figs()
+
+    def track_queries(self, projects):
+        self.report.create_data_figs()
+        return len(self.client.queries)
+
+    track_queries.unit = "queries"
+
+    def track_requests(self, projects):
+        self.report.create_data_figs()
+        return self.client.requests
+
+    track_requests.unit = "requests"
+
+
+class TimeReport2():
+    """Generating the manuscripts2 report"""
+
+    def setup(self):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        # manuscripts2 uses the default Elasticsearch URL
+        set_synthetic_client(url=None)
+        self.report = Report2(data_dir=self.data_dir,
+                              data_sources=['git', 'github_issues', 'github_prs'])
+
+    def teardown(self):
+        ClientRegistry.reset()
+        shutil.rmtree(self.data_dir)
+
+    def time_create(self):
+        self.report.create()
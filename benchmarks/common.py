@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Shared settings of the benchmarks
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+from datetime import datetime, timedelta, timezone
+
+from manuscripts.esclient import ClientRegistry
+from manuscripts.esreplay import SyntheticClient
+
+ES_URL = "http://localhost:9200"
+
+# Two years of report, with items in all of them
+START = datetime(2016, 1, 1, tzinfo=timezone.utc)
+END = datetime(2018, 1, 1, tzinfo=timezone.utc) - timedelta(microseconds=1)
+MONTHS = 24
+
+DATA_SOURCES = ['git', 'gerrit', 'github', 'mbox']
+
+
+def set_synthetic_client(projects=10, url=ES_URL):
+    """
+    Use a client with synthetic responses for the benchmark queries
+
+    :param projects: number of projects of the items
+    :param url: Elasticsearch URL of the client
+    :return: the SyntheticClient
+    """
+    client = SyntheticClient(projects=projects, months=MONTHS, end=END)
+    ClientRegistry.set_client(url, client)
+    return client
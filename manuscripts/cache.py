@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# On disk cache for the responses to the Elasticsearch queries
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .esclient import ClientRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache():
+    """Cache of Elasticsearch responses stored in a SQLite database
+
+    The responses are stored using as key a hash of the Elasticsearch URL, the
+    index name and the canonical form of the query (the JSON dump with the keys
+    sorted), so the same query always gets the same key, and the responses of
+    other Elasticsearch with the same indexes are not used. Responses older
+    than ttl seconds are not used, and when the cache grows bigger than
+    max_size bytes, the least recently used responses are removed.
+    """
+
+    DB_NAME = 'queries.db'
+    TTL = 24 * 3600  # default seconds a response is valid
+    MAX_SIZE = 500 * 1024 * 1024  # default max bytes of responses stored
+
+    def __init__(self, cache_dir, es_url=None, ttl=None, max_size=None):
+        """
+        :param cache_dir: directory in which the cache database is stored
+        :param es_url: Elasticsearch URL whose responses are cached
+        :param ttl: seconds a response is valid
+        :param max_size: max size in bytes of the responses stored
+        """
+        self.cache_dir = cache_dir
+        self.es_url = ClientRegistry.normalize_url(es_url)
+        self.ttl = ttl if ttl is not None else self.TTL
+        self.max_size = max_size if max_size is not None else self.MAX_SIZE
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.__local = threading.local()  # sqlite connections can't be shared between threads
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__get_db().execute("""CREATE TABLE IF NOT EXISTS responses (
+                                   key TEXT PRIMARY KEY,
+                                   es_index TEXT,
+                                   response TEXT,
+                                   size INTEGER,
+                                   created REAL,
+                                   accessed REAL)""")
+        # Running total of the size of the responses, computed again when evicting
+        self.size = self.__get_db().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def __get_db(self):
+        if not hasattr(self.__local, 'db'):
+            db_path = os.path.join(self.cache_dir, self.DB_NAME)
+            # autocommit mode, each statement is a transaction
+            self.__local.db = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        return self.__local.db
+
+    @staticmethod
+    def get_key(index, query, es_url=None):
+        """
+        Get the cache key for a query
+
+        :param index: name of the index in which the query is done
+        :param query: dict with the DSL query
+        :param es_url: Elasticsearch URL in which the query is done, None to not include it
+        :return: a string with the hash of the URL, the index and the canonical query
+        """
+        key = [es_url, index, query] if es_url else [index, query]
+        canonical = json.dumps(key, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, index, query):
+        """
+        Get the response to a query from the cache
+
+        :param index: name of the index in which the query is done
+        :param query: dict with the DSL query
+        :return: a dict with the response, or None if it is not in the cache or it expired
+        """
+        key = self.get_key(index, query, self.es_url)
+        db = self.__get_db()
+        row = db.execute("SELECT response, created, size FROM responses WHERE key = ?",
+                         (key,)).fetchone()
+        now = time.time()
+        if row and now - row[1] > self.ttl:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            with self.lock:
+                self.size -= row[2]
+            row = None
+
+        with self.lock:
+            if not row:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, index, query, response):
+        """
+        Store the response to a query in the cache
+
+        :param index: name of the index in which the query is done
+        :param query: dict with the DSL query
+        :param response: dict with the response to the query
+        """
+        key = self.get_key(index, query, self.es_url)
+        data = json.dumps(response)
+        now = time.time()
+        db = self.__get_db()
+        row = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                   (key, index, data, len(data), now, now))
+        with self.lock:
+            self.size += len(data) - (row[0] if row else 0)
+            full = self.size > self.max_size
+        if full:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used responses until the cache fits in max_size"""
+        db = self.__get_db()
+        # The running total is not updated by other processes using the same cache
+        size = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if size <= self.max_size:
+            with self.lock:
+                self.size = size
+            return
+
+        rows = db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        keys = []
+        for key, key_size in rows:
+            if size <= self.max_size:
+                break
+            keys.append((key,))
+            size -= key_size
+        db.executemany("DELETE FROM responses WHERE key = ?", keys)
+        with self.lock:
+            self.evicted += len(keys)
+            self.size = size
+        logger.debug("%i responses removed from the query cache", len(keys))
+
+    def clear(self):
+        """Remove all the responses from the cache"""
+        self.__get_db().execute("DELETE FROM responses")
+        with self.lock:
+            self.size = 0
+
+    def get_stats(self):
+        """
+        Get the counters of the cache usage
+
+        :return: a dict with the number of hits, misses and evicted responses
+        """
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted}
+
+
+# Cache used by all the queries, None if disabled
+cache = None
+
+
+def set_cache(query_cache):
+    """
+    Set the cache to be used by all the queries
+
+    :param query_cache: a QueryCache, or None to disable the cache
+    """
+    global cache
+    cache = query_cache
+
+
+def get_cache():
+    """
+    Get the cache to be used by all the queries
+
+    :return: a QueryCache, or None if the cache is disabled
+    """
+    return cache
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Base of the backends drawing the charts of the reports
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import abc
+
+
+def convert_none_to_zero(ts):
+    """
+    Convert None values to 0 so the data works with Matplotlib
+    :param ts:
+    :return: a list with 0s where Nones existed
+    """
+
+    if not ts:
+        return ts
+
+    ts_clean = [val if val else 0 for val in ts]
+
+    return ts_clean
+
+
+class ChartBackend(abc.ABC):
+    """Base class of the backends drawing the charts of the report in EPS files
+
+    The backends are classes with classmethods, so the charts can be sent
+    to other processes to be drawn in parallel.
+    """
+
+    name = None
+
+    @classmethod
+    @abc.abstractmethod
+    def bar3_chart(cls, title, labels, data1, file_name, data2, data3, legend=["", ""]):
+        """
+        Generate a bar plot with three columns in each x position and save it to file_name
+
+        :param title: title to be used in the chart
+        :param labels: list of labels for the x axis
+        :param data1: values for the first columns
+        :param file_name: name of the file in which to save the chart
+        :param data2: values for the second columns
+        :param data3: values for the third columns
+        :param legend: legend to be shown in the chart
+        :return:
+        """
+
+    @classmethod
+    @abc.abstractmethod
+    def bar_chart(cls, title, labels, data1, file_name, data2=None, legend=["", ""]):
+        """
+        Generate a bar plot with one or two columns in each x position and save it to file_name
+
+        :param title: title to be used in the chart
+        :param labels: list of labels for the x axis
+        :param data1: values for the first columns
+        :param file_name: name of the file in which to save the chart
+        :param data2: values for the second columns. If None only one column per x position is shown.
+        :param legend: legend to be shown in the chart
+        :return:
+        """
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Backend writing the charts of the reports directly as Encapsulated PostScript
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import math
+import os
+
+import numpy as np
+
+from .charts import ChartBackend, convert_none_to_zero
+
+
+class EPSBackend(ChartBackend):
+    """Bar charts written directly as Encapsulated PostScript, without matplotlib
+
+    It is much faster than the matplotlib backends, and the charts look
+    alike, but just the features used in the report are supported.
+    """
+
+    name = 'eps'
+
+    WIDTH = 461  # points, as the default size of matplotlib figures
+    HEIGHT = 346
+    MARGINS = (60, 50, 20, 40)  # left, bottom, right and top
+    FONT_SIZE = 10
+    TITLE_SIZE = 12
+    GROUP_WIDTH = 0.84  # width of the bars of an x position, 1 is the distance between positions
+
+    # RGB of the colors used in the charts
+    COLORS = {
+        "orange": (1, 0.647, 0),
+        "grey": (0.5, 0.5, 0.5),
+        "default": (0.4, 0.761, 0.647),  # first color of prettyplotlib
+        "text": (0.149, 0.149, 0.149),
+        "grid": (1, 1, 1)
+    }
+
+    PROLOG = """%!PS-Adobe-3.0 EPSF-3.0
+%%Title: {title}
+%%Creator: manuscripts
+%%BoundingBox: 0 0 {width} {height}
+%%EndComments
+/Helvetica-Latin1 /Helvetica findfont dup length dict begin
+  {{1 index /FID ne {{def}} {{pop pop}} ifelse}} forall
+  /Encoding ISOLatin1Encoding def
+currentdict end definefont pop
+/font {{/Helvetica-Latin1 findfont exch scalefont setfont}} def
+/ctext {{moveto dup stringwidth pop 2 div neg 0 rmoveto show}} def
+/rtext {{moveto dup stringwidth pop neg 0 rmoveto show}} def
+/ltext {{moveto show}} def
+"""
+
+    @classmethod
+    def bar3_chart(cls, title, labels, data1, file_name, data2, data3, legend=["", ""]):
+        series = [(convert_none_to_zero(data3), "orange"),
+                  (convert_none_to_zero(data1), "grey"),
+                  (convert_none_to_zero(data2), "default")]
+        cls.write_chart(title, labels, series, legend, file_name)
+
+    @classmethod
+    def bar_chart(cls, title, labels, data1, file_name, data2=None, legend=["", ""]):
+        if data2 is not None:
+            series = [(convert_none_to_zero(data1), "orange"),
+                      (convert_none_to_zero(data2), "default")]
+        else:
+            series = [(convert_none_to_zero(data1), "default")]
+            legend = None
+        cls.write_chart(title, labels, series, legend, file_name)
+
+    @staticmethod
+    def get_ticks(ymin, ymax):
+        """
+        Get the values of the y axis ticks
+
+        :param ymin: min value of the axis
+        :param ymax: max value of the axis
+        :return: a list with the values in which to put the ticks
+        """
+        step = (ymax - ymin) / 5
+        magnitude = 10 ** math.floor(math.log10(step))
+        for factor in (1, 2, 2.5, 5, 10):
+            if step <= factor * magnitude:
+                step = factor * magnitude
+                break
+        tick = math.ceil(ymin / step) * step
+        ticks = []
+        while tick <= ymax:
+            ticks.append(tick)
+            tick += step
+        return ticks
+
+    @staticmethod
+    def escape(text):
+        """
+        Escape a text to be used as a PostScript string
+
+        :param text: the text to escape
+        :return: a string with the text in a PostScript string
+        """
+        escaped = ""
+        for char in str(text).encode('latin-1', 'replace'):
+            if char in b"()\\":
+                escaped += "\\" + chr(char)
+            elif char < 32 or char > 126:
+                escaped += "\\%03o" % char
+            else:
+                escaped += chr(char)
+        return "(" + escaped + ")"
+
+    @staticmethod
+    def format_value(value):
+        """Format a bar value in the same way as it is shown in the prettyplotlib charts"""
+        return '%.3f' % value if isinstance(value, np.floating) else str(value)
+
+    @staticmethod
+    def format_tick(tick):
+        """Format a tick value without the trailing zeros"""
+        return ("%f" % tick).rstrip('0').rstrip('.')
+
+    @classmethod
+    def write_chart(cls, title, labels, series, legend, file_name):
+        """
+        Write an EPS file with a bar chart
+
+        :param title: title of the chart
+        :param labels: labels for the x positions
+        :param series: list of (values, color) with the columns of each x position
+        :param legend: names of the series, or None to not show the legend
+        :param file_name: name of the EPS file
+        """
+
+        left, bottom, right, top = cls.MARGINS
+        plot_width = cls.WIDTH - left - right
+        plot_height = cls.HEIGHT - bottom - top
+
+        npos = max([len(values) for values, color in series] + [len(labels), 1])
+        values = [value for values, color in series for value in values]
+        ymin = min(values + [0])
+        ymax = max(values + [0])
+        if ymax == ymin:
+            ymax = ymin + 1
+        ymax += (ymax - ymin) * 0.1  # room for the annotations
+        ticks = cls.get_ticks(ymin, ymax)
+
+        def x_coord(pos):
+            return left + plot_width * (pos + 0.5) / npos
+
+        def y_coord(value):
+            return bottom + plot_height * (value - ymin) / (ymax - ymin)
+
+        slot = plot_width / npos
+        bar_width = slot * cls.GROUP_WIDTH / len(series)
+        max_label = max([len(str(label)) for label in labels] + [1])
+        label_size = max(4, min(cls.FONT_SIZE, slot / (0.55 * max_label)))
+        value_size = max(4, min(cls.FONT_SIZE, bar_width / 0.55 / 4))
+
+        lines = [cls.PROLOG.format(title=title.replace("\n", " "), width=cls.WIDTH, height=cls.HEIGHT)]
+
+        # Title and axes
+        lines.append("%s setrgbcolor" % " ".join(map(str, cls.COLORS['text'])))
+        lines.append("%i font %s %.2f %.2f ctext" % (cls.TITLE_SIZE, cls.escape(title),
+                                                     left + plot_width / 2, cls.HEIGHT - top / 2 - 4))
+        lines.append("0.5 setlinewidth %.2f %.2f moveto %.2f %.2f lineto stroke"
+                     % (left, bottom, left, bottom + plot_height))
+        if ymin < 0:
+            lines.append("0.75 setlinewidth %.2f %.2f moveto %.2f %.2f lineto stroke"
+                         % (left, y_coord(0), left + plot_width, y_coord(0)))
+        else:
+            lines.append("0.5 setlinewidth %.2f %.2f moveto %.2f %.2f lineto stroke"
+                         % (left, bottom, left + plot_width, bottom))
+        lines.append("%i font" % cls.FONT_SIZE)
+        for tick in ticks:
+            lines.append("%s %.2f %.2f rtext" % (cls.escape(cls.format_tick(tick)), left - 4, y_coord(tick) - 3))
+        lines.append("%.2f font" % label_size)
+        for pos, label in enumerate(labels):
+            lines.append("%s %.2f %.2f ctext" % (cls.escape(label), x_coord(pos), bottom - label_size - 4))
+
+        # Bars with their values
+        for nserie, (serie, color) in enumerate(series):
+            lines.append("%s setrgbcolor" % " ".join(map(str, cls.COLORS[color])))
+            for pos, value in enumerate(serie):
+                x = x_coord(pos) - slot * cls.GROUP_WIDTH / 2 + nserie * bar_width
+                y = y_coord(min(value, 0))
+                lines.append("%.2f %.2f %.2f %.2f rectfill" % (x, y, bar_width, abs(y_coord(value) - y_coord(0))))
+        lines.append("%s setrgbcolor" % " ".join(map(str, cls.COLORS['grid'])))
+        for tick in ticks:
+            lines.append("0.5 setlinewidth %.2f %.2f moveto %.2f %.2f lineto stroke"
+                         % (left, y_coord(tick), left + plot_width, y_coord(tick)))
+        lines.append("%s setrgbcolor %.2f font" % (" ".join(map(str, cls.COLORS['text'])), value_size))
+        for nserie, (serie, color) in enumerate(series):
+            for pos, value in enumerate(serie):
+                x = x_coord(pos) - slot * cls.GROUP_WIDTH / 2 + (nserie + 0.5) * bar_width
+                y = y_coord(value) + (2 if value >= 0 else -value_size - 2)
+                lines.append("%s %.2f %.2f ctext" % (cls.escape(cls.format_value(value)), x, y))
+
+        # Legend in the upper left corner
+        if legend:
+            y = bottom + plot_height - cls.FONT_SIZE - 4
+            lines.append("%i font" % cls.FONT_SIZE)
+            for name, (serie, color) in zip(legend, series):
+                lines.append("%s setrgbcolor %.2f %.2f 14 7 rectfill"
+                             % (" ".join(map(str, cls.COLORS[color])), left + 8, y))
+                lines.append("%s setrgbcolor %s %.2f %.2f ltext"
+                             % (" ".join(map(str, cls.COLORS['text'])), cls.escape(name), left + 26, y))
+                y -= cls.FONT_SIZE + 4
+
+        lines.append("showpage")
+        lines.append("%%EOF")
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "w") as f:
+            f.write("\n".join(lines) + "\n")
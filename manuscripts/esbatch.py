@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Batches of metric queries sent to Elasticsearch with _msearch
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import json
+import logging
+import time
+
+from collections import OrderedDict
+
+from .cache import get_cache
+from .esclient import get_client
+from .esquery import copy_query
+from .profiler import get_profiler
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem():
+    """A metric value to be computed when its batch is executed"""
+
+    def __init__(self, metric, kind):
+        """
+        :param metric: Metrics object to be computed
+        :param kind: kind of value to compute: ts, agg, list or trend
+        """
+        self.metric = metric
+        self.kind = kind
+        self.done = False
+        self.__result = None
+
+    @property
+    def result(self):
+        """The metric value, available once the batch is executed"""
+        if not self.done:
+            raise RuntimeError("Batch not executed yet for metric %s" % self.metric.id)
+        return self.__result
+
+    @result.setter
+    def result(self, value):
+        self.__result = value
+        self.done = True
+
+
+class QueryBatch():
+    """Batch of metric queries sent together to Elasticsearch
+
+    Instead of doing one request per metric, the queries of all the
+    metrics added to the batch are sent in _msearch requests when the
+    batch is executed. Then, each response is parsed by the metric which
+    issued the query, and the callbacks registered in the batch (usually
+    writing the CSV and figures files) are called.
+
+    The metrics with the same index, date field, date range, filters and
+    interval are planned in a single query which aggregates all of them
+    in the same date_histogram.
+
+    With a split field, the queries which differ just in the value of the
+    filter on that field (e.g. the same metrics for several projects) are
+    sent as a single query, with a terms aggregation on the field wrapping
+    the aggregations of the query. The values not found in the terms
+    buckets are queried again with their own queries.
+    """
+
+    MAX_QUERIES = 100  # max number of queries in a _msearch request
+    PLAN_KINDS = {'ts': True, 'trend': True, 'agg': False}  # kinds planned, and if they are evolutionary
+    SPLIT_AGG = 'split'  # name of the terms aggregation on the split field
+
+    def __init__(self, es_url, max_queries=None, split_field=None):
+        """
+        :param es_url: Elasticsearch URL with the metrics indexes
+        :param max_queries: max number of queries to send in each _msearch request
+        :param split_field: field of the filter whose values are queried together
+                            in the same query (e.g. project). None to not split
+        """
+        self.es_url = es_url
+        self.max_queries = max_queries if max_queries else self.MAX_QUERIES
+        self.split_field = split_field
+        self.items = []
+        self.callbacks = []
+        self.requests = 0  # number of requests sent to Elasticsearch
+        self.query_times = []  # seconds waiting for each response of the last msearch, None if cached
+
+    def add(self, metric, kind):
+        """
+        Add a metric value to be computed in the batch
+
+        :param metric: Metrics object to be computed
+        :param kind: kind of value to compute: ts, agg, list or trend
+        :return: a BatchItem with the value of the metric once the batch is executed
+        """
+        item = BatchItem(metric, kind)
+        self.items.append(item)
+        return item
+
+    def add_callback(self, callback):
+        """
+        Add a function to be called once the batch is executed
+
+        :param callback: function without params
+        """
+        self.callbacks.append(callback)
+
+    def msearch(self, searches):
+        """
+        Send a list of queries to Elasticsearch in a single _msearch request
+
+        :param searches: list of (index, query) tuples
+        :return: a list with the responses for each query, in the same order
+        """
+        cache = get_cache()
+        responses = [cache.get(index, query) if cache else None for index, query in searches]
+        self.query_times = [None] * len(searches)
+
+        # Just the queries not found in the cache are sent
+        pending = [pos for pos, response in enumerate(responses) if response is None]
+        if not pending:
+            return responses
+
+        body = []
+        for pos in pending:
+            index, query = searches[pos]
+            body.append({"index": index})
+            body.append(query)
+
+        es = get_client(self.es_url)
+        start = time.time()
+        res = es.msearch(body=body)
+        wall_time = time.time() - start
+        self.requests += 1
+
+        # The wall time of the request is shared by the queries according to their took
+        took = [response.get('took', 0) for response in res['responses']]
+        for pos, query_took in zip(pending, took):
+            share = query_took / sum(took) if sum(took) else 1 / len(pending)
+            self.query_times[pos] = wall_time * share
+
+        for pos, response in zip(pending, res['responses']):
+            index, query = searches[pos]
+            if 'error' in response:
+                logger.error("In msearch: Failed to fetch data. Query: %s, Error Info: %s",
+                             query, response['error'])
+                raise RuntimeError("Query to %s failed: %s" % (index, response['error']))
+            if cache:
+                cache.set(index, query, response)
+            responses[pos] = response
+        return responses
+
+    def plan(self, items):
+        """
+        Group the items whose metrics can be computed in the same query
+
+        :param items: list of BatchItem objects
+        :return: a list of (items, metrics, evolutionary) tuples, with the metrics used
+                 to build the query of the items, or None for the items with their own query
+        """
+        groups = OrderedDict()
+        for item in items:
+            key = None
+            if item.kind in self.PLAN_KINDS:
+                evolutionary = self.PLAN_KINDS[item.kind]
+                metric = item.metric.get_trend_metric() if item.kind == 'trend' else item.metric
+                key = metric.get_plan_key(evolutionary)
+            if key is None:
+                groups[id(item)] = ([item], None, False)
+            else:
+                groups.setdefault(key, ([], [], evolutionary))
+                groups[key][0].append(item)
+                groups[key][1].append(metric)
+
+        plan = []
+        for items, metrics, evolutionary in groups.values():
+            if metrics and len(metrics) == 1:
+                # Just one metric, its own query is used
+                metrics = None
+            plan.append((items, metrics, evolutionary))
+        return plan
+
+    def split(self, batched):
+        """
+        Group the queries which differ just in the value of the split field filter
+
+        :param batched: list of (items, metrics, evolutionary, query) tuples, with
+                        the metrics planned in each query
+        :return: a list of (entries, split query) tuples, with the batched tuples computed
+                 with the split query, or None for the tuples with their own query
+        """
+        groups = OrderedDict()
+        for entry in batched:
+            items, metrics, evolutionary, query = entry
+            metrics_split = metrics if metrics else [items[0].metric]
+            key = None
+            if query.get('size') == 0 and all(self.split_field in metric.esfilters for metric in metrics_split):
+                metrics_split = [copy.copy(metric) for metric in metrics_split]
+                for metric in metrics_split:
+                    metric.esfilters = {name: value for name, value in metric.esfilters.items()
+                                        if name != self.split_field}
+                if metrics:
+                    query_split = metrics_split[0].get_plan_query(metrics_split, evolutionary)
+                else:
+                    query_split = metrics_split[0].get_batch_query(items[0].kind)
+                key = (metrics_split[0].es_index, json.dumps(query_split, sort_keys=True, default=str))
+            if key is None:
+                groups[id(entry)] = ([entry], None, None)
+            else:
+                groups.setdefault(key, ([], query_split, metrics_split))
+                groups[key][0].append(entry)
+
+        split = []
+        for entries, query, metrics_split in groups.values():
+            values = []
+            if query:
+                values = list(OrderedDict.fromkeys(self.get_split_value(entry) for entry in entries))
+            if len(values) < 2:
+                # Nothing to share, the own queries are used
+                split += [([entry], None) for entry in entries]
+                continue
+            query = copy_query(query)
+            aggs = query.pop('aggs', query.pop('aggregations', None))
+            terms = {"field": self.split_field, "include": values, "size": len(values), "min_doc_count": 0}
+            query['aggs'] = {self.SPLIT_AGG: {"terms": terms}}
+            if aggs:
+                query['aggs'][self.SPLIT_AGG]['aggs'] = aggs
+            split.append((entries, (query, metrics_split)))
+        return split
+
+    def get_split_value(self, entry):
+        """
+        Get the value of the split field filter in the query of a batched tuple
+
+        :param entry: (items, metrics, evolutionary, query) tuple
+        :return: the value of the filter
+        """
+        items, metrics, evolutionary, query = entry
+        metric = metrics[0] if metrics else items[0].metric
+        return metric.esfilters[self.split_field]
+
+    def split_response(self, entries, res):
+        """
+        Split the response to a split query in the responses to the queries of each batched tuple
+
+        :param entries: list of (items, metrics, evolutionary, query) tuples in the split query
+        :param res: a dict with the response to the split query
+        :return: a list with the response for each tuple, None if its value was not found
+        """
+        buckets = {bucket['key']: bucket for bucket in res['aggregations'][self.SPLIT_AGG]['buckets']}
+        responses = []
+        for entry in entries:
+            bucket = buckets.get(self.get_split_value(entry))
+            if bucket is None:
+                responses.append(None)
+                continue
+            aggregations = {name: value for name, value in bucket.items() if name not in ('key', 'doc_count')}
+            hits = dict(res['hits'], total=bucket['doc_count'])
+            responses.append({"took": res.get('took', 0), "hits": hits, "aggregations": aggregations})
+        return responses
+
+    def send(self, queries):
+        """
+        Send the queries in _msearch requests and parse the responses with the metrics
+
+        :param queries: list of (entries, split query) tuples, as returned by split
+        :return: a list with the (items, metrics, evolutionary, query) tuples not found
+                 in the responses to the split queries
+        """
+        missing = []
+        profiler = get_profiler()
+        for i in range(0, len(queries), self.max_queries):
+            chunk = queries[i:i + self.max_queries]
+            logger.debug("Sending %i queries in a _msearch request", len(chunk))
+            searches = []
+            for entries, split in chunk:
+                items, metrics, evolutionary, query = entries[0]
+                searches.append((items[0].metric.es_index, split[0] if split else query))
+            responses = self.msearch(searches)
+            for pos, ((entries, split), response) in enumerate(zip(chunk, responses)):
+                start = time.time()
+                entry_responses = self.split_response(entries, response) if split else [response]
+                for entry, entry_response in zip(entries, entry_responses):
+                    if entry_response is None:
+                        missing.append(entry)
+                        continue
+                    items, metrics, evolutionary, query = entry
+                    if metrics:
+                        item_responses = metrics[0].split_plan_response(metrics, entry_response, evolutionary)
+                    else:
+                        item_responses = [entry_response]
+                    for item, item_response in zip(items, item_responses):
+                        item.result = item.metric.parse_batch_response(item.kind, item_response)
+                if profiler:
+                    query_time = self.query_times[pos]
+                    items, metrics, evolutionary, query = entries[0]
+                    projects = None
+                    if split:
+                        metrics = split[1]
+                        if self.split_field == 'project':
+                            projects = split[0]['aggs'][self.SPLIT_AGG]['terms']['include']
+                    kind = ",".join(sorted(set(item.kind for entry in entries for item in entry[0])))
+                    profiler.add(metrics or [items[0].metric], kind, searches[pos][0], response,
+                                 query_time or 0, time.time() - start, cached=query_time is None,
+                                 projects=projects)
+        return missing
+
+    def execute(self):
+        """
+        Compute all the pending metric values in the batch and call the callbacks
+        """
+        pending = [item for item in self.items if not item.done]
+        self.items = []
+
+        batched = []
+        for items, metrics, evolutionary in self.plan(pending):
+            if metrics:
+                query = metrics[0].get_plan_query(metrics, evolutionary)
+                batched.append((items, metrics, evolutionary, query))
+                continue
+            item = items[0]
+            query = item.metric.get_batch_query(item.kind)
+            if query is None:
+                # The metric knows how to compute itself
+                item.result = getattr(item.metric, 'get_' + item.kind)()
+            else:
+                batched.append((items, None, evolutionary, query))
+
+        split = self.split_field is not None
+        while batched:
+            # The queries of the values not found in a split query are sent again on their own
+            batched = self.send(self.split(batched) if split else [([entry], None) for entry in batched])
+            split = False
+
+        callbacks = self.callbacks
+        self.callbacks = []
+        for callback in callbacks:
+            callback()
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Shared Elasticsearch clients for all the queries done in a report
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry():
+    """Process wide registry of Elasticsearch clients
+
+    Creating an Elasticsearch client creates a new HTTP connection pool, so
+    creating one per query means paying the TCP (and TLS) setup for every
+    query. The registry keeps one client per Elasticsearch URL, and all the
+    queries done to that URL share its connection pool.
+    """
+
+    DEFAULT_URL = 'http://localhost:9200'
+
+    # Connection parameters used when creating new clients
+    maxsize = 10  # max number of connections kept open to each host
+    timeout = 30  # seconds to wait for a response
+    max_retries = 3  # retries of a failed request before giving up
+    retry_on_timeout = True  # a timeout is also retried
+    keep_alive = True  # ask the server to keep the connections open
+
+    clients = {}
+    opened = 0  # number of clients created
+    reused = 0  # number of times an already created client was returned
+    lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, maxsize=None, timeout=None, max_retries=None,
+                  retry_on_timeout=None, keep_alive=None):
+        """
+        Set the connection parameters for the clients created from now on
+
+        :param maxsize: max number of connections kept open to each host
+        :param timeout: seconds to wait for a response from Elasticsearch
+        :param max_retries: number of retries of a failed request
+        :param retry_on_timeout: if True, requests which timed out are also retried
+        :param keep_alive: if True, ask Elasticsearch to keep the connections open
+        """
+        if maxsize is not None:
+            cls.maxsize = maxsize
+        if timeout is not None:
+            cls.timeout = timeout
+        if max_retries is not None:
+            cls.max_retries = max_retries
+        if retry_on_timeout is not None:
+            cls.retry_on_timeout = retry_on_timeout
+        if keep_alive is not None:
+            cls.keep_alive = keep_alive
+
+    @classmethod
+    def normalize_url(cls, url):
+        """
+        Get the canonical form of an Elasticsearch URL, used as registry key
+
+        :param url: Elasticsearch URL, with or without the scheme
+        :return: the URL with the scheme and without the trailing slash
+        """
+        if not url:
+            url = cls.DEFAULT_URL
+        if not url.startswith("http"):
+            url = 'http://' + url
+        return url.rstrip('/')
+
+    @classmethod
+    def get_params(cls):
+        """
+        Get the params used to create a new Elasticsearch client
+
+        :return: a dict with the keyword params for the Elasticsearch client
+        """
+        params = {
+            "maxsize": cls.maxsize,
+            "timeout": cls.timeout,
+            "max_retries": cls.max_retries,
+            "retry_on_timeout": cls.retry_on_timeout
+        }
+        if cls.keep_alive:
+            params["headers"] = {"Connection": "keep-alive"}
+        return params
+
+    @classmethod
+    def get_client(cls, url=None):
+        """
+        Get the Elasticsearch client for an URL, creating it the first time
+
+        :param url: Elasticsearch URL
+        :return: an Elasticsearch client shared by all the callers using the same URL
+        """
+        url = cls.normalize_url(url)
+        with cls.lock:
+            if url in cls.clients:
+                cls.reused += 1
+                return cls.clients[url]
+            logger.debug("New Elasticsearch client for %s", url)
+            # Imported here, as it is slow to import and not needed with other clients
+            from elasticsearch import Elasticsearch
+            client = Elasticsearch(url, **cls.get_params())
+            cls.clients[url] = client
+            cls.opened += 1
+        return client
+
+    @classmethod
+    def set_client(cls, url, client):
+        """
+        Set the client used for an URL instead of creating an Elasticsearch one,
+        e.g. a stand-in client which doesn't connect to Elasticsearch
+
+        :param url: Elasticsearch URL
+        :param client: object with the methods of the Elasticsearch client used
+        """
+        url = cls.normalize_url(url)
+        with cls.lock:
+            cls.clients[url] = client
+
+    @classmethod
+    def get_stats(cls):
+        """
+        Get the counters of clients opened and reused
+
+        :return: a dict with the number of clients opened and reused
+        """
+        return {"opened": cls.opened, "reused": cls.reused}
+
+    @classmethod
+    def reset(cls):
+        """Forget all the clients and reset the counters"""
+        with cls.lock:
+            cls.clients = {}
+            cls.opened = 0
+            cls.reused = 0
+
+
+def get_client(url=None):
+    """Get the shared Elasticsearch client for url"""
+    return ClientRegistry.get_client(url)
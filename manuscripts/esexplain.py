@@ -0,0 +1,348 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Stand-in Elasticsearch client to know the queries of a report without running them
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import logging
+import re
+import threading
+
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from dateutil import parser
+
+from .cache import QueryCache
+from .esquery import CALENDAR_INTERVALS, INTERVAL_NAMES, get_interval_start
+
+logger = logging.getLogger(__name__)
+
+# Keys of an aggregation which are not its type
+AGG_KEYS = ('aggs', 'aggregations', 'meta')
+
+# Units of the fixed intervals of a date_histogram
+FIXED_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+# Dates of the buckets of the date histograms without dates
+DEFAULT_PERIOD = timedelta(days=365)
+
+
+def get_query_range(query, field):
+    """
+    Get the dates of the range filter on a field in a query
+
+    :param query: dict with the DSL query
+    :param field: date field of the range
+    :return: a tuple with the start and end datetimes, None if not found
+    """
+    start = end = None
+    if isinstance(query, dict):
+        if 'range' in query and field in query['range']:
+            date_range = query['range'][field]
+            start = date_range.get('gte', date_range.get('gt'))
+            end = date_range.get('lte', date_range.get('lt'))
+            start = parser.parse(start) if isinstance(start, str) else None
+            end = parser.parse(end) if isinstance(end, str) else None
+        items = query.values()
+    elif isinstance(query, list):
+        items = query
+    else:
+        items = []
+
+    for item in items:
+        item_start, item_end = get_query_range(item, field)
+        start = start or item_start
+        end = end or item_end
+
+    return start, end
+
+
+def get_histogram_dates(histogram, query, default_range=None):
+    """
+    Get the dates of the buckets a date_histogram would return, without data.
+    Without dates in the query, the buckets would be the ones of the dates of
+    the items, and the ones of default_range are returned.
+
+    :param histogram: dict with the params of the date_histogram
+    :param query: dict with the DSL query including the date_histogram
+    :param default_range: tuple with the start and end datetimes of the items.
+                          Default: the last year
+    :return: a list with the datetimes of the buckets
+    """
+    default_start, default_end = default_range if default_range else (None, None)
+    bounds = histogram.get('extended_bounds')
+    if bounds:
+        start = datetime.fromtimestamp(bounds['min'] / 1000, timezone.utc)
+        end = datetime.fromtimestamp(bounds['max'] / 1000, timezone.utc)
+    else:
+        start, end = get_query_range(query, histogram['field'])
+    if not end:
+        end = default_end if default_end else datetime.now(timezone.utc)
+    if not start:
+        start = default_start if default_start else end - DEFAULT_PERIOD
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+
+    interval = histogram.get('interval', histogram.get('calendar_interval', histogram.get('fixed_interval')))
+    interval = INTERVAL_NAMES.get(interval, interval)
+    offset = histogram.get('offset')
+    offset_delta = timedelta(days=int(offset[:-1])) if offset else timedelta()
+
+    if interval in CALENDAR_INTERVALS:
+        step = CALENDAR_INTERVALS[interval]
+        date = get_interval_start(start - offset_delta, interval) + offset_delta
+    else:
+        fixed = re.match(r'(\d+)([smhd])$', str(interval))
+        if not fixed:
+            raise RuntimeError("Interval not supported ", interval)
+        step = timedelta(**{FIXED_UNITS[fixed.group(2)]: int(fixed.group(1))})
+        date = start
+
+    dates = []
+    while date <= end:
+        dates.append(date)
+        date += step
+    return dates
+
+
+def get_empty_aggs(aggs, query):
+    """
+    Get the response to some aggregations when there are no items
+
+    :param aggs: dict with the aggregations
+    :param query: dict with the DSL query including the aggregations
+    :return: a tuple with the dict of the aggregations response and the
+             estimated number of buckets the aggregations would return with data
+    """
+    res = {}
+    buckets = 0
+    for name, agg in aggs.items():
+        name = str(name)
+        agg_type = [key for key in agg if key not in AGG_KEYS][0]
+        params = agg[agg_type]
+        sub_aggs = agg.get('aggs', agg.get('aggregations', {}))
+        sub_res, sub_buckets = get_empty_aggs(sub_aggs, query)
+
+        if agg_type == 'date_histogram':
+            res[name] = {"buckets": []}
+            for date in get_histogram_dates(params, query):
+                bucket = {"key": int(date.timestamp() * 1000),
+                          "key_as_string": date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                          "doc_count": 0}
+                bucket.update(get_empty_aggs(sub_aggs, query)[0])
+                res[name]['buckets'].append(bucket)
+                buckets += 1 + sub_buckets
+        elif agg_type in ('terms', 'composite'):
+            # No buckets without items, but up to size buckets with them
+            res[name] = {"doc_count_error_upper_bound": 0, "sum_other_doc_count": 0, "buckets": []}
+            buckets += params.get('size', 10) * (1 + sub_buckets)
+        elif agg_type == 'filters':
+            filters = params['filters']
+            if isinstance(filters, dict):
+                res[name] = {"buckets": OrderedDict((key, dict(doc_count=0, **sub_res)) for key in filters)}
+            else:
+                res[name] = {"buckets": [dict(doc_count=0, **sub_res) for _ in filters]}
+            buckets += len(filters) * (1 + sub_buckets)
+        elif agg_type in ('filter', 'missing', 'nested', 'reverse_nested', 'global'):
+            res[name] = dict(doc_count=0, **sub_res)
+            buckets += 1 + sub_buckets
+        elif agg_type == 'percentiles':
+            percents = params.get('percents', [1.0, 5.0, 25.0, 50.0, 75.0, 95.0, 99.0])
+            res[name] = {"values": {str(float(percent)): 0 for percent in percents}}
+        elif agg_type in ('min', 'max'):
+            res[name] = {"value": 0, "value_as_string": "1970-01-01T00:00:00.000Z"}
+        elif agg_type in ('stats', 'extended_stats'):
+            res[name] = {"count": 0, "min": 0, "max": 0, "avg": 0, "sum": 0}
+        elif agg_type == 'top_hits':
+            res[name] = {"hits": {"total": 0, "max_score": None, "hits": []}}
+        else:
+            res[name] = {"value": 0}
+
+    return res, buckets
+
+
+def get_empty_response(query):
+    """
+    Get the response to a query when there are no items
+
+    :param query: dict with the DSL query
+    :return: a tuple with the dict of the response and the estimated number of buckets
+             the query would return with data
+    """
+    res = {"took": 0, "timed_out": False,
+           "hits": {"total": 0, "max_score": None, "hits": []}}
+    aggs = query.get('aggs', query.get('aggregations'))
+    buckets = 0
+    if aggs:
+        res['aggregations'], buckets = get_empty_aggs(aggs, query)
+    return res, buckets
+
+
+class ExplainClient():
+    """Elasticsearch client stand-in recording the queries instead of sending them
+
+    The client answers all the queries as if there were no items in the
+    indexes, but with the buckets of the date histograms, so a report can
+    be generated with it to know the queries it would send to Elasticsearch
+    and their cost, without connecting to it.
+
+    Without items no project is found in the indexes, so the projects can
+    be given to answer the aggregations on the project field with a bucket
+    for each of them, and the queries of the projects are also recorded.
+    """
+
+    def __init__(self, projects=None, field='project'):
+        """
+        :param projects: list of projects in the indexes, None to find no projects
+        :param field: field with the project of the items
+        """
+        self.projects = projects if projects else []
+        self.field = field
+        self.queries = []  # (index, query, estimated buckets) of each query
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def __add(self, index, query):
+        if isinstance(index, (list, tuple)):
+            index = ",".join(index)
+        query = query if query else {}
+        res, buckets = self.get_response(index, query)
+        with self.lock:
+            self.queries.append((index, query, buckets))
+        return res
+
+    def get_response(self, index, query):
+        """
+        Get the response to a query
+
+        :param index: name of the index in which the query is done
+        :param query: dict with the DSL query
+        :return: a tuple with the dict of the response and the estimated number of buckets
+        """
+        res, buckets = get_empty_response(query)
+        if self.projects and 'aggregations' in res:
+            self.add_projects(query.get('aggs', query.get('aggregations')), res['aggregations'], query)
+        return res, buckets
+
+    def add_projects(self, aggs, res, query):
+        """
+        Add a bucket for each project to the response of the terms and composite
+        aggregations on the project field, with items in all their filters
+
+        :param aggs: dict with the aggregations
+        :param res: dict with the response of the aggregations without items
+        :param query: dict with the DSL query including the aggregations
+        """
+        for name, agg in aggs.items():
+            if 'composite' in agg:
+                sources = agg['composite']['sources']
+                key_names = [key for source in sources for key in source]
+                fields = [params.get('terms', {}).get('field') for source in sources for params in source.values()]
+                if fields != [self.field] or 'after' in agg['composite']:
+                    # All the projects are in the first page
+                    continue
+                keys = [{key_names[0]: project} for project in self.projects]
+            elif 'terms' in agg and agg['terms'].get('field') == self.field:
+                include = agg['terms'].get('include')
+                keys = [project for project in self.projects
+                        if not isinstance(include, list) or project in include]
+            else:
+                continue
+
+            sub_aggs = agg.get('aggs', agg.get('aggregations', {}))
+            buckets = []
+            for key in keys:
+                bucket = {"key": key, "doc_count": 1}
+                bucket.update(get_empty_aggs(sub_aggs, query)[0])
+                for sub_res in bucket.values():
+                    if isinstance(sub_res, dict) and isinstance(sub_res.get('buckets'), dict):
+                        # The items of the project are in all the filters
+                        for filter_bucket in sub_res['buckets'].values():
+                            filter_bucket['doc_count'] = 1
+                buckets.append(bucket)
+            res[str(name)]['buckets'] = buckets
+
+    def search(self, index=None, body=None, **params):
+        with self.lock:
+            self.requests += 1
+        res = self.__add(index, body)
+        if 'scroll' in params:
+            res['_scroll_id'] = 'explain'
+        return res
+
+    def msearch(self, body=None, index=None, **params):
+        with self.lock:
+            self.requests += 1
+        if isinstance(body, str):
+            body = [json.loads(line) for line in body.splitlines() if line.strip()]
+        responses = []
+        for header, query in zip(body[::2], body[1::2]):
+            responses.append(self.__add(header.get('index', index), query))
+        return {"responses": responses}
+
+    def scroll(self, **params):
+        return {"_scroll_id": 'explain', "hits": {"total": 0, "max_score": None, "hits": []}}
+
+    def clear_scroll(self, **params):
+        return {}
+
+    def get_summary(self, explain=False):
+        """
+        Get the summary of the queries recorded
+
+        :param explain: if True, include every query in the summary
+        :return: a string with the summary
+        """
+        lines = []
+        keys = [QueryCache.get_key(index, query) for index, query, buckets in self.queries]
+
+        if explain:
+            for pos, (index, query, buckets) in enumerate(self.queries):
+                lines.append("Query %i to %s (%i buckets estimated)" % (pos + 1, index, buckets))
+                lines.append(json.dumps(query, sort_keys=True, default=str))
+            lines.append("")
+
+        unique = len(set(keys))
+        lines.append("Queries: %i in %i requests (%i unique, %i duplicated)"
+                     % (len(self.queries), self.requests, unique, len(self.queries) - unique))
+        lines.append("Estimated buckets: %i" % sum(buckets for index, query, buckets in self.queries))
+
+        lines.append("")
+        lines.append("{:<30} {:>8} {:>8} {:>10}".format("Index", "Queries", "Unique", "Buckets"))
+        indexes = OrderedDict()
+        for key, (index, query, buckets) in zip(keys, self.queries):
+            stats = indexes.setdefault(index, {"queries": 0, "keys": set(), "buckets": 0})
+            stats['queries'] += 1
+            stats['keys'].add(key)
+            stats['buckets'] += buckets
+        for index, stats in sorted(indexes.items()):
+            lines.append("{:<30} {:>8} {:>8} {:>10}".format(index, stats['queries'],
+                                                            len(stats['keys']), stats['buckets']))
+
+        duplicated = [(key, count) for key, count in Counter(keys).most_common() if count > 1]
+        if duplicated:
+            lines.append("")
+            lines.append("Duplicated queries:")
+            for key, count in duplicated:
+                pos = keys.index(key)
+                lines.append("  %i times query %i to %s" % (count, pos + 1, self.queries[pos][0]))
+
+        return "\n".join(lines)
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Discovery of the projects with items in the data sources of a report
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import logging
+
+from collections import OrderedDict
+
+from .esbatch import QueryBatch
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectDiscovery():
+    """Discovery of the projects with items in several data sources
+
+    The projects are fetched with a composite aggregation on the project
+    field, page by page, so all of them are found. Inside each project
+    bucket, a filters aggregation counts the items of each data source,
+    using the filters of its Projects metric.
+
+    There is a query for each index, as several data sources can share
+    the same index (or alias) with different filters, and all of them are
+    sent together in the same _msearch request for each page.
+
+    The items of each data source in the range of dates of the report can
+    also be counted for the projects found, with a terms aggregation on the
+    project and the same filters aggregation in a single _msearch request,
+    so the metrics of the data sources without items in a project are not
+    queried at all.
+    """
+
+    AGG_NAME = 'projects'
+    PAGE_SIZE = 1000  # number of projects fetched in each page
+
+    def __init__(self, es_url, sources, field='project', page_size=None, end=None, date_fields=None):
+        """
+        :param es_url: Elasticsearch URL with the metrics indexes
+        :param sources: list with the Projects metric (a Metrics object) of each data source
+        :param field: field with the project of the items
+        :param page_size: number of projects fetched in each page
+        :param end: end of the range of dates in which the items are counted by get_range_counts
+        :param date_fields: dict with the list of date fields used by the metrics of each
+                            data source (by data source name). An item is in range if any
+                            of them is in range. Default: the date field of the Projects metric
+        """
+        self.es_url = es_url
+        self.sources = sources
+        self.field = field
+        self.page_size = page_size if page_size else self.PAGE_SIZE
+        self.end = end
+        self.date_fields = date_fields if date_fields else {}
+        self.__counts = None
+        self.__range_counts = None
+
+    def get_indexes(self):
+        """
+        Get the data sources in each index
+
+        :return: an OrderedDict with the list of Projects metrics for each index
+        """
+        indexes = OrderedDict()
+        for source in self.sources:
+            indexes.setdefault(source.es_index, []).append(source)
+        return indexes
+
+    def get_query(self, sources, after=None):
+        """
+        Get the query for a page of the projects of some data sources in the same index
+
+        :param sources: list of Projects metrics of the data sources
+        :param after: key of the last project of the previous page, None for the first page
+        :return: the DSL query to be sent to Elasticsearch
+        """
+        filters = OrderedDict((source.ds.name, source.get_list_query().get('query', {"match_all": {}}))
+                              for source in sources)
+        composite = {
+            "sources": [{self.field: {"terms": {"field": self.field}}}],
+            "size": self.page_size
+        }
+        if after:
+            composite['after'] = after
+        return {
+            "size": 0,
+            "query": {"bool": {"should": list(filters.values()), "minimum_should_match": 1}},
+            "aggs": {
+                self.AGG_NAME: {
+                    "composite": composite,
+                    "aggs": {"sources": {"filters": {"filters": filters}}}
+                }
+            }
+        }
+
+    def get_counts(self):
+        """
+        Get the number of items of each data source in each project. The projects
+        are discovered just once, the next calls return the same counts.
+
+        :return: an OrderedDict with a dict with the number of items of each data source
+                 (by data source name) for each project, sorted by project
+        """
+        if self.__counts is not None:
+            return self.__counts
+
+        indexes = self.get_indexes()
+
+        counts = {}
+        batch = QueryBatch(self.es_url)
+        pages = OrderedDict((index, None) for index in indexes)  # after key of each index
+        while pages:
+            searches = [(index, self.get_query(indexes[index], after)) for index, after in pages.items()]
+            responses = batch.msearch(searches)
+            for (index, query), res in zip(searches, responses):
+                agg = res['aggregations'][self.AGG_NAME]
+                for bucket in agg['buckets']:
+                    project_counts = counts.setdefault(bucket['key'][self.field], {})
+                    for name, source_bucket in bucket['sources']['buckets'].items():
+                        project_counts[name] = source_bucket['doc_count']
+                after_key = agg.get('after_key')
+                if len(agg['buckets']) < self.page_size or not after_key:
+                    del pages[index]
+                else:
+                    pages[index] = after_key
+
+        logger.debug("%i projects found in %i requests", len(counts), batch.requests)
+
+        self.__counts = OrderedDict()
+        for project in sorted(counts):
+            self.__counts[project] = OrderedDict((source.ds.name, counts[project].get(source.ds.name, 0))
+                                                 for source in self.sources)
+        return self.__counts
+
+    def get_projects(self):
+        """
+        Get the projects with items in any data source
+
+        :return: a sorted list with the names of the projects
+        """
+        return [project for project, counts in self.get_counts().items() if any(counts.values())]
+
+    def get_range_filter(self, source):
+        """
+        Get the filter of the items of a data source in the range of dates
+
+        :param source: Projects metric of the data source
+        :return: the DSL filter
+        """
+        queries = []
+        for field in self.date_fields.get(source.ds.name, [source.FIELD_DATE]):
+            metric = copy.copy(source)
+            metric.FIELD_DATE = field
+            metric.end = self.end
+            queries.append(metric.get_list_query().get('query', {"match_all": {}}))
+        if len(queries) == 1:
+            return queries[0]
+        return {"bool": {"should": queries, "minimum_should_match": 1}}
+
+    def get_range_query(self, sources, projects):
+        """
+        Get the query counting the items in range of some data sources in the same index
+
+        :param sources: list of Projects metrics of the data sources
+        :param projects: list of projects whose items are counted
+        :return: the DSL query to be sent to Elasticsearch
+        """
+        filters = OrderedDict((source.ds.name, self.get_range_filter(source)) for source in sources)
+        terms = {"field": self.field, "include": projects, "size": len(projects)}
+        return {
+            "size": 0,
+            "query": {"bool": {"should": list(filters.values()), "minimum_should_match": 1}},
+            "aggs": {
+                self.AGG_NAME: {
+                    "terms": terms,
+                    "aggs": {"sources": {"filters": {"filters": filters}}}
+                }
+            }
+        }
+
+    def get_range_counts(self):
+        """
+        Get the number of items in the range of dates of each data source in each
+        project found. They are counted just once, the next calls return the same counts.
+
+        :return: an OrderedDict with a dict with the number of items in range of each
+                 data source (by data source name) for each project, sorted by project
+        """
+        if self.__range_counts is not None:
+            return self.__range_counts
+
+        projects = self.get_projects()
+        searches = []
+        for index, sources in self.get_indexes().items():
+            for i in range(0, len(projects), self.page_size):
+                searches.append((index, self.get_range_query(sources, projects[i:i + self.page_size])))
+
+        counts = {project: {} for project in projects}
+        batch = QueryBatch(self.es_url)
+        for i in range(0, len(searches), batch.max_queries):
+            for res in batch.msearch(searches[i:i + batch.max_queries]):
+                for bucket in res['aggregations'][self.AGG_NAME]['buckets']:
+                    project_counts = counts[bucket['key']]
+                    for name, source_bucket in bucket['sources']['buckets'].items():
+                        project_counts[name] = source_bucket['doc_count']
+
+        logger.debug("Items in range of %i projects counted in %i requests", len(counts), batch.requests)
+
+        self.__range_counts = OrderedDict()
+        for project in projects:
+            self.__range_counts[project] = OrderedDict((source.ds.name, counts[project].get(source.ds.name, 0))
+                                                       for source in self.sources)
+        return self.__range_counts
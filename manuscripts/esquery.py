@@ -23,11 +23,49 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-from datetime import timezone
+import functools
 
-from elasticsearch import Elasticsearch
-from elasticsearch_dsl import A, Search, Q
-# elasticsearch_dsl is referred to as es_dsl in the comments, henceforth
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from dateutil import relativedelta
+
+from .esclient import get_client
+# elasticsearch_dsl is referred to as es_dsl in the comments, henceforth.
+
+
+def lazy_dsl(name):
+    """
+    Get a function calling a class or function of es_dsl. es_dsl is slow to import,
+    so it is imported the first time the queries are built, not with this module.
+
+    :param name: name of the class or function in es_dsl (A, Q, Search)
+    :return: a function with the same params, returning the same object
+    """
+    def call(*args, **kwargs):
+        import elasticsearch_dsl
+        return getattr(elasticsearch_dsl, name)(*args, **kwargs)
+    call.__name__ = name
+    return call
+
+
+A = lazy_dsl('A')
+Q = lazy_dsl('Q')
+Search = lazy_dsl('Search')
+
+
+def copy_query(query):
+    """
+    Copy a DSL query, faster than copy.deepcopy
+
+    :param query: dict with the DSL query, with just dicts, lists and immutable values
+    :return: a copy of the query
+    """
+    if isinstance(query, dict):
+        return {key: copy_query(value) for key, value in query.items()}
+    if isinstance(query, list):
+        return [copy_query(value) for value in query]
+    return query
 
 
 class ElasticQuery():
@@ -37,6 +75,12 @@ class ElasticQuery():
     AGG_SIZE = 100  # Default max number of buckets
     ES_PRECISION = 3000  # This is the default value for percision_threshold
 
+    # Dates and filter values used to build the query templates of get_agg,
+    # replaced then by the ones of each query
+    TEMPLATE_START = datetime(1, 1, 1, 0, 0, 1)
+    TEMPLATE_END = datetime(1, 1, 1, 0, 0, 2)
+    TEMPLATE_FILTER = "\x00filter %i"
+
     @classmethod
     def __get_query_filters(cls, filters={}, inverse=False):
         """
@@ -225,6 +269,37 @@ class ElasticQuery():
         query_agg = A("cardinality", field=field, precision_threshold=cls.ES_PRECISION)
         return (agg_id, query_agg)
 
+    @classmethod
+    def __get_query_agg_value(cls, field, agg_type, agg_id=None):
+        """
+        Create an es_dsl aggregation object for getting the value of a field in each bucket.
+
+        :param field: field from which to get the value
+        :param agg_type: kind of aggregation for the field (cardinality, avg, percentiles)
+        :return: a tuple with the aggregation id and es_dsl aggregation object
+        """
+        if agg_type == "cardinality":
+            return cls.__get_query_agg_cardinality(field, agg_id=agg_id)
+        elif agg_type == "avg":
+            return cls.__get_query_agg_avg(field, agg_id=agg_id)
+        elif agg_type == "percentiles":
+            return cls.__get_query_agg_percentiles(field, agg_id=agg_id)
+        raise RuntimeError("Aggregation of %s in filters not supported" % agg_type)
+
+    @classmethod
+    def __get_query_filter_bool(cls, filters={}):
+        """
+        Create a es_dsl query object matching the items which pass all the filters.
+
+        :param filters: dict with the filters to be applied
+        :return: a es_dsl 'Bool' Query object, or a 'MatchAll' one if there are no filters
+        """
+        must = cls.__get_query_filters(filters)
+        must_not = cls.__get_query_filters(filters, inverse=True)
+        if not must and not must_not:
+            return Q('match_all')
+        return Q('bool', must=must, must_not=must_not)
+
     @classmethod
     def __get_bounds(cls, start=None, end=None):
         """
@@ -295,6 +370,28 @@ class ElasticQuery():
             else:
                 raise RuntimeError("Aggregation of %s in ts not supported" % agg_type)
 
+        query_agg = cls.__get_query_date_histogram(time_field, interval, time_zone,
+                                                   start, end, offset)
+
+        agg_dict = field_agg.to_dict()[field_agg.name]
+        query_agg.bucket(agg_id, field_agg.name, **agg_dict)
+
+        return (cls.AGGREGATION_ID, query_agg)
+
+    @classmethod
+    def __get_query_date_histogram(cls, time_field, interval, time_zone,
+                                   start=None, end=None, offset=None):
+        """
+        Create an es_dsl date_histogram aggregation object without sub aggregations.
+
+        :param time_field: field with the date
+        :param interval: interval to be used to generate the time series values
+        :param time_zone: time zone for the time_field
+        :param start: date from for the time series, should be a datetime.datetime object
+        :param end: date to for the time series, should be a datetime.datetime object
+        :param offset: offset to be added to the time_field in days
+        :return: a date_histogram aggregation object
+        """
         bounds = {}
         if start or end:
             if not offset:
@@ -305,13 +402,8 @@ class ElasticQuery():
             else:
                 bounds = {'offset': offset}
 
-        query_agg = A("date_histogram", field=time_field, interval=interval,
-                      time_zone=time_zone, min_doc_count=0, **bounds)
-
-        agg_dict = field_agg.to_dict()[field_agg.name]
-        query_agg.bucket(agg_id, field_agg.name, **agg_dict)
-
-        return (cls.AGGREGATION_ID, query_agg)
+        return A("date_histogram", field=time_field, interval=interval,
+                 time_zone=time_zone, min_doc_count=0, **bounds)
 
     @classmethod
     def get_count(cls, date_field=None, start=None, end=None, filters={}):
@@ -337,6 +429,12 @@ class ElasticQuery():
                 filters={}, agg_type="terms", offset=None, interval=None):
         """
         Compute the aggregated value for a field.
+
+        The queries of the metrics repeat their structure for all the projects,
+        changing just the dates and the values of the filters. So the query is
+        built from a template for the same fields, aggregation, interval, offset
+        and filter names, replacing the dates and the values of the filters.
+
         :param field: field to get the time series values
         :param date_field: field with the date
         :param interval: interval to be used to generate the time series values, such as:(year(y),
@@ -345,6 +443,71 @@ class ElasticQuery():
         :param end: date to for the time series, should be a datetime.datetime object
         :param agg_type: kind of aggregation for the field (cardinality, avg, percentiles)
         :param offset: offset to be added to the time_field in days
+        :return: a query containing the aggregation, filters and range for the specified term
+        """
+        template, paths = cls.__get_agg_template(field, date_field, bool(start), bool(end),
+                                                 tuple(filters), agg_type, offset, interval)
+
+        values = dict(enumerate(filters.values()))
+        if start:
+            values['start'] = start.isoformat()
+        if end:
+            values['end'] = end.isoformat()
+        values.update(cls.__get_bounds(start, end).get('extended_bounds', {}))
+
+        query = copy_query(template)
+        for path, name in paths:
+            item = query
+            for key in path[:-1]:
+                item = item[key]
+            item[path[-1]] = values[name]
+        return query
+
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def __get_agg_template(cls, field, date_field, start, end, filter_names, agg_type, offset, interval):
+        """
+        Build the template of a get_agg query, with the dates and filter values to be replaced.
+
+        :param start: if True, the query has a start date
+        :param end: if True, the query has an end date
+        :param filter_names: tuple with the names of the filters
+        :return: a tuple with the template query, and a list of (path, name) with
+                 the path in the query of each value to be replaced, and the name of the
+                 value: start, end (dates), min, max (bounds) or the position of the filter
+        """
+        start = cls.TEMPLATE_START if start else None
+        end = cls.TEMPLATE_END if end else None
+        filters = OrderedDict((name, cls.TEMPLATE_FILTER % pos) for pos, name in enumerate(filter_names))
+        template = cls.__build_agg(field, date_field, start, end, filters, agg_type, offset, interval)
+
+        names = {cls.TEMPLATE_FILTER % pos: pos for pos in range(len(filter_names))}
+        if start:
+            names[start.isoformat()] = 'start'
+        if end:
+            names[end.isoformat()] = 'end'
+        for name, value in cls.__get_bounds(start, end).get('extended_bounds', {}).items():
+            names[value] = name
+
+        paths = []
+
+        def find_values(item, path):
+            children = item.items() if isinstance(item, dict) else enumerate(item)
+            for key, value in children:
+                if isinstance(value, (dict, list)):
+                    find_values(value, path + (key,))
+                elif isinstance(value, (str, float)) and value in names:
+                    paths.append((path + (key,), names[value]))
+
+        find_values(template, ())
+        return template, paths
+
+    @classmethod
+    def __build_agg(cls, field=None, date_field=None, start=None, end=None,
+                    filters={}, agg_type="terms", offset=None, interval=None):
+        """
+        Build the query of get_agg with elasticsearch_dsl objects
+
         :return: a query containing the aggregation, filters and range for the specified term
         """
         # This gives us the basic structure of the query, including:
@@ -385,14 +548,215 @@ class ElasticQuery():
 
         return s.to_dict()
 
+    @classmethod
+    def get_agg_filters(cls, aggs, start=None, end=None, filters={},
+                        offset=None, interval=None):
+        """
+        Compute in a single query the aggregated value of fields for several sets of filters.
+
+        Each aggregation in aggs gets a top level 'filter' aggregation with the date range
+        for its date field (with id AGGREGATION_ID, AGGREGATION_ID + 1, ...). Inside it, if
+        interval is set, there is a date_histogram (id AGGREGATION_ID). Then, a 'filters'
+        aggregation (id AGGREGATION_ID + 1) with a bucket for each set of filters, which
+        contains the aggregation of the field (id AGGREGATION_ID + 2).
+
+        :param aggs: list of (field, date_field, agg_type, sets) tuples, sets being a dict
+                     with the filters to be applied (a dict) for each set name
+        :param start: date from for the time series, should be a datetime.datetime object
+        :param end: date to for the time series, should be a datetime.datetime object
+        :param filters: dict with the filters to be applied to all the sets
+        :param offset: offset to be added to the time_field in days
+        :param interval: interval to be used to generate the time series values, such as:(year(y),
+                         quarter(q), month(M), week(w), day(d), hour(h), minute(m), second(s))
+        :return: a query containing the aggregations, filters and ranges for all the sets
+        """
+        s = Search().query(cls.__get_query_filter_bool(filters))
+        s = s.extra(size=0)
+
+        for pos, (field, date_field, agg_type, sets) in enumerate(aggs):
+            if agg_type == "count":
+                agg_type = 'cardinality'
+            elif agg_type == "median":
+                agg_type = 'percentiles'
+            elif agg_type == "average":
+                agg_type = 'avg'
+
+            query_range = cls.__get_query_range(date_field, start, end)
+            if query_range:
+                group_agg = A("filter", Q('range', **query_range))
+            else:
+                group_agg = A("filter", Q('match_all'))
+
+            sets_filters = {name: cls.__get_query_filter_bool(sets[name]) for name in sets}
+            sets_agg = A("filters", filters=sets_filters)
+            value_id, value_agg = cls.__get_query_agg_value(field, agg_type,
+                                                            agg_id=cls.AGGREGATION_ID + 2)
+            sets_agg.bucket(value_id, value_agg)
+
+            if interval:
+                ts_agg = cls.__get_query_date_histogram(date_field, interval, 'UTC',
+                                                        start, end, offset)
+                ts_agg.bucket(cls.AGGREGATION_ID + 1, sets_agg)
+                group_agg.bucket(cls.AGGREGATION_ID, ts_agg)
+            else:
+                group_agg.bucket(cls.AGGREGATION_ID + 1, sets_agg)
+
+            s.aggs.bucket(cls.AGGREGATION_ID + pos, group_agg)
+
+        return s.to_dict()
+
+    @classmethod
+    def get_agg_multi(cls, aggs, date_field=None, start=None, end=None,
+                      filters={}, offset=None, interval=None):
+        """
+        Compute in a single query the aggregated value of several fields for the same
+        date range and filters.
+
+        If interval is set, there is a date_histogram (id AGGREGATION_ID) with the
+        aggregation of each field in aggs inside it (ids AGGREGATION_ID + 1,
+        AGGREGATION_ID + 2, ...). If not, the aggregations of the fields are at the top
+        level (ids AGGREGATION_ID, AGGREGATION_ID + 1, ...).
+
+        :param aggs: list of (field, agg_type) tuples
+        :param date_field: field with the date
+        :param start: date from for the time series, should be a datetime.datetime object
+        :param end: date to for the time series, should be a datetime.datetime object
+        :param filters: dict with the filters to be applied
+        :param offset: offset to be added to the time_field in days
+        :param interval: interval to be used to generate the time series values, such as:(year(y),
+                         quarter(q), month(M), week(w), day(d), hour(h), minute(m), second(s))
+        :return: a query containing the aggregations, filters and range
+        """
+        s = cls.__get_query_basic(date_field=date_field, start=start, end=end, filters=filters)
+        s = s.extra(size=0)
+
+        if interval:
+            ts_agg = cls.__get_query_date_histogram(date_field, interval, 'UTC',
+                                                    start, end, offset)
+            first_id = cls.AGGREGATION_ID + 1
+        else:
+            first_id = cls.AGGREGATION_ID
+
+        for pos, (field, agg_type) in enumerate(aggs):
+            if agg_type == "count":
+                agg_type = 'cardinality'
+            elif agg_type == "median":
+                agg_type = 'percentiles'
+            elif agg_type == "average":
+                agg_type = 'avg'
+
+            value_id, value_agg = cls.__get_query_agg_value(field, agg_type, agg_id=first_id + pos)
+            if interval:
+                ts_agg.bucket(value_id, value_agg)
+            else:
+                s.aggs.bucket(value_id, value_agg)
+
+        if interval:
+            s.aggs.bucket(cls.AGGREGATION_ID, ts_agg)
+
+        return s.to_dict()
+
+
+# First date of each index already queried, by (Elasticsearch URL, index)
+_first_dates = {}
+
+
+def get_first_dates_of_indexes(elastic_url, indexes):
+    """
+    Get the first/min date present in several indexes. The min of all the indexes
+    not queried before is computed in a single _msearch request, and it is
+    reused in the next calls.
+
+    :param elastic_url: Elasticsearch URL with the indexes
+    :param indexes: list of index names
+    :return: a dict with the first date (YYYY-MM-DD) of each index, None if it has no dates
+    """
+    pending = list(OrderedDict.fromkeys(index for index in indexes
+                                        if (elastic_url, index) not in _first_dates))
+    if pending:
+        agg = A("min", field="grimoire_creation_date")
+        body = []
+        for index in pending:
+            search = Search(index=index).extra(size=0)
+            search.aggs.bucket("1", agg)
+            body += [{"index": index}, search.to_dict()]
+
+        es = get_client(elastic_url)
+        res = es.msearch(body=body)
+        for index, response in zip(pending, res['responses']):
+            if 'error' in response:
+                raise RuntimeError("Query to %s failed: %s" % (index, response['error']))
+            start_date = response['aggregations']['1'].get('value_as_string')
+            _first_dates[(elastic_url, index)] = start_date[:10] if start_date else None
+
+    return {index: _first_dates[(elastic_url, index)] for index in indexes}
+
 
 def get_first_date_of_index(elastic_url, index):
     """Get the first/min date present in the index"""
-    es = Elasticsearch(elastic_url)
-    search = Search(using=es, index=index)
-    agg = A("min", field="grimoire_creation_date")
-    search.aggs.bucket("1", agg)
-    search = search.extra(size=0)
-    response = search.execute()
-    start_date = response.to_dict()['aggregations']['1']['value_as_string'][:10]
-    return start_date
+    return get_first_dates_of_indexes(elastic_url, [index])[index]
+
+
+# Length of the calendar intervals of a date_histogram
+CALENDAR_INTERVALS = {
+    "year": relativedelta.relativedelta(years=1),
+    "quarter": relativedelta.relativedelta(months=3),
+    "month": relativedelta.relativedelta(months=1),
+    "week": relativedelta.relativedelta(weeks=1),
+    "day": relativedelta.relativedelta(days=1)
+}
+
+# Other names for the calendar intervals accepted by Elasticsearch
+INTERVAL_NAMES = {
+    "1y": "year", "y": "year",
+    "1q": "quarter", "q": "quarter",
+    "1M": "month", "M": "month",
+    "1w": "week", "w": "week",
+    "1d": "day", "d": "day"
+}
+
+
+def get_interval_start(date, interval):
+    """
+    Get the start of the date_histogram interval which includes a date
+
+    :param date: datetime.datetime object included in the interval
+    :param interval: calendar interval of the date_histogram (year, quarter, month, week, day)
+    :return: the datetime.datetime in which the interval starts
+    """
+    interval = INTERVAL_NAMES.get(interval, interval)
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "year":
+        start = start.replace(month=1, day=1)
+    elif interval == "quarter":
+        start = start.replace(month=(start.month - 1) // 3 * 3 + 1, day=1)
+    elif interval == "month":
+        start = start.replace(day=1)
+    elif interval == "week":
+        # Elasticsearch weeks start on Monday
+        start = start - timedelta(days=start.weekday())
+    elif interval != "day":
+        raise RuntimeError("Interval not supported ", interval)
+    return start
+
+
+def get_periods_start(end, interval, periods=2, offset=None):
+    """
+    Get the start of the last periods of a date_histogram which finishes in end
+
+    :param end: date to for the date_histogram, should be a datetime.datetime object
+    :param interval: calendar interval of the date_histogram (year, quarter, month, week, day)
+    :param periods: number of periods, including the one with the end date
+    :param offset: offset added to the intervals, in days (+31d format)
+    :return: the datetime.datetime in which the first of the periods starts, or None if
+             the interval is not a calendar one (e.g. 30d)
+    """
+    interval = INTERVAL_NAMES.get(interval, interval)
+    if interval not in CALENDAR_INTERVALS:
+        return None
+
+    offset_delta = timedelta(days=int(offset[:-1])) if offset else timedelta()
+    # With offset, the intervals start offset days after the calendar ones
+    start = get_interval_start(end - offset_delta, interval) + offset_delta
+    start -= CALENDAR_INTERVALS[interval] * (periods - 1)
+    return start
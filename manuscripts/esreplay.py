@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Stand-in Elasticsearch clients answering with recorded or synthetic responses
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import json
+import logging
+import os
+import random
+
+from datetime import datetime, timezone
+
+from dateutil import relativedelta
+
+from .cache import QueryCache
+from .esexplain import AGG_KEYS, ExplainClient, get_histogram_dates
+from .profiler import QueryProfiler
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayClient(ExplainClient):
+    """Elasticsearch client stand-in answering with recorded responses
+
+    The responses are stored in a JSON file using as key the hash of the
+    index and the query, the same used by the query cache. In record mode,
+    the queries not recorded yet are sent to a real Elasticsearch client and
+    its responses added to the file when it is saved. The queries of a
+    _msearch request are recorded one by one, and just the first page of
+    a scroll is recorded.
+    """
+
+    def __init__(self, file_path, es=None):
+        """
+        :param file_path: JSON file with the recorded responses
+        :param es: Elasticsearch client used to record the responses not found
+                   in the file. If None, those queries fail
+        """
+        super().__init__()
+        self.file_path = file_path
+        self.es = es
+        self.responses = {}
+        if os.path.exists(file_path):
+            with open(file_path) as f:
+                self.responses = json.load(f)
+
+    def get_response(self, index, query):
+        key = QueryCache.get_key(index, query)
+        with self.lock:
+            recorded = self.responses.get(key)
+        if recorded:
+            res = copy.deepcopy(recorded['response'])
+        elif self.es:
+            res = self.es.search(index=index, body=query)
+            with self.lock:
+                self.responses[key] = {"index": index, "query": query, "response": res}
+            res = copy.deepcopy(res)
+        else:
+            raise RuntimeError("Response not recorded for query to %s: %s" % (index, json.dumps(query)))
+        return res, QueryProfiler.count_buckets(res.get('aggregations'))
+
+    def save(self):
+        """Write the recorded responses to the file"""
+        with self.lock:
+            with open(self.file_path, "w") as f:
+                json.dump(self.responses, f, sort_keys=True)
+
+
+class SyntheticClient(ExplainClient):
+    """Elasticsearch client stand-in answering with synthetic responses
+
+    The responses are generated as if the indexes had items for some
+    projects during some months, with random values which are always the
+    same for the same query. The terms aggregations on a project field get
+    a bucket for each project, and the ones on other fields up to
+    max_terms buckets.
+    """
+
+    def __init__(self, projects=10, months=24, end=None, max_terms=20, max_count=100):
+        """
+        :param projects: number of projects of the items
+        :param months: number of months with items
+        :param end: date of the last item. Default: start of the current month
+        :param max_terms: max number of buckets of the terms aggregations not on projects
+        :param max_count: max number of items per histogram bucket
+        """
+        super().__init__()
+        if not end:
+            end = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        self.end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+        self.start = self.end - relativedelta.relativedelta(months=months)
+        self.projects = ["project-%i" % i for i in range(projects)]
+        self.max_terms = max_terms
+        self.max_count = max_count
+        self.months = months
+
+    def get_response(self, index, query):
+        rnd = random.Random(QueryCache.get_key(index, query))
+        total = rnd.randint(0, self.max_count * self.months)
+        res = {"took": rnd.randint(1, 50), "timed_out": False,
+               "hits": {"total": total, "max_score": None, "hits": []}}
+        buckets = 0
+        aggs = query.get('aggs', query.get('aggregations'))
+        if aggs:
+            res['aggregations'], buckets = self.get_aggs(aggs, query, rnd, total)
+        return res, buckets
+
+    def get_terms(self, field, size, include=None):
+        """
+        Get the terms of a field in the items
+
+        :param field: name of the field
+        :param size: max number of terms
+        :param include: list with the terms to get, if they are in the items
+        :return: a list with the terms
+        """
+        if 'project' in field:
+            terms = self.projects
+        else:
+            terms = ["%s-%i" % (field, i) for i in range(self.max_terms)]
+        if isinstance(include, list):
+            terms = [term for term in terms if term in include]
+        return terms[:size]
+
+    def get_aggs(self, aggs, query, rnd, doc_count):
+        """
+        Get the synthetic response to some aggregations
+
+        :param aggs: dict with the aggregations
+        :param query: dict with the DSL query including the aggregations
+        :param rnd: Random object generating the values
+        :param doc_count: number of items aggregated
+        :return: a tuple with the dict of the aggregations response and its number of buckets
+        """
+        res = {}
+        buckets = 0
+        for name, agg in aggs.items():
+            name = str(name)
+            agg_type = [key for key in agg if key not in AGG_KEYS][0]
+            params = agg[agg_type]
+            sub_aggs = agg.get('aggs', agg.get('aggregations', {}))
+            field = params.get('field', '') if isinstance(params, dict) else ''
+
+            def bucket(count, **fields):
+                sub_res, sub_buckets = self.get_aggs(sub_aggs, query, rnd, count)
+                fields.update(sub_res)
+                fields['doc_count'] = count
+                return fields, 1 + sub_buckets
+
+            items = []
+            if agg_type == 'date_histogram':
+                for date in get_histogram_dates(params, query, (self.start, self.end)):
+                    count = rnd.randint(0, self.max_count) if self.start <= date <= self.end else 0
+                    items.append(bucket(count, key=int(date.timestamp() * 1000),
+                                        key_as_string=date.strftime('%Y-%m-%dT%H:%M:%S.000Z')))
+                res[name] = {"buckets": [item for item, item_buckets in items]}
+            elif agg_type == 'terms':
+                terms = self.get_terms(field, params.get('size', 10), params.get('include'))
+                counts = sorted((rnd.randint(0, doc_count) for _ in terms), reverse=True)
+                items = [bucket(count, key=term) for term, count in zip(terms, counts)]
+                res[name] = {"doc_count_error_upper_bound": 0, "sum_other_doc_count": 0,
+                             "buckets": [item for item, item_buckets in items]}
+            elif agg_type == 'composite':
+                if 'after' not in params:
+                    # All the buckets in the first page
+                    source = list(params['sources'][-1].items())[0]
+                    terms = self.get_terms(list(source[1].values())[0].get('field', ''),
+                                           params.get('size', 10))
+                    items = [bucket(rnd.randint(0, doc_count), key={source[0]: term}) for term in terms]
+                res[name] = {"buckets": [item for item, item_buckets in items]}
+            elif agg_type == 'filters':
+                filters = params['filters']
+                keys = list(filters) if isinstance(filters, dict) else range(len(filters))
+                items = [bucket(rnd.randint(0, doc_count)) for _ in keys]
+                if isinstance(filters, dict):
+                    res[name] = {"buckets": {key: item for key, (item, item_buckets) in zip(keys, items)}}
+                else:
+                    res[name] = {"buckets": [item for item, item_buckets in items]}
+            elif agg_type in ('filter', 'missing', 'nested', 'reverse_nested', 'global'):
+                items = [bucket(rnd.randint(0, doc_count))]
+                res[name] = items[0][0]
+            elif agg_type == 'percentiles':
+                percents = params.get('percents', [1.0, 5.0, 25.0, 50.0, 75.0, 95.0, 99.0])
+                values = sorted(rnd.uniform(0, 30) for _ in percents)
+                res[name] = {"values": {str(float(percent)): value if doc_count else None
+                                        for percent, value in zip(percents, values)}}
+            elif agg_type in ('min', 'max'):
+                if 'date' in field:
+                    date = self.start if agg_type == 'min' else self.end
+                    res[name] = {"value": int(date.timestamp() * 1000),
+                                 "value_as_string": date.strftime('%Y-%m-%dT%H:%M:%S.000Z')}
+                else:
+                    res[name] = {"value": rnd.uniform(0, 30) if doc_count else None}
+            elif agg_type in ('avg', 'stats', 'extended_stats'):
+                value = rnd.uniform(0, 30) if doc_count else None
+                if agg_type == 'avg':
+                    res[name] = {"value": value}
+                else:
+                    res[name] = {"count": doc_count, "min": value, "max": value, "avg": value,
+                                 "sum": value * doc_count if doc_count else 0}
+            elif agg_type == 'top_hits':
+                res[name] = {"hits": {"total": doc_count, "max_score": None, "hits": []}}
+            else:
+                # cardinality, value_count, sum
+                res[name] = {"value": rnd.randint(0, doc_count)}
+
+            buckets += sum(item_buckets for item, item_buckets in items)
+
+        return res, buckets
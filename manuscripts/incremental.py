@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Time series of previous reports, used to compute just the new periods
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import json
+import logging
+import os
+import threading
+
+from datetime import timezone
+
+from dateutil import parser
+
+from .esquery import get_periods_start
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalItem():
+    """A metric time series built from a stored one and the new periods"""
+
+    def __init__(self, store, key, item, stored_ts=None, since=None):
+        """
+        :param store: TimeSeriesStore in which the time series is stored
+        :param key: key of the time series in the store
+        :param item: BatchItem with the time series for the new periods
+        :param stored_ts: time series stored in a previous report
+        :param since: date from which the new periods are computed
+        """
+        self.store = store
+        self.key = key
+        self.item = item
+        self.stored_ts = stored_ts
+        self.since = since
+        self.__result = None
+
+    @property
+    def result(self):
+        """The time series for all the periods, available once the batch is executed"""
+        if self.__result is None:
+            ts = self.item.result
+            if self.stored_ts:
+                ts = self.store.merge(self.stored_ts, ts, self.since)
+            if self.item.metric.end:
+                self.store.set(self.key, ts, self.item.metric.end)
+            self.__result = ts
+        return self.__result
+
+
+class TimeSeriesStore():
+    """Time series of the metrics computed in previous reports
+
+    The periods of a time series before the end of the previous report
+    are closed, so their values don't change. The store keeps the time
+    series of the metrics, and only the periods from the last one of the
+    stored time series (which could be incomplete) are queried again.
+    """
+
+    FILE_NAME = 'timeseries.json'
+
+    def __init__(self, data_dir):
+        """
+        :param data_dir: directory in which the time series file is stored
+        """
+        self.file_path = os.path.join(data_dir, self.FILE_NAME)
+        self.lock = threading.Lock()
+        self.series = {}
+        if os.path.exists(self.file_path):
+            with open(self.file_path) as f:
+                self.series = json.load(f)
+
+    @staticmethod
+    def get_key(metric):
+        """
+        Get the key of the time series of a metric
+
+        :param metric: a Metrics object
+        :return: a string identifying the metric time series for the same start date
+        """
+        metric_cls = type(metric)
+        return json.dumps([metric_cls.__module__ + '.' + metric_cls.__name__, metric.es_index,
+                           metric.esfilters, metric.interval, metric.offset,
+                           metric.start.isoformat() if metric.start else None],
+                          sort_keys=True)
+
+    def add_ts(self, batch, metric):
+        """
+        Add to a batch the query for the time series of a metric. If the time
+        series is in the store, just the new periods are queried.
+
+        :param batch: QueryBatch in which to add the query
+        :param metric: a Metrics object
+        :return: an IncrementalItem with the time series once the batch is executed
+        """
+        key = self.get_key(metric)
+        stored = self.series.get(key)
+
+        since = None
+        if stored and metric.end:
+            stored_end = parser.parse(stored['end'])
+            if stored_end <= metric.end:
+                # The last stored period could be incomplete
+                since = get_periods_start(stored_end, metric.interval, 1, metric.offset)
+
+        if not since or (metric.start and since <= metric.start):
+            return IncrementalItem(self, key, batch.add(metric, 'ts'))
+
+        logger.debug("Time series for %s since %s", metric.id, since)
+        new_metric = copy.copy(metric)
+        new_metric.start = since
+        return IncrementalItem(self, key, batch.add(new_metric, 'ts'), stored['ts'], since)
+
+    @staticmethod
+    def merge(stored_ts, new_ts, since):
+        """
+        Merge the periods of a stored time series before since with a new time series
+
+        :param stored_ts: time series from a previous report
+        :param new_ts: time series from since
+        :param since: date from which new_ts has the values
+        :return: the merged time series
+        """
+        if not since.tzinfo:
+            since = since.replace(tzinfo=timezone.utc)
+        since_ts = since.timestamp()
+
+        ts = {"date": [], "value": [], "unixtime": []}
+        for pos, unixtime in enumerate(stored_ts['unixtime']):
+            if unixtime >= since_ts:
+                break
+            for field in ts:
+                ts[field].append(stored_ts[field][pos])
+        for field in ts:
+            ts[field] += new_ts[field]
+        return ts
+
+    def set(self, key, ts, end):
+        """
+        Store a time series
+
+        :param key: key of the time series
+        :param ts: time series of the metric
+        :param end: end date of the time series
+        """
+        with self.lock:
+            self.series[key] = {"end": end.isoformat(), "ts": ts}
+
+    def save(self):
+        """Write the time series to the store file"""
+        with self.lock:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(self.file_path, "w") as f:
+                json.dump(self.series, f)
@@ -120,25 +120,19 @@ class Closed(GerritMetrics):
                               esfilters=esfilters_abandon, interval=self.interval)
         return (merged, abandoned)
 
-    def get_agg(self):
-        (merged, abandoned) = self.__get_metrics()
-        merged_agg = merged.get_agg()
-        abandoned_agg = abandoned.get_agg()
+    def get_query(self, evolutionary=False):
+        # Merged and abandoned are computed together in the same query
+        return self.get_metrics_query(self.__get_metrics(), evolutionary)
+
+    def parse_agg(self, res):
+        (merged_agg, abandoned_agg) = self.parse_metrics_response(self.__get_metrics(), res)
         agg = merged_agg + abandoned_agg
         return agg
 
-    def get_ts(self):
-        closed = {}
-        (merged, abandoned) = self.__get_metrics()
-        merged_ts = merged.get_ts()
-        abandoned_ts = abandoned.get_ts()
-
-        closed['date'] = merged_ts['date']
-        closed['unixtime'] = merged_ts['unixtime']
-        closed['value'] = []
-        for i in range(0, len(merged_ts['value'])):
-            closed['value'].append(merged_ts['value'][i] + abandoned_ts['value'][i])
-        return closed
+    def parse_ts(self, res):
+        (merged_ts, abandoned_ts) = self.parse_metrics_response(self.__get_metrics(), res,
+                                                                evolutionary=True)
+        return merged_ts.add(abandoned_ts)
 
 
 class BMI(GerritMetrics):
@@ -185,12 +179,14 @@ class BMI(GerritMetrics):
 
         return (merged, abandoned, submitted)
 
-    def get_agg(self):
-        (merged, abandoned, submitted) = self.__get_metrics()
-        merged_agg = merged.get_agg()
-        abandoned_agg = abandoned.get_agg()
+    def get_query(self, evolutionary=False):
+        # Merged, abandoned and submitted are computed together in the same query
+        return self.get_metrics_query(self.__get_metrics(), evolutionary)
+
+    def parse_agg(self, res):
+        (merged_agg, abandoned_agg, submitted_agg) = \
+            self.parse_metrics_response(self.__get_metrics(), res)
         closed_agg = merged_agg + abandoned_agg
-        submitted_agg = submitted.get_agg()
 
         if submitted_agg == 0:
             bmi = 1  # if no submitted reviews, bmi is at 100%
@@ -199,23 +195,11 @@ class BMI(GerritMetrics):
 
         return bmi
 
-    def get_ts(self):
-        bmi = {}
-        (merged, abandoned, submitted) = self.__get_metrics()
-        merged_ts = merged.get_ts()
-        abandoned_ts = abandoned.get_ts()
-        submitted_ts = submitted.get_ts()
-
-        bmi['date'] = merged_ts['date']
-        bmi['unixtime'] = merged_ts['unixtime']
-        bmi['value'] = []
-        for i in range(0, len(submitted_ts['value'])):
-            if submitted_ts['value'][i] == 0:
-                bmi['value'].append(0)
-            else:
-                closed = merged_ts['value'][i] + abandoned_ts['value'][i]
-                bmi['value'].append(closed / submitted_ts['value'][i])
-        return bmi
+    def parse_ts(self, res):
+        (merged_ts, abandoned_ts, submitted_ts) = \
+            self.parse_metrics_response(self.__get_metrics(), res, evolutionary=True)
+        # if no submitted reviews in a period, bmi is 0
+        return merged_ts.add(abandoned_ts).divide(submitted_ts)
 
 
 class Organizations(GerritMetrics):
@@ -249,8 +233,8 @@ class DaysToMergeMedian(GerritMetrics):
     AGG_TYPE = 'median'
     filters = {"status": "MERGED"}
 
-    def get_agg(self):
-        agg = super(type(self), self).get_agg()
+    def parse_agg(self, res):
+        agg = super(type(self), self).parse_agg(res)
         if agg is None:
             agg = 0  # None is because NaN in ES. Let's convert to 0
         return agg
@@ -273,8 +257,8 @@ class PatchsetsMedian(GerritMetrics):
     FIELD_COUNT = 'patchsets'
     AGG_TYPE = 'median'
 
-    def get_agg(self):
-        agg = super(type(self), self).get_agg()
+    def parse_agg(self, res):
+        agg = super(type(self), self).parse_agg(res)
         if agg is None:
             agg = 0  # None is because NaN in ES. Let's convert to 0
         return agg
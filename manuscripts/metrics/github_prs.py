@@ -99,8 +99,8 @@ class DaysToClosePRMedian(GitHubPRsMetrics):
     AGG_TYPE = 'median'
     filters = {"pull_request": "true", "state": "closed"}
 
-    def get_agg(self):
-        agg = super(type(self), self).get_agg()
+    def parse_agg(self, res):
+        agg = super(type(self), self).parse_agg(res)
         if agg is None:
             agg = 0  # None is because NaN in ES. Let's convert to 0
         return agg
@@ -155,10 +155,12 @@ class BMIPR(GitHubPRsMetrics):
 
         return (closed, submitted)
 
-    def get_agg(self):
-        (closed, submitted) = self.__get_metrics()
-        closed_agg = closed.get_agg()
-        submitted_agg = submitted.get_agg()
+    def get_query(self, evolutionary=False):
+        # Closed and submitted are computed together in the same query
+        return self.get_metrics_query(self.__get_metrics(), evolutionary)
+
+    def parse_agg(self, res):
+        (closed_agg, submitted_agg) = self.parse_metrics_response(self.__get_metrics(), res)
 
         if submitted_agg == 0:
             bmi = 1  # if no submitted prs, bmi is at 100%
@@ -167,22 +169,11 @@ class BMIPR(GitHubPRsMetrics):
 
         return bmi
 
-    def get_ts(self):
-        bmi = {}
-        (closed, submitted) = self.__get_metrics()
-        closed_ts = closed.get_ts()
-        submitted_ts = submitted.get_ts()
-
-        bmi['date'] = closed_ts['date']
-        bmi['unixtime'] = closed_ts['unixtime']
-        bmi['value'] = []
-        for i in range(0, len(submitted_ts['value'])):
-            if submitted_ts['value'][i] == 0:
-                bmi['value'].append(0)
-            else:
-                bmi['value'].append(closed_ts['value'][i] / submitted_ts['value'][i])
-
-        return bmi
+    def parse_ts(self, res):
+        (closed_ts, submitted_ts) = self.parse_metrics_response(self.__get_metrics(), res,
+                                                                evolutionary=True)
+        # if no submitted prs in a period, bmi is 0
+        return closed_ts.divide(submitted_ts)
 
 
 class Reviewers(GitHubPRsMetrics):
@@ -114,8 +114,8 @@ class DaysToCloseMedian(ITSMetrics):
     AGG_TYPE = 'median'
     filters = {"state": "closed"}
 
-    def get_agg(self):
-        agg = super(DaysToCloseMedian, self).get_agg()
+    def parse_agg(self, res):
+        agg = super(DaysToCloseMedian, self).parse_agg(res)
         if agg is None:
             agg = 0  # None is because NaN in ES. Let's convert to 0
         return agg
@@ -175,10 +175,12 @@ class BMI(ITSMetrics):
                                    esfilters=esfilters_opened, interval=self.interval)
         return (closed, opened)
 
-    def get_agg(self):
-        (closed, opened) = self.__get_metrics()
-        closed_agg = closed.get_agg()
-        opened_agg = opened.get_agg()
+    def get_query(self, evolutionary=False):
+        # Closed and opened are computed together in the same query
+        return self.get_metrics_query(self.__get_metrics(), evolutionary)
+
+    def parse_agg(self, res):
+        (closed_agg, opened_agg) = self.parse_metrics_response(self.__get_metrics(), res)
 
         if opened_agg == 0:
             bmi = 1  # if no submitted issues/prs, bmi is at 100%
@@ -187,22 +189,11 @@ class BMI(ITSMetrics):
 
         return bmi
 
-    def get_ts(self):
-        bmi = {}
-        (closed, opened) = self.__get_metrics()
-        closed_ts = closed.get_ts()
-        opened_ts = opened.get_ts()
-
-        bmi['date'] = closed_ts['date']
-        bmi['unixtime'] = closed_ts['unixtime']
-        bmi['value'] = []
-        for i in range(0, len(opened_ts['value'])):
-            if opened_ts['value'][i] == 0:
-                bmi['value'].append(0)
-            else:
-                bmi['value'].append(closed_ts['value'][i] / opened_ts['value'][i])
-
-        return bmi
+    def parse_ts(self, res):
+        (closed_ts, opened_ts) = self.parse_metrics_response(self.__get_metrics(), res,
+                                                             evolutionary=True)
+        # if no opened issues/prs in a period, bmi is 0
+        return closed_ts.divide(opened_ts)
 
 
 class Projects(ITSMetrics):
@@ -23,12 +23,17 @@
 #   Daniel Izquierdo-Cortazar <dizquierdo@bitergia.com>
 #   Alvaro del Castillo <acs@bitergia.com>
 
+import copy
+import json
 import logging
+import time
 
-from elasticsearch import Elasticsearch
-from elasticsearch_dsl import Search
+from collections import OrderedDict
 
-from ..esquery import ElasticQuery
+from ..cache import get_cache
+from ..esclient import get_client
+from ..esquery import ElasticQuery, Search, get_periods_start
+from ..profiler import get_profiler
 
 logger = logging.getLogger(__name__)
 
@@ -76,7 +81,8 @@ class Metrics(object):
         self.es_index = es_index
         self.start = start
         self.end = end
-        self.esfilters = esfilters if esfilters else {}
+        # Each metric must have its own filters copy to modify it freely
+        self.esfilters = dict(esfilters) if esfilters else {}
         if self.filters:
             # If there are metric class filters use them also
             self.esfilters.update(self.filters)
@@ -129,20 +135,140 @@ class Metrics(object):
                      self.name, self.id, query)
         return query
 
-    def get_list(self):
+    def get_metrics_query(self, metrics, evolutionary=False):
         """
-        Extract from a DSL aggregated response the values for each bucket
+        Query to get the values of several metrics at once, used in the metrics
+        computed from other metrics
 
-        :return: a list with the values in a DSL aggregated response
+        The metrics with the same date field and aggregation are computed in a
+        filters aggregation, with a bucket with the specific filters of each metric.
+        The filters shared by all the metrics are applied to the whole query.
+
+        :param metrics: list of metrics to compute, with the start and end of this metric
+        :param evolutionary: if True the metric values time series is returned. If False the aggregated metric value.
+        :return: the DSL query to be sent to Elasticsearch
         """
-        field = self.FIELD_NAME
-        query = ElasticQuery.get_agg(field=field,
+
+        if not evolutionary:
+            interval = None
+            offset = None
+        else:
+            interval = self.interval
+            offset = self.offset
+            if not interval:
+                raise RuntimeError("Evolutionary query without an interval.")
+
+        common_filters = self.__get_common_filters(metrics)
+        aggs = []
+        for (field, date_field, agg_type), group in self.__get_metrics_groups(metrics).items():
+            sets = OrderedDict()
+            for metric in group:
+                sets[metric.id] = {name: value for name, value in metric.esfilters.items()
+                                   if name not in common_filters}
+            aggs.append((field, date_field, agg_type, sets))
+
+        query = ElasticQuery.get_agg_filters(aggs, start=self.start, end=self.end,
+                                             filters=common_filters,
+                                             interval=interval, offset=offset)
+
+        logger.debug("Metric: '%s' (%s); Query: %s",
+                     self.name, self.id, query)
+        return query
+
+    def parse_metrics_response(self, metrics, res, evolutionary=False):
+        """
+        Get the values of several metrics from the response to the query from get_metrics_query
+
+        :param metrics: list of metrics used to build the query
+        :param res: a dict with the response to the query
+        :param evolutionary: if True the metric values time series are returned. If False the aggregated metric values.
+        :return: a list with the time series (or aggregated values) of the metrics, in the same order
+        """
+        agg_id = ElasticQuery.AGGREGATION_ID
+        values = {}
+        for pos, group in enumerate(self.__get_metrics_groups(metrics).values()):
+            group_res = res['aggregations'][str(agg_id + pos)]
+            for metric in group:
+                # Build the response to the metric's own query so it parses it
+                if evolutionary:
+                    buckets = []
+                    for bucket in group_res[str(agg_id)]['buckets']:
+                        set_bucket = bucket[str(agg_id + 1)]['buckets'][metric.id]
+                        buckets.append({"key": bucket['key'],
+                                        "key_as_string": bucket['key_as_string'],
+                                        "doc_count": set_bucket['doc_count'],
+                                        str(agg_id + 1): set_bucket[str(agg_id + 2)]})
+                    metric_res = {"aggregations": {str(agg_id): {"buckets": buckets}}}
+                    values[metric] = metric.parse_ts(metric_res)
+                else:
+                    set_bucket = group_res[str(agg_id + 1)]['buckets'][metric.id]
+                    metric_res = {"hits": {"total": set_bucket['doc_count']},
+                                  "aggregations": {str(agg_id): set_bucket[str(agg_id + 2)]}}
+                    values[metric] = metric.parse_agg(metric_res)
+
+        return [values[metric] for metric in metrics]
+
+    @staticmethod
+    def __get_metrics_groups(metrics):
+        """
+        Group the metrics which can be computed in the same filters aggregation
+
+        :param metrics: list of metrics
+        :return: an ordered dict with the metrics for each (field, date_field, agg_type)
+        """
+        groups = OrderedDict()
+        for metric in metrics:
+            key = (metric.FIELD_COUNT, metric.FIELD_DATE, metric.AGG_TYPE)
+            groups.setdefault(key, []).append(metric)
+        return groups
+
+    @staticmethod
+    def __get_common_filters(metrics):
+        """
+        Get the filters shared by all the metrics
+
+        :param metrics: list of metrics
+        :return: a dict with the filters with the same value in all the metrics
+        """
+        common_filters = dict(metrics[0].esfilters)
+        for metric in metrics[1:]:
+            for name in list(common_filters):
+                if metric.esfilters.get(name) != common_filters[name]:
+                    del common_filters[name]
+        return common_filters
+
+    def get_list_query(self):
+        """
+        Basic query to get the list of values of the metric field
+
+        :return: the DSL query to be sent to Elasticsearch
+        """
+        query = ElasticQuery.get_agg(field=self.FIELD_NAME,
                                      date_field=self.FIELD_DATE,
                                      start=self.start, end=self.end,
                                      filters=self.esfilters)
         logger.debug("Metric: '%s' (%s); Query: %s",
                      self.name, self.id, query)
+        return query
+
+    def get_list(self):
+        """
+        Extract from a DSL aggregated response the values for each bucket
+
+        :return: a list with the values in a DSL aggregated response
+        """
+        query = self.get_list_query()
         res = self.get_metrics_data(query)
+        return self.parse_list(res)
+
+    def parse_list(self, res):
+        """
+        Build the list of values for the metric from an Elasticsearch response
+
+        :param res: a dict with the response to the query from get_list_query
+        :return: a dict with the values of the metric field and their counts
+        """
+        field = self.FIELD_NAME
         list_ = {field: [], "value": []}
         for bucket in res['aggregations'][str(ElasticQuery.AGGREGATION_ID)]['buckets']:
             list_[field].append(bucket['key'])
@@ -156,21 +282,32 @@ class Metrics(object):
         :param query: query to be sent to Elasticsearch
         :return: a dict with the results of executing the query
         """
-        if self.es_url.startswith("http"):
-            url = self.es_url
-        else:
-            url = 'http://' + self.es_url
-        es = Elasticsearch(url)
+        cache = get_cache()
+        profiler = get_profiler()
+        if cache:
+            res = cache.get(self.es_index, query)
+            if res is not None:
+                if profiler:
+                    profiler.add([self], None, self.es_index, res, 0, cached=True)
+                return res
+
+        es = get_client(self.es_url)
         s = Search(using=es, index=self.es_index)
         s = s.update_from_dict(query)
+        start = time.time()
         try:
-            response = s.execute()
-            return response.to_dict()
+            res = s.execute().to_dict()
         except Exception as e:
             print()
             print("In get_metrics_data: Failed to fetch data.\n Query: {}, \n Error Info: {}"
                   .format(query, e.info))
             raise
+        if profiler:
+            profiler.add([self], None, self.es_index, res, time.time() - start)
+
+        if cache:
+            cache.set(self.es_index, query, res)
+        return res
 
     def get_ts(self):
         """
@@ -185,29 +322,22 @@ class Metrics(object):
 
         query = self.get_query(True)
         res = self.get_metrics_data(query)
-        # Time to convert it to our grimoire timeseries format
-        ts = {"date": [], "value": [], "unixtime": []}
+        return self.parse_ts(res)
+
+    def parse_ts(self, res):
+        """
+        Build the time series for the metric from an Elasticsearch response
+
+        :param res: a dict with the response to the evolutionary query from get_query
+        :return: a TimeSeries with the dates, unixtimes and values of the time series
+        """
         agg_id = ElasticQuery.AGGREGATION_ID
         if 'buckets' not in res['aggregations'][str(agg_id)]:
             raise RuntimeError("Aggregation results have no buckets in time series results.")
-        for bucket in res['aggregations'][str(agg_id)]['buckets']:
-            ts['date'].append(bucket['key_as_string'])
-            if str(agg_id + 1) in bucket:
-                # We have a subaggregation with the value
-                # If it is percentiles we get the median
-                if 'values' in bucket[str(agg_id + 1)]:
-                    val = bucket[str(agg_id + 1)]['values']['50.0']
-                    if val == 'NaN':
-                        # ES returns NaN. Convert to None for matplotlib graph
-                        val = None
-                    ts['value'].append(val)
-                else:
-                    ts['value'].append(bucket[str(agg_id + 1)]['value'])
-            else:
-                ts['value'].append(bucket['doc_count'])
-            # unixtime comes in ms from ElasticSearch
-            ts['unixtime'].append(bucket['key'] / 1000)
-        return ts
+        # Imported here, as numpy is slow to import and not needed to start the command line
+        from ..timeseries import TimeSeries
+        # The value is in the subaggregation if any, the median if it is percentiles
+        return TimeSeries.from_buckets(res['aggregations'][str(agg_id)]['buckets'], str(agg_id + 1))
 
     def get_agg(self):
         """
@@ -215,9 +345,17 @@ class Metrics(object):
 
         :return: the value of the metric
         """
-        """ Returns an aggregated value """
         query = self.get_query(False)
         res = self.get_metrics_data(query)
+        return self.parse_agg(res)
+
+    def parse_agg(self, res):
+        """
+        Get the aggregated value for the metric from an Elasticsearch response
+
+        :param res: a dict with the response to the non evolutionary query from get_query
+        :return: the value of the metric
+        """
         # We need to extract the data from the JSON res
         # If we have agg data use it
         agg_id = str(ElasticQuery.AGGREGATION_ID)
@@ -243,10 +381,48 @@ class Metrics(object):
         :return: a tuple with the metric value for the last interval and the
                  trend percentage between the last two intervals
         """
-        """  """
+        query = self.get_trend_query()
+        res = self.get_metrics_data(query)
+        return self.calc_trend(self.parse_ts(res))
 
-        # TODO: We just need the last two periods, not the full ts
-        ts = self.get_ts()
+    def get_trend_query(self):
+        """
+        Query to get the time series of the metric just for the last two intervals,
+        which are the only ones needed for the trend
+
+        :return: the DSL query to be sent to Elasticsearch
+        """
+        return self.get_trend_metric().get_query(True)
+
+    def get_trend_metric(self):
+        """
+        Get the metric whose time series is used to compute the trend: a copy of
+        this metric starting in the last two intervals, or this metric if its
+        time series is shorter
+
+        :return: a Metrics object
+        """
+        start = None
+        if self.end:
+            start = get_periods_start(self.end, self.interval, 2, self.offset)
+
+        if not start or (self.start and start <= self.start):
+            # The full time series is needed
+            return self
+
+        metric = copy.copy(self)
+        metric.start = start
+        return metric
+
+    @staticmethod
+    def calc_trend(ts):
+        """
+        Compute the trend between the last two values of a time series
+
+        :param ts: a dict with the time series, as returned by get_ts
+        :return: a tuple with the metric value for the last interval and the
+                 trend percentage between the last two intervals
+        """
         last = ts['value'][len(ts['value']) - 1]
         prev = ts['value'][len(ts['value']) - 2]
 
@@ -261,3 +437,114 @@ class Metrics(object):
             trend_percentage = int((trend / last) * 100)
 
         return (last, trend_percentage)
+
+    def get_batch_query(self, kind):
+        """
+        Get the query needed to compute the metric as a part of a batch of queries
+
+        :param kind: kind of value to compute: ts, agg, list or trend
+        :return: the DSL query to be sent to Elasticsearch, or None if the
+                 metric can not be computed with just one query
+        """
+        if kind == 'ts':
+            return self.get_query(True)
+        elif kind == 'trend':
+            return self.get_trend_query()
+        elif kind == 'agg':
+            return self.get_query(False)
+        elif kind == 'list':
+            return self.get_list_query()
+        raise RuntimeError("Batch query of kind %s not supported" % kind)
+
+    def get_plan_key(self, evolutionary=False):
+        """
+        Get the key of the metrics which can be computed in the same query with
+        get_plan_query: the ones using the same index, date field, date range,
+        filters and interval
+
+        :param evolutionary: if True the key for the time series query. If False for the aggregated value query.
+        :return: a tuple with the key, or None if the metric has its own query
+        """
+        # The metrics with their own queries (e.g. the ones computed from other
+        # metrics) and the ones counting items can't be planned
+        if type(self).get_query is not Metrics.get_query or not self.FIELD_COUNT:
+            return None
+        if self.AGG_TYPE not in ('count', 'average', 'median'):
+            return None
+
+        filters = json.dumps(self.esfilters, sort_keys=True, default=str)
+        interval = self.interval if evolutionary else None
+        offset = self.offset if evolutionary else None
+        return (self.es_url, self.es_index, self.FIELD_DATE, self.start, self.end,
+                filters, interval, offset, evolutionary)
+
+    @staticmethod
+    def get_plan_query(metrics, evolutionary=False):
+        """
+        Query to get the values of several metrics with the same plan key at once.
+        All the metrics are aggregated in the same date_histogram, or at the top
+        level for the aggregated values.
+
+        :param metrics: list of metrics with the same get_plan_key
+        :param evolutionary: if True the metric values time series is returned. If False the aggregated metric value.
+        :return: the DSL query to be sent to Elasticsearch
+        """
+        metric = metrics[0]
+        aggs = list(OrderedDict.fromkeys((m.FIELD_COUNT, m.AGG_TYPE) for m in metrics))
+
+        query = ElasticQuery.get_agg_multi(aggs, date_field=metric.FIELD_DATE,
+                                           start=metric.start, end=metric.end,
+                                           filters=metric.esfilters,
+                                           interval=metric.interval if evolutionary else None,
+                                           offset=metric.offset if evolutionary else None)
+
+        logger.debug("Metrics: %s; Query: %s", [m.id for m in metrics], query)
+        return query
+
+    @staticmethod
+    def split_plan_response(metrics, res, evolutionary=False):
+        """
+        Split the response to the query from get_plan_query in the responses to
+        the queries of each metric
+
+        :param metrics: list of metrics used to build the query
+        :param res: a dict with the response to the query
+        :param evolutionary: if True the metric values time series are returned. If False the aggregated metric values.
+        :return: a list with the response to the get_query of each metric, in the same order
+        """
+        agg_id = ElasticQuery.AGGREGATION_ID
+        aggs = list(OrderedDict.fromkeys((m.FIELD_COUNT, m.AGG_TYPE) for m in metrics))
+
+        responses = []
+        for metric in metrics:
+            pos = aggs.index((metric.FIELD_COUNT, metric.AGG_TYPE))
+            if evolutionary:
+                buckets = []
+                for bucket in res['aggregations'][str(agg_id)]['buckets']:
+                    buckets.append({"key": bucket['key'],
+                                    "key_as_string": bucket['key_as_string'],
+                                    "doc_count": bucket['doc_count'],
+                                    str(agg_id + 1): bucket[str(agg_id + 1 + pos)]})
+                aggregations = {str(agg_id): {"buckets": buckets}}
+            else:
+                aggregations = {str(agg_id): res['aggregations'][str(agg_id + pos)]}
+            responses.append({"hits": res['hits'], "aggregations": aggregations})
+        return responses
+
+    def parse_batch_response(self, kind, res):
+        """
+        Get the metric value from the response to the query from get_batch_query
+
+        :param kind: kind of value to compute: ts, agg, list or trend
+        :param res: a dict with the response to the query
+        :return: the value of the metric, as returned by get_ts, get_agg, get_list or get_trend
+        """
+        if kind == 'ts':
+            return self.parse_ts(res)
+        elif kind == 'agg':
+            return self.parse_agg(res)
+        elif kind == 'list':
+            return self.parse_list(res)
+        elif kind == 'trend':
+            return self.calc_trend(self.parse_ts(res))
+        raise RuntimeError("Batch query of kind %s not supported" % kind)
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Backends drawing the charts of the reports with matplotlib
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import os
+
+import numpy as np
+
+from .charts import ChartBackend, convert_none_to_zero
+
+
+def import_charts():
+    """
+    Import the modules drawing the charts with pyplot. They are slow to import,
+    so they are imported the first time a chart is drawn with the pyplot backend.
+
+    :return: a tuple with the pyplot and prettyplotlib modules
+    """
+    import matplotlib as mpl
+    # This avoids the use of the $DISPLAY value for the charts
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    import prettyplotlib as ppl
+    return plt, ppl
+
+
+class PyplotBackend(ChartBackend):
+    """Charts drawn with prettyplotlib using the pyplot state machine"""
+
+    name = 'pyplot'
+
+    @classmethod
+    def bar3_chart(cls, title, labels, data1, file_name, data2, data3, legend=["", ""]):
+        data1 = convert_none_to_zero(data1)
+        data2 = convert_none_to_zero(data2)
+        data3 = convert_none_to_zero(data3)
+
+        plt, ppl = import_charts()
+        fig, ax = plt.subplots(1)
+        xpos = np.arange(len(data1))
+        width = 0.28
+
+        plt.title(title)
+
+        ppl.bar(xpos + width + width, data3, color="orange", width=0.28, annotate=True)
+        ppl.bar(xpos + width, data1, color='grey', width=0.28, annotate=True)
+        ppl.bar(xpos, data2, grid='y', width=0.28, annotate=True)
+        plt.xticks(xpos + width, labels)
+        plt.legend(legend, loc=2)
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        plt.savefig(file_name)
+        plt.close()
+
+    @classmethod
+    def bar_chart(cls, title, labels, data1, file_name, data2=None, legend=["", ""]):
+        data1 = convert_none_to_zero(data1)
+        data2 = convert_none_to_zero(data2)
+
+        plt, ppl = import_charts()
+        fig, ax = plt.subplots(1)
+        xpos = np.arange(len(data1))
+        width = 0.35
+
+        plt.title(title)
+
+        if data2 is not None:
+            ppl.bar(xpos + width, data1, color="orange", width=0.35, annotate=True)
+            ppl.bar(xpos, data2, grid='y', width=0.35, annotate=True)
+            plt.xticks(xpos + width, labels)
+            plt.legend(legend, loc=2)
+
+        else:
+            ppl.bar(xpos, data1, grid='y', annotate=True)
+            plt.xticks(xpos + width, labels)
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        plt.savefig(file_name)
+        plt.close()
+
+
+class FigureBackend(ChartBackend):
+    """Charts drawn in a matplotlib Figure with the style of prettyplotlib, without pyplot
+
+    prettyplotlib draws with pyplot, which keeps global state, so the bars
+    are drawn and styled here in the same way it does.
+    """
+
+    name = 'figure'
+
+    DEFAULT_COLOR = (0.4, 0.7607843137254902, 0.6470588235294118)  # first color of prettyplotlib
+    TEXT_COLOR = '#262626'
+
+    @staticmethod
+    def new_figure():
+        """
+        Create a Figure drawn with the Agg canvas, so the $DISPLAY value is not used
+
+        :return: a tuple with the figure and its axes
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot(1, 1, 1)
+
+    @classmethod
+    def bar(cls, ax, left, height, color=None, width=0.8, grid=None):
+        """
+        Draw bars annotated with their values, as prettyplotlib.bar does
+
+        :param ax: axes in which to draw the bars
+        :param left: x positions of the bars
+        :param height: values of the bars
+        :param color: color of the bars, the first one of prettyplotlib if None
+        :param width: width of the bars
+        :param grid: axis ('x' or 'y') in which to draw a white grid over the bars
+        """
+        height = np.array(height)
+        ax.bar(left, height, color=color or cls.DEFAULT_COLOR, edgecolor='white', width=width)
+
+        # Whitespace padding on the left
+        xmin, xmax = ax.get_xlim()
+        xmin -= 0.2
+        ax.set_xlim(xmin, xmax)
+
+        # With negative values the bottom axis is replaced by a line at y=0
+        hidden_spines = ['top', 'right']
+        if any(value < 0 for value in height.tolist()):
+            hidden_spines.append('bottom')
+            ax.hlines(y=0, xmin=xmin, xmax=xmax, linewidths=0.75)
+        for name, spine in ax.spines.items():
+            if name in hidden_spines:
+                spine.set_visible(False)
+            else:
+                spine.set_linewidth(0.5)
+        ax.xaxis.set_ticks_position('none')
+        ax.yaxis.set_ticks_position('none')
+        if grid:
+            ax.grid(axis=grid, color='white', linestyle='-', linewidth=0.5)
+
+        # Room for the annotation of the highest and lowest bars
+        ymin, ymax = ax.get_ylim()
+        yrange = ymax - ymin
+        if ymax > 0:
+            ymax += yrange * 0.1
+        if ymin < 0:
+            ymin -= yrange * 0.1
+        ax.set_ylim(ymin, ymax)
+
+        offset = (ymax - ymin) * 0.025
+        for x, value in zip(np.array(left) + width / 2, height):
+            annotation = '%.3f' % value if isinstance(value, np.floating) else str(value)
+            ax.annotate(annotation, (x, value + offset if value >= 0 else value - offset),
+                        verticalalignment='bottom' if value >= 0 else 'top',
+                        horizontalalignment='center', color=cls.TEXT_COLOR)
+
+    @classmethod
+    def bar3_chart(cls, title, labels, data1, file_name, data2, data3, legend=["", ""]):
+        data1 = convert_none_to_zero(data1)
+        data2 = convert_none_to_zero(data2)
+        data3 = convert_none_to_zero(data3)
+
+        fig, ax = cls.new_figure()
+        xpos = np.arange(len(data1))
+        width = 0.28
+
+        ax.set_title(title)
+
+        cls.bar(ax, xpos + width + width, data3, color="orange", width=width)
+        cls.bar(ax, xpos + width, data1, color='grey', width=width)
+        cls.bar(ax, xpos, data2, grid='y', width=width)
+        ax.set_xticks(xpos + width)
+        ax.set_xticklabels(labels)
+        ax.legend(legend, loc=2)
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        fig.savefig(file_name)
+
+    @classmethod
+    def bar_chart(cls, title, labels, data1, file_name, data2=None, legend=["", ""]):
+        data1 = convert_none_to_zero(data1)
+        data2 = convert_none_to_zero(data2)
+
+        fig, ax = cls.new_figure()
+        xpos = np.arange(len(data1))
+        width = 0.35
+
+        ax.set_title(title)
+
+        if data2 is not None:
+            cls.bar(ax, xpos + width, data1, color="orange", width=width)
+            cls.bar(ax, xpos, data2, grid='y', width=width)
+            ax.legend(legend, loc=2)
+        else:
+            cls.bar(ax, xpos, data1, grid='y')
+        ax.set_xticks(xpos + width)
+        ax.set_xticklabels(labels)
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        fig.savefig(file_name)
@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Profile of the queries sent to Elasticsearch to compute the metrics
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import csv
+import json
+import logging
+import os
+import threading
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfiler():
+    """Profile of the metric queries sent to Elasticsearch
+
+    For each query the profiler records the metrics computed with it, the
+    project of the metrics, the wall time waiting for the response, the
+    time Elasticsearch spent on it (took), the size of the JSON response,
+    the number of buckets in the response and the time spent parsing it.
+
+    The queries sent together in a _msearch request share the wall time
+    of the request, in proportion to their took.
+    """
+
+    FIELDS = ['metric', 'project', 'kind', 'index', 'wall_time', 'took',
+              'bytes', 'buckets', 'parse_time', 'cached']
+    JSON_FILE = 'profile.json'
+    CSV_FILE = 'profile.csv'
+    TOP = 20  # number of metrics in the summary
+
+    def __init__(self):
+        self.queries = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def count_buckets(res):
+        """
+        Count the buckets in all the aggregations of a response
+
+        :param res: dict with the response (or part of it) from Elasticsearch
+        :return: the number of buckets
+        """
+        count = 0
+        if isinstance(res, dict):
+            buckets = res.get('buckets')
+            if isinstance(buckets, dict):
+                buckets = list(buckets.values())
+            if isinstance(buckets, list):
+                count += len(buckets)
+            for value in res.values():
+                count += QueryProfiler.count_buckets(value)
+        elif isinstance(res, list):
+            for value in res:
+                count += QueryProfiler.count_buckets(value)
+        return count
+
+    @staticmethod
+    def get_metric_name(metric):
+        """
+        Get the name of the class of a metric, with its data source module
+
+        :param metric: a Metrics object
+        :return: a string like git.Commits
+        """
+        metric_cls = type(metric)
+        return metric_cls.__module__.split('.')[-1] + '.' + metric_cls.__name__
+
+    def add(self, metrics, kind, index, res, wall_time, parse_time=None, cached=False, projects=None):
+        """
+        Add the profile of a query
+
+        :param metrics: list with the Metrics objects computed with the query
+        :param kind: kind of value computed: ts, agg, list or trend. None if not known
+        :param index: name of the index in which the query is done
+        :param res: dict with the response from Elasticsearch
+        :param wall_time: seconds waiting for the response
+        :param parse_time: seconds parsing the response. None if not known
+        :param cached: True if the response was read from the query cache
+        :param projects: list of the projects of a query split by project, whose metrics
+                         have no project filter. None to use the project of the metrics
+        """
+        query = {
+            "metric": "+".join(OrderedDict.fromkeys(self.get_metric_name(metric) for metric in metrics)),
+            "project": "+".join(projects) if projects else metrics[0].esfilters.get('project'),
+            "kind": kind,
+            "index": index,
+            "wall_time": wall_time,
+            "took": res.get('took', 0) / 1000,
+            "bytes": len(json.dumps(res)),
+            "buckets": self.count_buckets(res.get('aggregations')),
+            "parse_time": parse_time,
+            "cached": cached
+        }
+        with self.lock:
+            self.queries.append(query)
+
+    def get_metrics_profile(self):
+        """
+        Get the profile of the queries added for each metric and project
+
+        :return: a list of dicts with the number of queries and the sum of their
+                 times, bytes and buckets for each metric and project, the slowest first
+        """
+        metrics = OrderedDict()
+        with self.lock:
+            queries = list(self.queries)
+        for query in queries:
+            key = (query['metric'], query['project'])
+            profile = metrics.setdefault(key, {"metric": query['metric'], "project": query['project'],
+                                               "queries": 0, "wall_time": 0, "took": 0, "bytes": 0,
+                                               "buckets": 0, "parse_time": 0})
+            profile['queries'] += 1
+            for field in ['wall_time', 'took', 'bytes', 'buckets', 'parse_time']:
+                profile[field] += query[field] or 0
+        return sorted(metrics.values(), key=lambda profile: profile['wall_time'], reverse=True)
+
+    def write(self, data_dir):
+        """
+        Write the profile of the queries to JSON and CSV files
+
+        :param data_dir: directory in which to write the files
+        """
+        os.makedirs(data_dir, exist_ok=True)
+        with self.lock:
+            queries = list(self.queries)
+
+        with open(os.path.join(data_dir, self.JSON_FILE), "w") as f:
+            json.dump({"queries": queries, "metrics": self.get_metrics_profile()}, f, indent=2)
+
+        with open(os.path.join(data_dir, self.CSV_FILE), "w") as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            writer.writerows(queries)
+
+    def get_summary(self, top=None):
+        """
+        Get the summary of the queries added, with the slowest metrics
+
+        :param top: number of metrics included. Default: TOP
+        :return: a string with the summary
+        """
+        top = top if top else self.TOP
+        with self.lock:
+            queries = list(self.queries)
+
+        lines = ["Queries: %i (%i cached), %.2fs waiting, %.2fs in Elasticsearch, %.2fs parsing, "
+                 "%i bytes, %i buckets"
+                 % (len(queries), len([query for query in queries if query['cached']]),
+                    sum(query['wall_time'] for query in queries),
+                    sum(query['took'] for query in queries),
+                    sum(query['parse_time'] or 0 for query in queries),
+                    sum(query['bytes'] for query in queries),
+                    sum(query['buckets'] for query in queries))]
+
+        lines.append("Top %i slowest metrics:" % top)
+        lines.append("{:<40} {:<20} {:>7} {:>9} {:>9} {:>9} {:>10} {:>8}".format(
+                     "Metric", "Project", "Queries", "Wall", "Took", "Parse", "Bytes", "Buckets"))
+        for profile in self.get_metrics_profile()[:top]:
+            lines.append("{:<40} {:<20} {:>7} {:>9.3f} {:>9.3f} {:>9.3f} {:>10} {:>8}".format(
+                         profile['metric'], profile['project'] or '-', profile['queries'],
+                         profile['wall_time'], profile['took'], profile['parse_time'],
+                         profile['bytes'], profile['buckets']))
+        return "\n".join(lines)
+
+
+# Profiler of all the queries, None if disabled
+profiler = None
+
+
+def set_profiler(query_profiler):
+    """
+    Set the profiler of all the queries
+
+    :param query_profiler: a QueryProfiler, or None to disable the profiling
+    """
+    global profiler
+    profiler = query_profiler
+
+
+def get_profiler():
+    """
+    Get the profiler of all the queries
+
+    :return: a QueryProfiler, or None if the profiling is disabled
+    """
+    return profiler
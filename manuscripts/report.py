@@ -28,34 +28,114 @@ import os
 import subprocess
 import sys
 import glob
-
-import matplotlib as mpl
-# This avoids the use of the $DISPLAY value for the charts
-mpl.use('Agg')
-import matplotlib.pyplot as plt
-import prettyplotlib as ppl
-import numpy as np
+import hashlib
+import importlib
+import inspect
+import json
+import multiprocessing
+import threading
+import time
 
 from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from distutils.dir_util import copy_tree
-from distutils.file_util import copy_file
 
-from dateutil import parser, relativedelta
+from dateutil import relativedelta
 
-from .metrics import git
-from .metrics import jira
-from .metrics import github_issues
-from .metrics import github_prs
-from .metrics import mls
-from .metrics import gerrit
-from .metrics import stackexchange
+from .cache import get_cache
+from .esbatch import QueryBatch
+from .esclient import ClientRegistry
+from .esprojects import ProjectDiscovery
+from .incremental import TimeSeriesStore
+from .profiler import get_profiler
 
 from .metrics.metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
 
+class LazyClasses(Mapping):
+    """Mapping of names to classes, whose modules are imported the first time they are used
+
+    Importing the modules of the metrics of all the data sources, or of all
+    the chart backends, is slow, so just the ones used in the report are imported.
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: dict with the full path (module.Class) of the class of each name
+        """
+        self.paths = paths
+
+    def __getitem__(self, name):
+        module_name, class_name = self.paths[name].rsplit('.', 1)
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get_name(self, cls):
+        """
+        Get the name of a class, without importing the modules of the other classes
+
+        :param cls: a class in the mapping
+        :return: the name of the class
+        """
+        path = cls.__module__ + '.' + cls.__name__
+        for name, class_path in self.paths.items():
+            if class_path == path:
+                return name
+        raise KeyError(cls)
+
+
+class ClassMapping(Mapping):
+    """Mapping of the classes of a LazyClasses to the values of their names"""
+
+    def __init__(self, classes, values):
+        """
+        :param classes: a LazyClasses with the classes
+        :param values: dict with the value for the name of each class
+        """
+        self.classes = classes
+        self.values = values
+
+    def __getitem__(self, cls):
+        return self.values[self.classes.get_name(cls)]
+
+    def __iter__(self):
+        return (self.classes[name] for name in self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+
+# Backends drawing the charts, by name
+CHART_BACKENDS = LazyClasses({
+    'eps': 'manuscripts.epschart.EPSBackend',
+    'figure': 'manuscripts.mplchart.FigureBackend',
+    'pyplot': 'manuscripts.mplchart.PyplotBackend'
+})
+
+
+def render_chart(chart, *args, **kwargs):
+    """
+    Draw a chart measuring the time spent on it
+
+    :param chart: function drawing the chart (Report.bar_chart, Report.bar3_chart)
+    :param args: params for the chart function
+    :param kwargs: keyword params for the chart function
+    :return: the seconds spent drawing the chart
+    """
+    start = time.perf_counter()
+    chart(*args, **kwargs)
+    return time.perf_counter() - start
+
+
 class Report():
     """ Class which represents a Manuscripts report """
 
@@ -68,32 +148,35 @@ class Report():
     GERRIT_INDEX = 'gerrit'
     STACHEXCHANGE_INDEX = 'stackoverflow'
     GLOBAL_PROJECT = 'general'
+    PROJECT_FIELD = 'project'  # field with the project of the items, filtered in the project sections
     TOP_MAX = 20
+    CHARTS_FILE = 'charts.json'  # hashes of the data of the charts drawn
+
+    # Helper dict to map a data source name with its python class,
+    # whose metrics module is imported the first time it is used
+    ds2class = LazyClasses({
+        "gerrit": "manuscripts.metrics.gerrit.Gerrit",
+        "git": "manuscripts.metrics.git.Git",
+        "github_issues": "manuscripts.metrics.github_issues.GitHubIssues",
+        "github_prs": "manuscripts.metrics.github_prs.GitHubPRs",
+        "jira": "manuscripts.metrics.jira.Jira",
+        "mailinglist": "manuscripts.metrics.mls.MLS",
+        "stackexchange": "manuscripts.metrics.stackexchange.Stackexchange"
+    })
 
     # Helper dict to map a data source class with its Elasticsearch index
-    ds2index = {
-        gerrit.Gerrit: GERRIT_INDEX,
-        git.Git: GIT_INDEX,
-        github_issues.GitHubIssues: GITHUB_ISSUES_INDEX,
-        github_prs.GitHubPRs: GITHUB_PRS_INDEX,
-        jira.Jira: JIRA_INDEX,
-        mls.MLS: EMAIL_INDEX,
-        stackexchange.Stackexchange: STACHEXCHANGE_INDEX
-    }
-
-    # Helper dict to map a data source name with its python class
-    ds2class = {
-        "gerrit": gerrit.Gerrit,
-        "git": git.Git,
-        "github_issues": github_issues.GitHubIssues,
-        "github_prs": github_prs.GitHubPRs,
-        "jira": jira.Jira,
-        "mailinglist": mls.MLS,
-        "stackexchange": stackexchange.Stackexchange
-    }
+    ds2index = ClassMapping(ds2class, {
+        "gerrit": GERRIT_INDEX,
+        "git": GIT_INDEX,
+        "github_issues": GITHUB_ISSUES_INDEX,
+        "github_prs": GITHUB_PRS_INDEX,
+        "jira": JIRA_INDEX,
+        "mailinglist": EMAIL_INDEX,
+        "stackexchange": STACHEXCHANGE_INDEX
+    })
 
     # A reverse dictionary to get the data sources for the corresponding classes
-    class2ds = {val: key for key, val in ds2class.items()}
+    class2ds = ClassMapping(ds2class, {name: name for name in ds2class})
 
     # GrimoireLab data sources supported by Manuscripts
     supported_data_sources = ['git', 'github', 'gerrit', 'mls']
@@ -103,7 +186,9 @@ class Report():
 
     def __init__(self, es_url, start, end, data_dir=None, filters=None,
                  interval="month", offset=None, data_sources=None,
-                 report_name=None, projects=False, indices=[], logo=None):
+                 report_name=None, projects=False, indices=[], logo=None,
+                 msearch_size=None, workers=1, incremental=False, render_workers=0,
+                 chart_backend='pyplot', split_projects=False, skip_empty=False):
         """
         Report init method called when creating a new Report object
 
@@ -119,6 +204,20 @@ class Report():
         :param projects: generate a specific report for each project
         :param indices: list of data source indices in Elasticsearch to be used to get the metrics values
         :param logo: logo to be used in the report (in the title and headers of the pages)
+        :param msearch_size: max number of metric queries sent together in a _msearch request
+        :param workers: number of projects generated concurrently
+        :param incremental: reuse the time series of the previous report in data_dir, querying
+                            just the new periods, and write just the files with new data
+        :param render_workers: number of processes drawing the charts while the data is
+                               generated, 0 to draw them in the main process. The processes
+                               import the __main__ module of the caller, which must be guarded
+                               by `if __name__ == '__main__'`
+        :param chart_backend: name of the backend drawing the charts (pyplot, figure, eps).
+                              The figure and eps charts look alike, but not the same
+        :param split_projects: compute each metric for all the projects in the same query, with
+                               a terms aggregation on the project, instead of a query per project
+        :param skip_empty: count first the items in range of each data source in each project,
+                           and skip the metrics of the data sources without items in a project
         """
 
         if not (es_url and start and end and data_sources):
@@ -190,6 +289,35 @@ class Report():
         self.config = self.__get_config(self.data_sources)
         self.report_name = report_name
         self.projects = projects
+        self.msearch_size = msearch_size
+        self.workers = workers if workers else 1
+        self.split_projects = split_projects
+        self.project_discovery = None  # projects with items in the data sources
+        self.skip_empty = skip_empty
+        self.project_counts = {}  # items in range of each data source, by project file name
+        self.queries_avoided = 0  # metric queries not sent for the data sources without items
+        self.__avoided_lock = threading.Lock()
+        self.__local = threading.local()  # state of each thread generating data
+        self.render_workers = render_workers
+        self.chart_pool = None  # processes in which the charts are drawn
+        self.chart_jobs = []  # (file name, job) of the charts sent to the chart_pool
+        self.render_times = {}  # seconds spent drawing each chart file
+        self.chart_backend = CHART_BACKENDS[chart_backend]
+        self.chart_hashes = {}  # hash of the data of each chart file drawn
+        # The projects are generated in several threads, but the charts drawn in the
+        # main process (e.g. with the pyplot global state) must be drawn one by one
+        self.chart_lock = threading.Lock()
+        # Time series of the previous report, in incremental mode
+        self.ts_store = TimeSeriesStore(data_dir) if incremental else None
+
+    @property
+    def batch(self):
+        """Batch in which the metric queries of the current thread are collected"""
+        return getattr(self.__local, 'batch', None)
+
+    @batch.setter
+    def batch(self, batch):
+        self.__local.batch = batch
 
     def __get_config(self, data_sources=None):
         """
@@ -234,95 +362,15 @@ class Report():
 
         return new_config
 
-    def __convert_none_to_zero(self, ts):
-        """
-        Convert None values to 0 so the data works with Matplotlib
-        :param ts:
-        :return: a list with 0s where Nones existed
-        """
-
-        if not ts:
-            return ts
-
-        ts_clean = [val if val else 0 for val in ts]
-
-        return ts_clean
-
-    def bar3_chart(self, title, labels, data1, file_name, data2, data3, legend=["", ""]):
-        """
-        Generate a bar plot with three columns in each x position and save it to file_name
-
-        :param title: title to be used in the chart
-        :param labels: list of labels for the x axis
-        :param data1: values for the first columns
-        :param file_name: name of the file in which to save the chart
-        :param data2: values for the second columns
-        :param data3: values for the third columns
-        :param legend: legend to be shown in the chart
-        :return:
-        """
-
-        colors = ["orange", "grey"]
-
-        data1 = self.__convert_none_to_zero(data1)
-        data2 = self.__convert_none_to_zero(data2)
-        data3 = self.__convert_none_to_zero(data3)
-
-        fig, ax = plt.subplots(1)
-        xpos = np.arange(len(data1))
-        width = 0.28
-
-        plt.title(title)
-        y_pos = np.arange(len(data1))
-
-        ppl.bar(xpos + width + width, data3, color="orange", width=0.28, annotate=True)
-        ppl.bar(xpos + width, data1, color='grey', width=0.28, annotate=True)
-        ppl.bar(xpos, data2, grid='y', width=0.28, annotate=True)
-        plt.xticks(xpos + width, labels)
-        plt.legend(legend, loc=2)
-
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        plt.savefig(file_name)
-        plt.close()
-
-    def bar_chart(self, title, labels, data1, file_name, data2=None, legend=["", ""]):
-        """
-        Generate a bar plot with one or two columns in each x position and save it to file_name
-
-        :param title: title to be used in the chart
-        :param labels: list of labels for the x axis
-        :param data1: values for the first columns
-        :param file_name: name of the file in which to save the chart
-        :param data2: values for the second columns. If None only one column per x position is shown.
-        :param legend: legend to be shown in the chart
-        :return:
-        """
-
-        colors = ["orange", "grey"]
-
-        data1 = self.__convert_none_to_zero(data1)
-        data2 = self.__convert_none_to_zero(data2)
-
-        fig, ax = plt.subplots(1)
-        xpos = np.arange(len(data1))
-        width = 0.35
-
-        plt.title(title)
-        y_pos = np.arange(len(data1))
-
-        if data2 is not None:
-            ppl.bar(xpos + width, data1, color="orange", width=0.35, annotate=True)
-            ppl.bar(xpos, data2, grid='y', width=0.35, annotate=True)
-            plt.xticks(xpos + width, labels)
-            plt.legend(legend, loc=2)
-
-        else:
-            ppl.bar(xpos, data1, grid='y', annotate=True)
-            plt.xticks(xpos + width, labels)
+    # The charts are drawn with the chart backend of the report, these are kept
+    # to draw them with the pyplot backend
+    @staticmethod
+    def bar3_chart(title, labels, data1, file_name, data2, data3, legend=["", ""]):
+        CHART_BACKENDS['pyplot'].bar3_chart(title, labels, data1, file_name, data2, data3, legend)
 
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        plt.savefig(file_name)
-        plt.close()
+    @staticmethod
+    def bar_chart(title, labels, data1, file_name, data2=None, legend=["", ""]):
+        CHART_BACKENDS['pyplot'].bar_chart(title, labels, data1, file_name, data2, legend)
 
     def get_metric_index(self, metric_cls):
         """
@@ -352,14 +400,49 @@ class Report():
 
         logger.debug("CSV file %s generation in progress", file_name)
 
+        with self.query_batch() as batch:
+            trends = []
+            for metric in metrics:
+                # comparing current metric month count with previous month
+                es_index = self.get_metric_index(metric)
+                m = metric(self.es_url, es_index, start=self.start, end=self.end)
+                trends.append((metric, batch.add(m, 'trend')))
+
+            """
+            Git Authors:
+
+            description: average number of developers per month by quarters
+            (so we have the average number of developers per month during
+            those three months). If the approach is to work at the level of month,
+            then just the number of developers per month.
+            """
+
+            author = self.config['overview']['author_metrics'][0]
+            csv_labels = 'labels,' + author.id
+            file_label = author.ds.name + "_" + author.id
+            title_label = author.name + " per " + self.interval
+            self.__create_csv_eps(author, None, csv_labels, file_label, title_label)
+
+            bmi = []
+            ttc = []  # time to close
+
+            csv_labels = ''
+            for m in self.config['overview']['bmi_metrics']:
+                metric = m(self.es_url, self.get_metric_index(m),
+                           start=self.end_prev_month, end=self.end)
+                csv_labels += m.id + ","
+                bmi.append(batch.add(metric, 'agg'))
+
+            for m in self.config['overview']['time_to_close_metrics']:
+                metric = m(self.es_url, self.get_metric_index(m),
+                           start=self.end_prev_month, end=self.end)
+                csv_labels += m.id + ","
+                ttc.append(batch.add(metric, 'agg'))
+
         csv = 'metricsnames,netvalues,relativevalues,datasource\n'
-        for metric in metrics:
-            # comparing current metric month count with previous month
-            es_index = self.get_metric_index(metric)
-            ds = metric.ds.name
-            m = metric(self.es_url, es_index, start=self.start, end=self.end)
-            (last, percentage) = m.get_trend()
-            csv += "%s,%i,%i,%s" % (metric.name, last, percentage, ds)
+        for metric, trend in trends:
+            (last, percentage) = trend.result
+            csv += "%s,%i,%i,%s" % (metric.name, last, percentage, metric.ds.name)
             csv += "\n"
         os.makedirs(os.path.dirname(file_name), exist_ok=True)
         with open(file_name, "w") as f:
@@ -369,45 +452,12 @@ class Report():
 
         logger.debug("CSV file: %s was generated", file_name)
 
-        """
-        Git Authors:
-
-        description: average number of developers per month by quarters
-        (so we have the average number of developers per month during
-        those three months). If the approach is to work at the level of month,
-        then just the number of developers per month.
-        """
-
-        author = self.config['overview']['author_metrics'][0]
-        csv_labels = 'labels,' + author.id
-        file_label = author.ds.name + "_" + author.id
-        title_label = author.name + " per " + self.interval
-        self.__create_csv_eps(author, None, csv_labels, file_label, title_label)
-
-        logger.debug("CSV file %s generation in progress", file_name)
-
-        bmi = []
-        ttc = []  # time to close
-
-        csv_labels = ''
-        for m in self.config['overview']['bmi_metrics']:
-            metric = m(self.es_url, self.get_metric_index(m),
-                       start=self.end_prev_month, end=self.end)
-            csv_labels += m.id + ","
-            bmi.append(metric.get_agg())
-
-        for m in self.config['overview']['time_to_close_metrics']:
-            metric = m(self.es_url, self.get_metric_index(m),
-                       start=self.end_prev_month, end=self.end)
-            csv_labels += m.id + ","
-            ttc.append(metric.get_agg())
-
         csv = csv_labels[:-1] + "\n"  # remove last comma
         csv = csv.replace("_", "")
-        for val in bmi:
-            csv += "%s," % (self.str_val(val))
-        for val in ttc:
-            csv += "%s," % (self.str_val(val))
+        for item in bmi:
+            csv += "%s," % (self.str_val(item.result))
+        for item in ttc:
+            csv += "%s," % (self.str_val(item.result))
         if csv[-1] == ',':
             csv = csv[:-1]
 
@@ -427,11 +477,12 @@ class Report():
 
         metrics = self.config['com_channels']['activity_metrics']
         metrics += self.config['com_channels']['author_metrics']
-        for metric in metrics:
-            csv_labels = 'labels,' + metric.id
-            file_label = metric.ds.name + "_" + metric.id
-            title_label = metric.name + " per " + self.interval
-            self.__create_csv_eps(metric, None, csv_labels, file_label, title_label)
+        with self.query_batch():
+            for metric in metrics:
+                csv_labels = 'labels,' + metric.id
+                file_label = metric.ds.name + "_" + metric.id
+                title_label = metric.name + " per " + self.interval
+                self.__create_csv_eps(metric, None, csv_labels, file_label, title_label)
 
     @classmethod
     def str_val(cls, val):
@@ -464,6 +515,10 @@ class Report():
         :return:
         """
 
+        if self.is_empty(project, metric1, metric2):
+            logger.debug("CSV file %s skipped, no items for %s", file_label, project)
+            return
+
         logger.debug("CSV file %s generation in progress", file_label)
 
         esfilters = None
@@ -471,41 +526,96 @@ class Report():
 
         if project and project != self.GLOBAL_PROJECT:
             esfilters = {"project": project}
-        m1 = metric1(self.es_url, self.get_metric_index(metric1),
-                     esfilters=esfilters,
-                     start=self.start, end=self.end)
-        m1_ts = m1.get_ts()
 
-        if metric2:
-            m2 = metric2(self.es_url, self.get_metric_index(metric2),
+        with self.query_batch() as batch:
+            m1 = metric1(self.es_url, self.get_metric_index(metric1),
                          esfilters=esfilters,
                          start=self.start, end=self.end)
-            m2_ts = m2.get_ts()
+            m1_ts = self.__add_ts(batch, m1)
+
+            m2 = None
+            m2_ts = None
+            if metric2:
+                m2 = metric2(self.es_url, self.get_metric_index(metric2),
+                             esfilters=esfilters,
+                             start=self.start, end=self.end)
+                m2_ts = self.__add_ts(batch, m2)
+
+            batch.add_callback(lambda: self.__write_csv_eps(m1, m1_ts.result,
+                                                            m2, m2_ts.result if m2 else None,
+                                                            csv_labels, file_label,
+                                                            title_label, project))
+
+    def is_empty(self, project, *metrics):
+        """
+        Check if the data sources of some metrics have no items in range in a project,
+        counting the queries of the metrics as avoided if so. Just with skip_empty.
+
+        :param project: name of the project (as used in the files)
+        :param metrics: metric classes, None is ignored
+        :return: True if the metrics must not be computed for the project
+        """
+        counts = self.project_counts.get(project)
+        if not self.skip_empty or not counts:
+            return False
+
+        metrics = [metric for metric in metrics if metric]
+        # The data sources not counted are never empty
+        if any(counts.get(metric.ds.name) != 0 for metric in metrics):
+            return False
+
+        with self.__avoided_lock:
+            self.queries_avoided += len(metrics)
+        return True
+
+    def __add_ts(self, batch, metric):
+        """
+        Add the time series of a metric to a batch, reusing the stored one in incremental mode
+
+        :param batch: QueryBatch in which to add the metric query
+        :param metric: a Metrics object
+        :return: an item with the time series as result once the batch is executed
+        """
+        if self.ts_store:
+            return self.ts_store.add_ts(batch, metric)
+        return batch.add(metric, 'ts')
+
+    def __write_csv_eps(self, m1, m1_ts, m2, m2_ts, csv_labels, file_label,
+                        title_label, project=None):
+        """
+        Write the CSV data and EPS figs files for the time series of two metrics
+        :param m1: first metric
+        :param m1_ts: time series for the first metric
+        :param m2: second metric (None if there is only one metric)
+        :param m2_ts: time series for the second metric
+        :param csv_labels: labels to be used in the CSV file
+        :param file_label: shared filename token to be included in csv and eps files
+        :param title_label: title for the EPS figures
+        :param project: name of the project for which to generate the data
+        :return:
+        """
+
+        # Imported here, as numpy is slow to import and not needed to start the command line
+        from .timeseries import TimeSeries
+        m1_ts = TimeSeries.from_dict(m1_ts)
+        # Names of the periods, used in the CSV file and the chart
+        x_val = m1_ts.get_period_labels(self.interval,
+                                        lambda pdate: self.build_period_name(pdate, start_date=True))
 
         csv = csv_labels + '\n'
-        for i in range(0, len(m1_ts['date'])):
-            if self.interval == 'quarter':
-                date_str = self.build_period_name(parser.parse(m1_ts['date'][i]), start_date=True)
-            else:
-                date_str = parser.parse(m1_ts['date'][i]).strftime("%y-%m")
-            csv += date_str
+        for i in range(0, len(x_val)):
+            csv += x_val[i]
             csv += "," + self.str_val(m1_ts['value'][i])
-            if metric2:
+            if m2:
                 csv += "," + self.str_val(m2_ts['value'][i])
             csv += "\n"
 
         data_path = os.path.join(self.data_dir, "data")
 
         if project:
-            file_name = os.path.join(data_path, file_label + "_" + project + ".csv")
+            csv_file_name = os.path.join(data_path, file_label + "_" + project + ".csv")
         else:
-            file_name = os.path.join(data_path, file_label + ".csv")
-
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        with open(file_name, "w") as f:
-            f.write(csv)
-
-        logger.debug("CSV file %s was generated", file_label)
+            csv_file_name = os.path.join(data_path, file_label + ".csv")
 
         fig_path = os.path.join(self.data_dir, "figs")
 
@@ -516,20 +626,67 @@ class Report():
             file_name = os.path.join(fig_path, file_label + ".eps")
             title = title_label
 
-        if self.interval != 'quarter':
-            x_val = [parser.parse(val).strftime("%y-%m") for val in m1_ts['date']]
-        else:
-            x_val = []
-            for val in m1_ts['date']:
-                period = self.build_period_name(parser.parse(val), start_date=True)
-                x_val.append(period)
-        if metric2:
-            self.bar_chart(title, x_val, m1_ts['value'],
-                           file_name, m2_ts['value'],
-                           legend=[m1.name, m2.name])
+        if self.ts_store and os.path.exists(file_name) and os.path.exists(csv_file_name):
+            with open(csv_file_name) as f:
+                if f.read() == csv:
+                    logger.debug("CSV file %s has not changed", file_label)
+                    return
+
+        os.makedirs(os.path.dirname(csv_file_name), exist_ok=True)
+        with open(csv_file_name, "w") as f:
+            f.write(csv)
+
+        logger.debug("CSV file %s was generated", file_label)
+
+        if m2:
+            self.draw_chart(self.chart_backend.bar_chart, title, x_val, m1_ts['value'],
+                            file_name, m2_ts['value'],
+                            legend=[m1.name, m2.name])
         else:
-            self.bar_chart(title, x_val, m1_ts['value'], file_name,
-                           legend=[m1.name])
+            self.draw_chart(self.chart_backend.bar_chart, title, x_val, m1_ts['value'], file_name,
+                            legend=[m1.name])
+
+    def draw_chart(self, chart, *args, **kwargs):
+        """
+        Draw a chart, in the chart processes if they are available. In that case
+        the chart is queued and the data generation continues while it is drawn.
+        The chart is not drawn again if its file was drawn with the same data.
+
+        :param chart: function drawing the chart (a bar_chart or bar3_chart of a chart backend)
+        :param args: params for the chart function
+        :param kwargs: keyword params for the chart function
+        """
+        file_name = inspect.signature(chart).bind(*args, **kwargs).arguments['file_name']
+        data = json.dumps([chart.__qualname__, args, kwargs], sort_keys=True, default=str)
+        data_hash = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        with self.chart_lock:
+            if self.chart_hashes.get(file_name) == data_hash and os.path.exists(file_name):
+                logger.debug("Chart %s has not changed", file_name)
+                return
+
+            # The hash is recorded once the chart is drawn, so it is drawn again if it fails
+            self.chart_hashes.pop(file_name, None)
+            if self.chart_pool:
+                job = self.chart_pool.submit(render_chart, chart, *args, **kwargs)
+                self.chart_jobs.append((file_name, data_hash, job))
+            else:
+                self.render_times[file_name] = render_chart(chart, *args, **kwargs)
+                self.chart_hashes[file_name] = data_hash
+
+    def log_render_times(self):
+        """Log the summary of the time spent drawing the charts"""
+
+        if not self.render_times:
+            return
+
+        times = sorted(self.render_times.items(), key=lambda item: item[1], reverse=True)
+        total = sum(self.render_times.values())
+        logger.info("Charts: %i drawn in %.2fs (%.3fs per chart)",
+                    len(times), total, total / len(times))
+        for file_name, seconds in times:
+            logger.debug("Chart %s drawn in %.3fs", file_name, seconds)
+        logger.info("Slowest charts: %s", ", ".join("%s (%.3fs)" % (os.path.basename(file_name), seconds)
+                                                    for file_name, seconds in times[:5]))
 
     def sec_project_activity(self, project=None):
         """
@@ -560,6 +717,10 @@ class Report():
         """
 
         def create_csv(metric1, csv_labels, file_label):
+            if self.is_empty(project, metric1):
+                logger.debug("CSV file %s skipped, no items for %s", file_label, project)
+                return
+
             esfilters = None
             csv_labels = csv_labels.replace("_", "")  # LaTeX not supports "_"
             if project != self.GLOBAL_PROJECT:
@@ -573,47 +734,54 @@ class Report():
 
             m1 = metric1(self.es_url, self.get_metric_index(metric1),
                          esfilters=esfilters, start=self.end_prev_month, end=self.end)
-            top = m1.get_list()
-            csv = csv_labels + '\n'
-            for i in range(0, len(top['value'])):
-                if i > self.TOP_MAX:
-                    break
-                csv += top[metric1.FIELD_NAME][i] + "," + self.str_val(top['value'][i])
-                csv += "\n"
 
-            with open(file_name, "w") as f:
-                f.write(csv)
+            def write_csv():
+                top = top_item.result
+                csv = csv_labels + '\n'
+                for i in range(0, len(top['value'])):
+                    if i > self.TOP_MAX:
+                        break
+                    csv += top[metric1.FIELD_NAME][i] + "," + self.str_val(top['value'][i])
+                    csv += "\n"
+
+                with open(file_name, "w") as f:
+                    f.write(csv)
 
-            logger.debug("CSV file %s was generated", file_name)
+                logger.debug("CSV file %s was generated", file_name)
+
+            with self.query_batch() as batch:
+                top_item = batch.add(m1, 'list')
+                batch.add_callback(write_csv)
 
         logger.info("Community data for: %s", project)
 
-        author = self.config['project_community']['author_metrics'][0]
-        csv_labels = 'labels,' + author.id
-        file_label = author.ds.name + "_" + author.id
-        title_label = author.name + " per " + self.interval
-        self.__create_csv_eps(author, None, csv_labels, file_label, title_label,
-                              project)
+        with self.query_batch():
+            author = self.config['project_community']['author_metrics'][0]
+            csv_labels = 'labels,' + author.id
+            file_label = author.ds.name + "_" + author.id
+            title_label = author.name + " per " + self.interval
+            self.__create_csv_eps(author, None, csv_labels, file_label, title_label,
+                                  project)
 
-        """
-        Main developers
+            """
+            Main developers
 
-        """
-        metric = self.config['project_community']['people_top_metrics'][0]
-        # TODO: Commits must be extracted from metric
-        csv_labels = author.id + ",commits"
-        file_label = author.ds.name + "_top_" + author.id
-        create_csv(metric, csv_labels, file_label)
+            """
+            metric = self.config['project_community']['people_top_metrics'][0]
+            # TODO: Commits must be extracted from metric
+            csv_labels = author.id + ",commits"
+            file_label = author.ds.name + "_top_" + author.id
+            create_csv(metric, csv_labels, file_label)
 
-        """
-        Main organizations
+            """
+            Main organizations
 
-        """
-        orgs = self.config['project_community']['orgs_top_metrics'][0]
-        # TODO: Commits must be extracted from metric
-        csv_labels = orgs.id + ",commits"
-        file_label = orgs.ds.name + "_top_" + orgs.id
-        create_csv(orgs, csv_labels, file_label)
+            """
+            orgs = self.config['project_community']['orgs_top_metrics'][0]
+            # TODO: Commits must be extracted from metric
+            csv_labels = orgs.id + ",commits"
+            file_label = orgs.ds.name + "_top_" + orgs.id
+            create_csv(orgs, csv_labels, file_label)
 
     def sec_project_process(self, project=None):
         """
@@ -702,9 +870,7 @@ class Report():
         """
 
         # First the 'general' project
-        self.sec_project_activity(self.GLOBAL_PROJECT)
-        self.sec_project_community(self.GLOBAL_PROJECT)
-        self.sec_project_process(self.GLOBAL_PROJECT)
+        self.sec_project(self.GLOBAL_PROJECT)
 
         if not self.projects:
             # Don't generate per project data
@@ -712,31 +878,104 @@ class Report():
 
         # Just one level projects supported yet
 
-        # First we need to get the list of projects per data source and
-        # join all lists in the overall projects list
-
-        projects_lists = self.config['overview']['projects_metrics']
-
-        projects = []
-        for p in projects_lists:
-            p_list = p(self.es_url, self.get_metric_index(p),
-                       start=self.start).get_list()['project']
-            projects += p_list
-
-        projects = list(set(projects))
+        # The projects with items in any data source, discovered in all of them at once.
+        # Sorted so the report is the same whatever the order of generation
+        projects = self.get_project_discovery().get_projects()
 
         project_str = "\n".join(projects)
 
         with open(os.path.join(self.data_dir, "projects.txt"), "w") as f:
             f.write(project_str)
 
-        for project in projects:
-            # The name of the project is used to create files
-            project = project.replace("/", "_")
+        if self.skip_empty:
+            # One query per index counts the items of the data sources in each project
+            for project, counts in self.get_project_discovery().get_range_counts().items():
+                self.project_counts[project.replace("/", "_")] = counts
+
+        # The name of the project is used to create files
+        projects = [project.replace("/", "_") for project in projects]
+
+        if self.split_projects:
+            # The queries of all the projects are collected in the same batch,
+            # so the ones of the same metric are sent as a single query
+            with self.query_batch():
+                for project in projects:
+                    self.sec_project(project)
+        else:
+            # Each project writes its own files, so they can be generated concurrently
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                # Consume the results so the errors in the projects are raised
+                list(executor.map(self.sec_project, projects))
+
+        if self.skip_empty:
+            logger.info("%i metric queries avoided in projects without items", self.queries_avoided)
+
+    def get_project_discovery(self):
+        """
+        Get the discovery of the projects with items in the data sources of the report,
+        created once so the projects are queried just once in the report
+
+        :return: a ProjectDiscovery
+        """
+        if self.project_discovery is None:
+            sources = [metric(self.es_url, self.get_metric_index(metric), start=self.start)
+                       for metric in self.config['overview']['projects_metrics']]
+            date_fields = {source.ds.name: self.get_date_fields(source.ds) for source in sources}
+            self.project_discovery = ProjectDiscovery(self.es_url, sources, self.PROJECT_FIELD,
+                                                      end=self.end, date_fields=date_fields)
+        return self.project_discovery
+
+    @staticmethod
+    def get_date_fields(ds):
+        """
+        Get the date fields used by the metrics of a data source
+
+        :param ds: data source class
+        :return: a list with the names of the fields
+        """
+        fields = OrderedDict()
+        pending = [Metrics]
+        while pending:
+            metric_cls = pending.pop(0)
+            pending += metric_cls.__subclasses__()
+            if getattr(metric_cls, 'ds', None) is ds:
+                fields[metric_cls.FIELD_DATE] = True
+        return list(fields)
+
+    def sec_project(self, project):
+        """
+        Generate the activity, community and process data for a project. All the
+        queries needed for the project are sent together to Elasticsearch.
+
+        :param project: name of the project
+        :return:
+        """
+        with self.query_batch():
             self.sec_project_activity(project)
             self.sec_project_community(project)
             self.sec_project_process(project)
 
+    @contextmanager
+    def query_batch(self):
+        """
+        Collect the metric queries done inside the block in a batch, and send
+        them to Elasticsearch when the block ends. If there is already a
+        batch collecting queries, the queries are added to it.
+
+        :return: the QueryBatch in which the queries are collected
+        """
+        if self.batch is not None:
+            yield self.batch
+            return
+
+        split_field = self.PROJECT_FIELD if self.split_projects else None
+        self.batch = QueryBatch(self.es_url, self.msearch_size, split_field)
+        try:
+            yield self.batch
+            self.batch.execute()
+        finally:
+            self.batch = None
+
     def sections(self):
         """
         Get the sections of the report and howto build them.
@@ -760,10 +999,55 @@ class Report():
         logger.info("Generating the report data and figs from %s to %s",
                     self.start, self.end)
 
-        for section in self.sections():
-            logger.info("Generating %s", section)
-            self.sections()[section]()
-
+        if self.render_workers > 0:
+            # The charts are drawn in other processes while the queries continue. The
+            # processes are started on demand while the threads of the projects are
+            # running, so they are not forked from this process
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self.chart_pool = ProcessPoolExecutor(max_workers=self.render_workers, mp_context=context)
+
+        charts_path = os.path.join(self.data_dir, self.CHARTS_FILE)
+        self.chart_hashes = {}
+        if os.path.exists(charts_path):
+            with open(charts_path) as f:
+                self.chart_hashes = json.load(f)
+
+        self.render_times = {}
+        try:
+            for section in self.sections():
+                logger.info("Generating %s", section)
+                self.sections()[section]()
+
+            error = None
+            for file_name, data_hash, job in self.chart_jobs:
+                try:
+                    seconds = job.result()
+                except Exception as job_error:
+                    logger.error("Chart %s could not be drawn: %s", file_name, job_error)
+                    error = error or job_error
+                    continue
+                with self.chart_lock:
+                    self.render_times[file_name] = seconds
+                    self.chart_hashes[file_name] = data_hash
+            if error:
+                # raise the errors drawing the charts
+                raise error
+
+            if self.ts_store:
+                self.ts_store.save()
+        finally:
+            if self.chart_pool:
+                self.chart_pool.shutdown()
+                self.chart_pool = None
+            self.chart_jobs = []
+
+            # Just the charts drawn are recorded, also when the report fails
+            os.makedirs(self.data_dir, exist_ok=True)
+            with open(charts_path, "w") as f:
+                json.dump(self.chart_hashes, f)
+
+        self.log_render_times()
         logger.info("Data and figs done")
 
     @classmethod
@@ -851,6 +1135,10 @@ class Report():
         templates_path = os.path.join(os.path.dirname(__file__),
                                       "latex_template")
 
+        # distutils imports setuptools, which is slow to import
+        from distutils.dir_util import copy_tree
+        from distutils.file_util import copy_file
+
         # Copy the data generated to be used in LaTeX template
         copy_tree(templates_path, report_path)
 
@@ -945,6 +1233,18 @@ class Report():
         self.create_data_figs()
         self.create_pdf()
 
+        stats = ClientRegistry.get_stats()
+        logger.info("Elasticsearch clients: %i opened, %i reused",
+                    stats['opened'], stats['reused'])
+        cache = get_cache()
+        if cache:
+            stats = cache.get_stats()
+            logger.info("Query cache: %i hits, %i misses, %i evicted",
+                        stats['hits'], stats['misses'], stats['evicted'])
+        profiler = get_profiler()
+        if profiler:
+            profiler.write(self.data_dir)
+            logger.info("Queries profile:\n%s", profiler.get_summary())
         logger.info("Report completed")
 
     @classmethod
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Time series of the metrics, with its values in NumPy arrays
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import numpy as np
+
+
+class TimeSeries(dict):
+    """Time series of a metric, with a value for each period
+
+    The time series is a dict with the lists of the dates (date), values
+    (value) and unix times (unixtime) of the periods, the format used by
+    all the metrics and stored as JSON. The same data is available in
+    NumPy arrays, to compute with all the values at once:
+
+    - dates: datetime64[ms] array with the start of the periods (UTC)
+    - values: float array with the values, NaN if there is no value
+    - integer: bool array, True for the values which are integers (counts)
+    - mask: bool array, True for the periods without value
+    """
+
+    def __init__(self, dates, values, integer, date_list=None, value_list=None):
+        """
+        :param dates: datetime64[ms] array with the start of the periods
+        :param values: float array with the values, NaN if there is no value
+        :param integer: bool array, True for the values which are integers
+        :param date_list: list with the dates of the periods for the dict.
+                          Default: the ISO dates of the periods, as Elasticsearch formats them
+        :param value_list: list with the values for the dict. Default: built from values
+        """
+        super().__init__()
+        self.dates = dates
+        self.values = values
+        self.integer = integer
+        self.mask = np.isnan(values)
+
+        if date_list is None:
+            date_list = [date + 'Z' for date in np.datetime_as_string(dates, unit='ms')]
+        if value_list is None:
+            value_list = self.get_value_list()
+        self['date'] = date_list
+        self['value'] = value_list
+        self['unixtime'] = (dates.astype(np.int64) / 1000).tolist()
+
+    @classmethod
+    def from_buckets(cls, buckets, value_id, dates=False):
+        """
+        Build the time series from the buckets of a date_histogram aggregation
+
+        :param buckets: list of buckets, with the value in the value_id sub aggregation
+                        or, if not found, the number of items in the bucket
+        :param value_id: id of the sub aggregation with the value. If it is percentiles,
+                         the median is used
+        :param dates: if True, the dates of the dict are datetime.date objects, the days
+                      of the Elasticsearch dates in their time zone, instead of those dates
+        :return: a TimeSeries
+        """
+        def get_value(bucket):
+            if value_id not in bucket:
+                return bucket['doc_count']
+            agg = bucket[value_id]
+            if 'values' in agg:
+                value = agg['values']['50.0']
+                # ES returns NaN. Convert to None for matplotlib graph
+                return None if value == 'NaN' else value
+            return agg['value']
+
+        value_list = [get_value(bucket) for bucket in buckets]
+        keys = np.fromiter((bucket['key'] for bucket in buckets), dtype=np.int64, count=len(buckets))
+        series_dates = keys.astype('datetime64[ms]')
+        if dates:
+            days = [bucket['key_as_string'][:10] for bucket in buckets]
+            date_list = np.array(days, dtype='datetime64[D]').tolist()
+        else:
+            date_list = [bucket['key_as_string'] for bucket in buckets]
+
+        return cls(series_dates, np.array(value_list, dtype=float), cls.get_integer(value_list),
+                   date_list, value_list)
+
+    @classmethod
+    def from_dict(cls, ts):
+        """
+        Build the time series from a dict with the date, value and unixtime lists
+
+        :param ts: a dict with the time series, or a TimeSeries which is returned as is
+        :return: a TimeSeries
+        """
+        if isinstance(ts, TimeSeries):
+            return ts
+        unixtime = np.array(ts['unixtime'], dtype=float)
+        dates = np.rint(unixtime * 1000).astype(np.int64).astype('datetime64[ms]')
+        return cls(dates, np.array(ts['value'], dtype=float), cls.get_integer(ts['value']),
+                   list(ts['date']), list(ts['value']))
+
+    @staticmethod
+    def get_integer(value_list):
+        """
+        Get which values are integers
+
+        :param value_list: list of values
+        :return: a bool array, True for the integer values
+        """
+        return np.fromiter((type(value) is int for value in value_list), dtype=bool,
+                           count=len(value_list))
+
+    def get_value_list(self):
+        """
+        Get the list of values, with the integer values as int and None for the missing ones
+
+        :return: a list with the values
+        """
+        if self.integer.all():
+            return self.values.astype(np.int64).tolist()
+
+        value_list = self.values.tolist()
+        for pos in np.flatnonzero(self.integer):
+            value_list[pos] = int(value_list[pos])
+        for pos in np.flatnonzero(self.mask):
+            value_list[pos] = None
+        return value_list
+
+    def add(self, other):
+        """
+        Add the values of another time series for the same periods
+
+        :param other: a TimeSeries or a dict with the time series
+        :return: a TimeSeries with the sum of the values
+        """
+        other = self.from_dict(other)
+        return TimeSeries(self.dates, self.values + other.values, self.integer & other.integer,
+                          self['date'])
+
+    def divide(self, other):
+        """
+        Divide the values by the ones of another time series for the same periods.
+        The periods in which the other value is 0 get 0.
+
+        :param other: a TimeSeries or a dict with the time series
+        :return: a TimeSeries with the ratios
+        """
+        other = self.from_dict(other)
+        zero = other.values == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = np.where(zero, 0, self.values / other.values)
+        return TimeSeries(self.dates, ratios, zero, self['date'])
+
+    def get_period_labels(self, interval, format_quarter):
+        """
+        Get the names of the periods for the CSV files and the charts
+
+        :param interval: interval of the periods: month or quarter
+        :param format_quarter: function getting the name of the quarter starting in a datetime
+        :return: a list with the name of each period, like 18-05 for months
+        """
+        if interval == 'quarter':
+            return [format_quarter(date) for date in self.dates.tolist()]
+        return [date[2:] for date in np.datetime_as_string(self.dates, unit='M')]
@@ -22,31 +22,60 @@
 # Authors:
 #   Pranjal Aswani <aswani.pranjal@gmail.com>
 
-from dateutil import parser
+import asyncio
+import copy
+import functools
+import logging
+
 from datetime import timezone
 from collections import OrderedDict, defaultdict
 
+import numpy as np
 import pandas as pd
-from elasticsearch import Elasticsearch
 from elasticsearch_dsl import A, Q, Search
 
+from manuscripts.cache import get_cache
+from manuscripts.esclient import get_client
+from manuscripts.esquery import get_periods_start
+from manuscripts.timeseries import TimeSeries
+
+logger = logging.getLogger(__name__)
+
 
 class Index():
     """
     Index class representing an elasticsearch index
     """
 
-    def __init__(self, index_name, es=None):
+    def __init__(self, index_name, es=None, async_es=None):
         """
         :param index_name: name of the elasticsearch index that is to be queried (required)
         :param es: the client used to connect to elasticsearch (optional)
                    default connects to elasticsearch running at http://localhost:9200
+        :param async_es: an asyncio client (such as AsyncElasticsearch) used in the
+                         async queries (optional). Without it, the async queries use es
+                         in the threads of the event loop executor
         """
 
         self.index_name = index_name
         if not es:
-            es = Elasticsearch()
+            es = get_client()
         self.es = es
+        self.async_es = async_es
+
+    async def search_async(self, query):
+        """
+        Send a query to the index without blocking the event loop
+
+        :param query: a dict with the query to be sent
+        :returns: a dict with the response from elasticsearch
+        """
+
+        if self.async_es:
+            return await self.async_es.search(index=self.index_name, body=query)
+
+        search = functools.partial(self.es.search, index=self.index_name, body=query)
+        return await asyncio.get_running_loop().run_in_executor(None, search)
 
 
 class Query():
@@ -305,6 +334,9 @@ class Query():
         :param field: the field to create the parent agg (optional)
                       default: author_uuid
         :returns: self, which allows the method to be chainable with the other methods
+
+        The terms aggregation gets up to self.size buckets, use stream_buckets
+        to get all of them page by page.
         """
 
         # Parent aggregation
@@ -335,6 +367,9 @@ class Query():
         :param field: the field to create the parent agg (optional)
                       default: author_org_name
         :returns: self, which allows the method to be chainable with the other methods
+
+        The terms aggregation gets up to self.size buckets, use stream_buckets
+        to get all of them page by page.
         """
 
         # this functions is currently only for issues and PRs
@@ -452,6 +487,106 @@ class Query():
         :returns: a dictionary containing the response from elasticsearch
         """
 
+        query = self.__get_aggregations_query()
+
+        cache = get_cache()
+        if cache:
+            res = cache.get(self.index.index_name, query)
+            if res is not None:
+                return res
+
+        res = self.search.execute().to_dict()
+        if cache:
+            cache.set(self.index.index_name, query, res)
+        return res
+
+    async def fetch_aggregation_results_async(self):
+        """
+        Async variant of fetch_aggregation_results, which doesn't block the event
+        loop while waiting for the response from elasticsearch
+
+        :returns: a dictionary containing the response from elasticsearch
+        """
+
+        query = self.__get_aggregations_query()
+
+        cache = get_cache()
+        if cache:
+            res = cache.get(self.index.index_name, query)
+            if res is not None:
+                return res
+
+        res = await self.index.search_async(query)
+        if cache:
+            cache.set(self.index.index_name, query, res)
+        return res
+
+    def stream_buckets(self, page_size=1000):
+        """
+        Get the buckets of the last terms aggregation, such as the ones created with
+        by_authors and by_organizations, page by page. The terms aggregation is sent
+        as a composite aggregation, so all the buckets are fetched, keeping just one
+        page of them in memory and in the elasticsearch coordinating node.
+
+        The buckets are yielded in the order of their keys, with the same format as the
+        buckets of the terms aggregation. The bucket of the items without the field has
+        the key "others".
+
+        :param page_size: number of buckets fetched in each request
+        :returns: a generator of dicts with the buckets
+        """
+
+        if not self.aggregations:
+            raise AttributeError("Please create a terms aggregation to get the buckets from!")
+
+        # The composite aggregation is built in a copy, so this query is not changed
+        stream_query = self.copy()
+        agg_name, agg = stream_query.aggregations.popitem()
+        agg = agg.to_dict()
+        if 'terms' not in agg:
+            raise AttributeError("The last aggregation is not a terms aggregation!")
+
+        field = agg['terms']['field']
+        missing = agg['terms'].get('missing')
+        composite = {
+            "composite": {
+                "sources": [{field: {"terms": {"field": field, "missing_bucket": True}}}],
+                "size": page_size
+            }
+        }
+        if 'aggs' in agg:
+            composite['aggs'] = agg['aggs']
+
+        query = stream_query.search.extra(size=0).to_dict()
+        query['aggs'] = {agg_name: composite}
+
+        cache = get_cache()
+        while True:
+            res = cache.get(self.index.index_name, query) if cache else None
+            if res is None:
+                res = self.index.es.search(index=self.index.index_name, body=query)
+                if cache:
+                    cache.set(self.index.index_name, query, res)
+
+            buckets = res['aggregations'][agg_name]['buckets']
+            for bucket in buckets:
+                key = bucket.pop('key')[field]
+                bucket['key'] = key if key is not None or missing is None else missing
+                yield bucket
+
+            after_key = res['aggregations'][agg_name].get('after_key')
+            if len(buckets) < page_size or not after_key:
+                break
+            composite['composite']['after'] = after_key
+
+    def __get_aggregations_query(self):
+        """
+        Add the aggregations in the self.aggregations dict to the Search object,
+        in order in which they were created
+
+        :returns: a dict with the query to be sent to elasticsearch
+        """
+
         self.reset_aggregations()
 
         for key, val in self.aggregations.items():
@@ -459,9 +594,8 @@ class Query():
             self.parent_agg_counter += 1
 
         self.search = self.search.extra(size=0)
-        response = self.search.execute()
         self.flush_aggregations()
-        return response.to_dict()
+        return self.search.to_dict()
 
     def fetch_results_from_source(self, *fields, dataframe=False):
         """
@@ -481,8 +615,15 @@ class Query():
 
         self.search = self.search.extra(_source=fields)
         self.search = self.search.extra(size=self.size)
-        response = self.search.execute()
-        hits = response.to_dict()['hits']['hits']
+        response = self.search.execute().to_dict()
+        hits = response['hits']['hits']
+        total = response['hits']['total']
+        if isinstance(total, dict):
+            # elasticsearch >= 7
+            total = total['value']
+        if total > len(hits):
+            logger.warning("Only %i of %i items fetched from %s, use stream_results_from_source "
+                           "to get all of them", len(hits), total, self.index.index_name)
         data = [item["_source"] for item in hits]
 
         if dataframe:
@@ -490,6 +631,94 @@ class Query():
             return df.fillna(0)
         return data
 
+    def stream_results_from_source(self, *fields, page_size=1000, keep_alive="5m", dataframe=False):
+        """
+        Get values for specific fields in the elasticsearch index, from source, page by page.
+        All the items are fetched, keeping in memory just one page of them.
+
+        The pages are fetched using search_after with a point in time, or using a scroll
+        if the elasticsearch client doesn't support points in time (elasticsearch < 7.10).
+
+        :param fields: a list of fields that have to be retrieved from the index
+        :param page_size: number of items fetched in each request
+        :param keep_alive: time the point in time or scroll is kept between requests
+        :param dataframe: if true, will yield a pandas.DataFrame for each page
+        :returns: a generator of dicts(key_val pairs) containing the values for the applied fields
+                  if dataframe=True, a generator of dataframes containing the data of each page
+        """
+
+        if not fields:
+            raise AttributeError("Please provide the fields to get from elasticsearch!")
+
+        self.reset_aggregations()
+
+        self.search = self.search.extra(_source=fields)
+        if hasattr(self.index.es, 'open_point_in_time'):
+            pages = self.__get_pages_with_pit(page_size, keep_alive)
+        else:
+            pages = self.__get_pages_with_scroll(page_size, keep_alive)
+
+        for hits in pages:
+            data = [item["_source"] for item in hits]
+            if dataframe:
+                df = pd.DataFrame.from_records(data)
+                yield df.fillna(0)
+            else:
+                yield from data
+
+    def __get_pages_with_pit(self, page_size, keep_alive):
+        """
+        Get the hits of the search page by page, using search_after with a point in time
+
+        :param page_size: number of hits in each page
+        :param keep_alive: time the point in time is kept between requests
+        :returns: a generator of lists of hits
+        """
+
+        es = self.index.es
+        pit_id = es.open_point_in_time(index=self.index.index_name, keep_alive=keep_alive)['id']
+
+        query = self.search.to_dict()
+        query['size'] = page_size
+        query['sort'] = ["_shard_doc"]
+        try:
+            while True:
+                query['pit'] = {"id": pit_id, "keep_alive": keep_alive}
+                response = es.search(body=query)
+                hits = response['hits']['hits']
+                if not hits:
+                    break
+                yield hits
+                pit_id = response['pit_id']
+                query['search_after'] = hits[-1]['sort']
+        finally:
+            es.close_point_in_time(body={"id": pit_id})
+
+    def __get_pages_with_scroll(self, page_size, keep_alive):
+        """
+        Get the hits of the search page by page, using a scroll
+
+        :param page_size: number of hits in each page
+        :param keep_alive: time the scroll is kept between requests
+        :returns: a generator of lists of hits
+        """
+
+        es = self.index.es
+
+        query = self.search.to_dict()
+        query['size'] = page_size
+        query['sort'] = ["_doc"]
+        response = es.search(index=self.index.index_name, body=query, scroll=keep_alive)
+        scroll_id = response.get('_scroll_id')
+        try:
+            while response['hits']['hits']:
+                yield response['hits']['hits']
+                response = es.scroll(scroll_id=scroll_id, scroll=keep_alive)
+                scroll_id = response.get('_scroll_id', scroll_id)
+        finally:
+            if scroll_id:
+                es.clear_scroll(scroll_id=scroll_id)
+
     def get_timeseries(self, child_agg_count=0, dataframe=False):
         """
         Get time series data for the specified fields and period of analysis
@@ -504,35 +733,107 @@ class Query():
         """
 
         res = self.fetch_aggregation_results()
+        return self.__parse_timeseries(res, child_agg_count, dataframe)
+
+    async def get_timeseries_async(self, child_agg_count=0, dataframe=False):
+        """
+        Async variant of get_timeseries, to be awaited in an event loop
+
+        :param child_agg_count: the child aggregation count to be used
+                                default = 0
+        :param dataframe: if dataframe=True, return a pandas.DataFrame object
+        :returns: dictionary containing "date", "value" and "unixtime" keys
+                  with lists as values containing data from each bucket in the
+                  aggregation
+        """
+
+        res = await self.fetch_aggregation_results_async()
+        return self.__parse_timeseries(res, child_agg_count, dataframe)
 
-        ts = {"date": [], "value": [], "unixtime": []}
+    def __parse_timeseries(self, res, child_agg_count=0, dataframe=False):
+        """
+        Get the time series data from the response to the aggregations query
+
+        :param res: a dictionary containing the response from elasticsearch
+        :param child_agg_count: the child aggregation count to be used
+        :param dataframe: if dataframe=True, return a pandas.DataFrame object
+        :returns: dictionary containing "date", "value" and "unixtime" keys
+        """
 
         if 'buckets' not in res['aggregations'][str(self.parent_agg_counter - 1)]:
             raise RuntimeError("Aggregation results have no buckets in time series results.")
 
-        for bucket in res['aggregations'][str(self.parent_agg_counter - 1)]['buckets']:
-            ts['date'].append(parser.parse(bucket['key_as_string']).date())
-            if str(child_agg_count) in bucket:
-                # We have a subaggregation with the value
-                # If it is percentiles we get the median
-                if 'values' in bucket[str(child_agg_count)]:
-                    val = bucket[str(child_agg_count)]['values']['50.0']
-                    if val == 'NaN':
-                        # ES returns NaN. Convert to None for matplotlib graph
-                        val = None
-                    ts['value'].append(val)
-                else:
-                    ts['value'].append(bucket[str(child_agg_count)]['value'])
-            else:
-                ts['value'].append(bucket['doc_count'])
-            # unixtime comes in ms from ElasticSearch
-            ts['unixtime'].append(bucket['key'] / 1000)
+        # The value is in the child aggregation if any, the median if it is percentiles
+        ts = TimeSeries.from_buckets(res['aggregations'][str(self.parent_agg_counter - 1)]['buckets'],
+                                     str(child_agg_count), dates=True)
 
         if dataframe:
             df = pd.DataFrame.from_records(ts, index="date")
             return df.fillna(0)
         return ts
 
+    def get_trend(self, child_agg_count=0):
+        """
+        Get the trend of the time series created with by_period. If the end date
+        is set, only the last two periods, the ones needed, are queried.
+
+        :param child_agg_count: the child aggregation count to be used
+                                default = 0
+        :returns: the last period value and relative change
+        """
+
+        return get_trend(self.copy().last_periods(2).get_timeseries(child_agg_count))
+
+    async def get_trend_async(self, child_agg_count=0):
+        """
+        Async variant of get_trend, to be awaited in an event loop
+
+        :param child_agg_count: the child aggregation count to be used
+                                default = 0
+        :returns: the last period value and relative change
+        """
+
+        return get_trend(await self.copy().last_periods(2).get_timeseries_async(child_agg_count))
+
+    def copy(self):
+        """
+        Copy the query, so it can be changed without changing this one
+
+        :returns: a new Query object with the same search and aggregations
+        """
+        query = copy.copy(self)
+        query.aggregations = OrderedDict(self.aggregations)
+        query.child_agg_counter_dict = defaultdict(int, self.child_agg_counter_dict)
+        return query
+
+    def last_periods(self, periods):
+        """
+        Limit the date histogram created with by_period to the last periods
+        until the end date. Without end date, nothing is changed.
+
+        :param periods: number of periods to get
+        :returns: self, which allows the method to be chainable with the other methods
+        """
+
+        hist_keys = [key for key in self.aggregations if key.startswith("date_histogram_")]
+        if not hist_keys or not self.end_date:
+            return self
+
+        agg_key = hist_keys[-1]
+        hist = self.aggregations[agg_key].to_dict()
+        date_field = hist['date_histogram']['field']
+        start = get_periods_start(self.end_date, hist['date_histogram']['interval'], periods,
+                                  offset=hist['date_histogram'].get('offset'))
+        if not start or (self.start_date and start <= self.start_date):
+            return self
+
+        date_dict = {date_field: {"gte": "{}".format(start.isoformat())}}
+        self.search = self.search.filter("range", **date_dict)
+        if 'extended_bounds' in hist['date_histogram']:
+            hist['date_histogram'].update(self.get_bounds(start, self.end_date))
+        self.aggregations[agg_key] = A(hist)
+        return self
+
     def get_aggs(self):
         """
         Compute the values for single valued aggregations
@@ -542,6 +843,26 @@ class Query():
         """
 
         res = self.fetch_aggregation_results()
+        return self.__parse_aggs(res)
+
+    async def get_aggs_async(self):
+        """
+        Async variant of get_aggs, to be awaited in an event loop
+
+        :returns: the single aggregation value
+        """
+
+        res = await self.fetch_aggregation_results_async()
+        return self.__parse_aggs(res)
+
+    def __parse_aggs(self, res):
+        """
+        Get the single aggregation value from the response to the aggregations query
+
+        :param res: a dictionary containing the response from elasticsearch
+        :returns: the single aggregation value
+        """
+
         if 'aggregations' in res and 'values' in res['aggregations'][str(self.parent_agg_counter - 1)]:
             try:
                 agg = res['aggregations'][str(self.parent_agg_counter - 1)]['values']["50.0"]
@@ -613,50 +934,98 @@ def calculate_bmi(closed, submitted):
     if sorted(closed.keys()) != sorted(submitted.keys()):
         raise AttributeError("The buckets supplied are not congruent!")
 
-    dates = closed['date']
-    closed_values = closed['value']
-    submitted_values = submitted['value']
-    ratios = []
-    for x, y in zip(closed_values, submitted_values):
-        if y == 0:
-            ratios.append(0)
+    bmi = TimeSeries.from_dict(closed).divide(TimeSeries.from_dict(submitted))
+    return {"period": closed['date'], "bmi": bmi['value']}
+
+
+BUCKET_POS = "__bucket"  # column with the position of the bucket of each row while flattening
+
+
+def keys_to_datetime(keys, keys_as_string):
+    """
+    Convert the keys of date histogram buckets to datetimes. The keys in
+    epoch millis are used if the dates are in UTC, without parsing them.
+
+    :param keys: list with the keys of the buckets, in epoch millis
+    :param keys_as_string: list with the dates of the buckets
+    :returns: a pandas Series with the datetimes
+    """
+
+    if all(key.endswith("Z") for key in keys_as_string):
+        return pd.Series(pd.to_datetime(keys, unit="ms", utc=True))
+    return pd.Series(pd.to_datetime(keys_as_string))
+
+
+def flatten_buckets(buckets):
+    """
+    Build the columns of a DataFrame from aggregation buckets. The aggregations
+    with a value are replaced by the value, and the nested aggregations with buckets
+    are flattened, with a row for each of their buckets and their columns named
+    <aggregation name>.<column> (the buckets without nested buckets get a row with
+    NaN in those columns).
+
+    :param buckets: elasticsearch aggregation buckets
+    :returns: a DataFrame with the raw columns of the buckets and the position of the
+              bucket of each row in BUCKET_POS
+    """
+
+    # All the buckets usually have the same fields, the ones of the first bucket
+    names = list(buckets[0]) if buckets else []
+    if len(set().union(*buckets)) > len(names):
+        names = list(OrderedDict.fromkeys(name for bucket in buckets for name in bucket))
+
+    columns = OrderedDict()
+    nested = []
+    for name in names:
+        values = [bucket.get(name) for bucket in buckets]
+        sample = next((value for value in values if value is not None), None)
+        if isinstance(sample, dict) and isinstance(sample.get('buckets'), list):
+            nested.append((name, values))
+        elif isinstance(sample, dict) and 'value' in sample:
+            try:
+                columns[name] = [value['value'] for value in values]
+            except (KeyError, TypeError):
+                columns[name] = [value['value'] if isinstance(value, dict) and 'value' in value else value
+                                 for value in values]
         else:
-            ratios.append(x / y)
-    return {"period": dates, "bmi": ratios}
+            columns[name] = values
+    columns[BUCKET_POS] = range(len(buckets))
+    df = pd.DataFrame(columns)
+
+    for name, values in nested:
+        sub_buckets = [value['buckets'] if value else [] for value in values]
+        sub_df = flatten_buckets([sub_bucket for value in sub_buckets for sub_bucket in value])
+        parents = np.repeat(np.arange(len(buckets)), [len(value) for value in sub_buckets])
+        sub_df[BUCKET_POS] = parents[sub_df[BUCKET_POS].values] if len(sub_df) else []
+        if 'key_as_string' in sub_df:
+            sub_df['key'] = keys_to_datetime(sub_df['key'].tolist(), sub_df.pop('key_as_string').tolist())
+        sub_df.columns = [col if col == BUCKET_POS else name + "." + str(col) for col in sub_df.columns]
+        df = df.merge(sub_df, on=BUCKET_POS, how='left')
+
+    return df
 
 
 def buckets_to_df(buckets):
     """
     Takes in aggregation buckets and converts them into a pandas dataframe
     after cleaning the buckets. If a DateTime field is present(usually having the name:
-    "key_as_string") parses it to datetime object and then it uses it as key
+    "key_as_string") parses it to datetime object and then it uses it as key.
+    The buckets of nested aggregations are flattened, with a row for each of them.
 
     :param buckets: elasticsearch aggregation buckets to be converted to a DataFrame obj
     :returns: a DataFrame object created by parsing the buckets
     """
-    cleaned_buckets = []
-    for item in buckets:
-        if type(item) == str:
-            return item
 
-        temp = {}
-        for key, val in item.items():
-            try:
-                temp[key] = val['value']
-            except Exception as e:
-                temp[key] = val
+    if not buckets:
+        return pd.DataFrame()
+    if isinstance(buckets[0], str):
+        return buckets[0]
 
-        cleaned_buckets.append(temp)
-
-    if "key_as_string" in temp.keys():
-        ret_df = pd.DataFrame.from_records(cleaned_buckets)
+    ret_df = flatten_buckets(buckets).drop(BUCKET_POS, axis=1)
+    if "key_as_string" in ret_df.columns:
         ret_df = ret_df.rename(columns={"key": "date_in_seconds"})
-        ret_df['key'] = pd.to_datetime(ret_df['key_as_string'])
+        ret_df['key'] = keys_to_datetime(ret_df['date_in_seconds'].tolist(), ret_df['key_as_string'].tolist())
         ret_df = ret_df.drop(["key_as_string", "doc_count"], axis=1)
         ret_df = ret_df.set_index("key")
-    elif "key" in cleaned_buckets[0].keys():
-        ret_df = pd.DataFrame.from_records(cleaned_buckets)  # index="key")
-    else:
-        ret_df = pd.DataFrame(cleaned_buckets)
 
     return ret_df.fillna(0)
@@ -23,15 +23,15 @@
 #
 
 import os
+import asyncio
 import logging
 
 from collections import defaultdict
 
-from elasticsearch import Elasticsearch
+from manuscripts.esclient import get_client
 
 from .elasticsearch import (Query,
-                            Index,
-                            get_trend)
+                            Index)
 
 from .metrics import git
 from .metrics import github_prs
@@ -69,12 +69,16 @@ class Report():
 
     def __init__(self, es_url=None, start=None, end=None, data_dir=None, filters=None,
                  interval="month", offset=None, data_sources=None,
-                 report_name=None, projects=False, indices=[], logo=None):
+                 report_name=None, projects=False, indices=[], logo=None, concurrency=10):
 
         Query.interval_ = interval
 
+        # Max number of queries waiting for elasticsearch at the same time
+        self.concurrency = concurrency
+        self.semaphore = None
+
         self.es = "http://localhost:9200"
-        self.es_client = Elasticsearch(self.es)
+        self.es_client = get_client(self.es)
         # Set the client for all metrics
         Index.es = self.es_client
 
@@ -128,8 +132,47 @@ class Report():
 
         return new_config
 
+    def run(self, *sections):
+        """
+        Run the coroutines of the sections concurrently in one event loop
+
+        :param sections: coroutines generating the sections of the report
+        :returns: the list of results of the sections
+        """
+
+        async def run_sections():
+            # The semaphore is shared by all the queries of the sections
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            return await asyncio.gather(*sections)
+
+        return asyncio.run(run_sections())
+
+    async def gather(self, *aws):
+        """
+        Await concurrently a list of awaitables (the async metrics queries), with at
+        most self.concurrency of them running at the same time
+
+        :param aws: awaitables to be run
+        :returns: the list of results, in the same order as aws
+        """
+
+        async def limited(aw):
+            async with self.semaphore:
+                return await aw
+
+        return await asyncio.gather(*[limited(aw) for aw in aws])
+
+    def create(self):
+        """Generate all the sections of the report"""
+
+        self.run(self.get_activity_metrics_async())
+
     def get_activity_metrics(self):
 
+        self.run(self.get_activity_metrics_async())
+
+    async def get_activity_metrics_async(self):
+
         metrics = self.config['overview']['activity_metrics']
         file_name = self.config['overview']['activity_file_csv']
         data_path = os.path.join(self.data_dir, "data")
@@ -141,8 +184,8 @@ class Report():
 
         csv = "metricsnames, netvalues, relativevalues, datasource\n"
 
-        for metric in metrics:
-            (last, percentage) = get_trend(metric.get_timeseries())
+        trends = await self.gather(*[metric.get_trend_async() for metric in metrics])
+        for metric, (last, percentage) in zip(metrics, trends):
             csv += "{}, {}, {}, {}\n".format(metric.index.index_name, last,
                                              percentage, metric.index.index_name)
 
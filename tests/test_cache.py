@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import json
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from collections import OrderedDict
+from datetime import datetime
+from unittest import mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.cache import QueryCache, set_cache
+from manuscripts.esbatch import QueryBatch
+from manuscripts.metrics import git
+
+ES_URL = "http://localhost:9200"
+
+QUERY = {"size": 0, "aggs": {"1": {"cardinality": {"field": "hash"}}}}
+RESPONSE = {"hits": {"total": 10}, "aggregations": {"1": {"value": 7}}}
+
+
+class TestQueryCache(unittest.TestCase):
+    """Tests for the cache of Elasticsearch responses"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='manuscripts_')
+
+    def tearDown(self):
+        set_cache(None)
+        shutil.rmtree(self.cache_dir)
+
+    def test_get_key(self):
+        """Test whether the key does not depend on the order of the query fields"""
+
+        query = OrderedDict()
+        query["aggs"] = QUERY["aggs"]
+        query["size"] = 0
+
+        self.assertEqual(QueryCache.get_key("git", QUERY), QueryCache.get_key("git", query))
+        self.assertNotEqual(QueryCache.get_key("git", QUERY), QueryCache.get_key("gerrit", QUERY))
+        self.assertNotEqual(QueryCache.get_key("git", QUERY, ES_URL),
+                            QueryCache.get_key("git", QUERY, "http://other:9200"))
+
+    def test_get_set(self):
+        """Test whether the responses are stored and retrieved"""
+
+        cache = QueryCache(self.cache_dir)
+        self.assertIsNone(cache.get("git", QUERY))
+        cache.set("git", QUERY, RESPONSE)
+        self.assertDictEqual(cache.get("git", QUERY), RESPONSE)
+        self.assertIsNone(cache.get("gerrit", QUERY))
+
+        # the responses are in disk
+        cache = QueryCache(self.cache_dir)
+        self.assertDictEqual(cache.get("git", QUERY), RESPONSE)
+        self.assertDictEqual(cache.get_stats(), {"hits": 1, "misses": 0, "evicted": 0})
+
+    def test_es_url(self):
+        """Test whether the responses of another Elasticsearch are not used"""
+
+        cache = QueryCache(self.cache_dir, es_url="localhost:9200/")
+        cache.set("git", QUERY, RESPONSE)
+        self.assertDictEqual(QueryCache(self.cache_dir, es_url=ES_URL).get("git", QUERY), RESPONSE)
+        self.assertIsNone(QueryCache(self.cache_dir, es_url="http://other:9200").get("git", QUERY))
+
+    def test_ttl(self):
+        """Test whether expired responses are not used"""
+
+        cache = QueryCache(self.cache_dir, ttl=60)
+        with mock.patch('manuscripts.cache.time.time', return_value=1000):
+            cache.set("git", QUERY, RESPONSE)
+        with mock.patch('manuscripts.cache.time.time', return_value=1050):
+            self.assertDictEqual(cache.get("git", QUERY), RESPONSE)
+        with mock.patch('manuscripts.cache.time.time', return_value=1061):
+            self.assertIsNone(cache.get("git", QUERY))
+
+    def test_evict(self):
+        """Test whether the least recently used responses are removed"""
+
+        # just two responses fit in the cache
+        cache = QueryCache(self.cache_dir, ttl=time.time(), max_size=2 * len(json.dumps(RESPONSE)))
+        queries = [{"size": i} for i in range(3)]
+        with mock.patch('manuscripts.cache.time.time', return_value=1000):
+            cache.set("git", queries[0], RESPONSE)
+        with mock.patch('manuscripts.cache.time.time', return_value=1001):
+            cache.set("git", queries[1], RESPONSE)
+        with mock.patch('manuscripts.cache.time.time', return_value=1002):
+            # the first query is used again, so the second one is the oldest
+            self.assertIsNotNone(cache.get("git", queries[0]))
+        with mock.patch('manuscripts.cache.time.time', return_value=1003):
+            cache.set("git", queries[2], RESPONSE)
+
+        self.assertEqual(cache.get_stats()['evicted'], 1)
+        self.assertEqual(cache.size, 2 * len(json.dumps(RESPONSE)))
+        self.assertIsNotNone(cache.get("git", queries[0]))
+        self.assertIsNone(cache.get("git", queries[1]))
+        self.assertIsNotNone(cache.get("git", queries[2]))
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_batch(self, get_client):
+        """Test whether just the queries not cached are sent in a batch"""
+
+        set_cache(QueryCache(self.cache_dir))
+        es = get_client.return_value
+        es.msearch.side_effect = lambda body: {"responses": [RESPONSE] * (len(body) // 2)}
+
+        start = datetime(2018, 5, 1)
+        end = datetime(2018, 6, 30)
+        commits = git.Commits(ES_URL, "git", start=start, end=end)
+        # with other filters, so it is not planned in the same query as commits
+        authors = git.Authors(ES_URL, "git", start=start, end=end, esfilters={"project": "grimoirelab"})
+
+        batch = QueryBatch(ES_URL)
+        batch.add(commits, 'agg')
+        batch.execute()
+        self.assertEqual(len(es.msearch.call_args[1]['body']), 2)
+
+        items = [batch.add(commits, 'agg'), batch.add(authors, 'agg')]
+        batch.execute()
+        self.assertEqual(es.msearch.call_count, 2)
+        self.assertEqual(len(es.msearch.call_args[1]['body']), 2)
+        self.assertListEqual([item.result for item in items], [7, 7])
+
+        # all the queries are in the cache now
+        batch.add(authors, 'agg')
+        batch.execute()
+        self.assertEqual(es.msearch.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
@@ -23,6 +23,7 @@
 import os
 import sys
 import json
+import asyncio
 import unittest
 
 from datetime import datetime
@@ -36,7 +37,7 @@ from grimoire_elk.elk import feed_backend, enrich_backend
 # due to setuptools behaviour
 sys.path.insert(0, '..')
 
-from manuscripts2.elasticsearch import Query, Index
+from manuscripts2.elasticsearch import Query, Index, buckets_to_df
 
 # We are going to insert perceval's data into elasticsearch
 # So that we can test the the functions
@@ -350,6 +351,25 @@ class TestElasticsearch(unittest.TestCase):
         sum_lines_added = load_json_file(SUM_LINES_ADDED_BY_AUTHORS)
         self.assertEqual(sum_lines_added, buckets)
 
+    def test_stream_buckets(self):
+        """
+        Test whether all the buckets of the authors are fetched page by page
+        """
+
+        self.Query_test_object.get_sum(self.field3)\
+                              .by_authors(self.field2)\
+                              .since(start=self.start)\
+                              .until(end=self.end)
+
+        buckets = list(self.Query_test_object.stream_buckets(page_size=5))
+        keys = [bucket['key'] for bucket in buckets]
+        self.assertListEqual(keys, sorted(keys))
+        # the terms aggregation is still in the query
+        self.assertIn("terms_" + self.field2, self.Query_test_object.aggregations)
+
+        sum_lines_added = load_json_file(SUM_LINES_ADDED_BY_AUTHORS)
+        self.assertCountEqual(buckets, sum_lines_added['buckets'])
+
     def test_by_organizations(self):
         """
         Test nested aggregation wrt author organizations
@@ -400,6 +420,25 @@ class TestElasticsearch(unittest.TestCase):
 
         self.assertEqual(hash_by_period, buckets)
 
+    def test_last_periods(self):
+        """
+        Test whether the date histogram is limited to the last periods of its
+        interval and offset, in a copy of the query
+        """
+
+        end = datetime(2018, 5, 23)
+        self.Query_test_object.until(end=end)\
+                              .get_cardinality(self.field1)\
+                              .by_period()
+        agg_name, agg = list(self.Query_test_object.aggregations.items())[-1]
+        agg.offset = "+3d"
+        search = self.Query_test_object.search.to_dict()
+
+        query = self.Query_test_object.copy().last_periods(2)
+        date_range = query.search.to_dict()['query']['bool']['filter'][-1]['range']
+        self.assertEqual(date_range[self.date_field1], {"gte": datetime(2018, 4, 4).isoformat()})
+        self.assertEqual(self.Query_test_object.search.to_dict(), search)
+
     def test_multiple_aggregations(self):
         """
         Test if multiple aggregations can be added
@@ -467,6 +506,21 @@ class TestElasticsearch(unittest.TestCase):
         actual_response = load_json_file(FETCH_SOURCE_RESULTS_DATA1)
         self.assertEqual(response, actual_response['hits'])
 
+    def test_stream_results_from_source(self):
+        """
+        Testing if all the items are fetched page by page from index
+        """
+
+        self.Query_test_object.until(end=self.end)
+        items = list(self.Query_test_object.stream_results_from_source(self.field2, page_size=100))
+        actual_response = load_json_file(FETCH_SOURCE_RESULTS_DATA1)
+        self.assertEqual(len(items), NUM_COMMITS)
+        self.assertCountEqual(items, actual_response['hits'])
+
+        query = Query(self.github_index).until(end=self.end)
+        dfs = list(query.stream_results_from_source(self.field2, page_size=500, dataframe=True))
+        self.assertListEqual([len(df) for df in dfs], [500, 500, 209])
+
     def test_get_aggs(self):
         """
         Testing single valued aggregations
@@ -482,6 +536,54 @@ class TestElasticsearch(unittest.TestCase):
         num_authors = self.Query_test_object.get_aggs()
         self.assertEqual(NUM_AUTHORS, num_authors)
 
+    def test_get_aggs_async(self):
+        """
+        Testing single valued aggregations awaited in an event loop
+        """
+
+        commits = Query(self.github_index).until(end=self.end).get_cardinality(self.field1)
+        authors = Query(self.github_index).until(end=self.end).get_cardinality(self.field2)
+
+        async def get_aggs():
+            return await asyncio.gather(commits.get_aggs_async(), authors.get_aggs_async())
+
+        self.assertEqual(asyncio.run(get_aggs()), [NUM_COMMITS, NUM_AUTHORS])
+
+    def test_get_timeseries_async(self):
+        """
+        Test whether the async time series is the same as the sync one
+        """
+
+        ts = Query(self.github_index).until(end=self.end).get_cardinality(self.field1)\
+                                     .by_period().get_timeseries()
+        query = Query(self.github_index).until(end=self.end).get_cardinality(self.field1)\
+                                        .by_period()
+        self.assertDictEqual(asyncio.run(query.get_timeseries_async()), ts)
+
+    def test_buckets_to_df(self):
+        """
+        Test whether the buckets of nested aggregations are flattened in the DataFrame
+        """
+
+        authors = [{"key": "author1", "doc_count": 3, "0": {"value": 2}},
+                   {"key": "author2", "doc_count": 1, "0": {"value": 1}}]
+        buckets = [{"key": 1527811200000, "key_as_string": "2018-06-01T00:00:00.000Z",
+                    "doc_count": 4, "0": {"buckets": authors}},
+                   {"key": 1530403200000, "key_as_string": "2018-07-01T00:00:00.000Z",
+                    "doc_count": 0, "0": {"buckets": []}}]
+
+        df = buckets_to_df(buckets)
+        self.assertListEqual(list(df.columns), ["date_in_seconds", "0.key", "0.doc_count", "0.0"])
+        # July has no authors, but its row is kept
+        self.assertListEqual(list(df.index.strftime("%Y-%m-%d")), ["2018-06-01", "2018-06-01", "2018-07-01"])
+        self.assertListEqual(list(df["0.key"]), ["author1", "author2", 0])
+        self.assertListEqual(list(df["0.doc_count"]), [3, 1, 0])
+        self.assertListEqual(list(df["0.0"]), [2, 1, 0])
+
+        df = buckets_to_df(authors)
+        self.assertListEqual(list(df.columns), ["key", "doc_count", "0"])
+        self.assertListEqual(list(df["0"]), [2, 1])
+
     @classmethod
     def tearDownClass(cls):
         """
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import sys
+import unittest
+
+from datetime import datetime
+from unittest import mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esbatch import QueryBatch
+from manuscripts.metrics import git
+
+ES_URL = "http://localhost:9200"
+
+TS_RESPONSE = {
+    "hits": {"total": 10},
+    "aggregations": {
+        "1": {
+            "buckets": [
+                {"key": 1525132800000, "key_as_string": "2018-05-01T00:00:00.000Z",
+                 "doc_count": 4, "2": {"value": 3}},
+                {"key": 1527811200000, "key_as_string": "2018-06-01T00:00:00.000Z",
+                 "doc_count": 6, "2": {"value": 4}}
+            ]
+        }
+    }
+}
+
+LIST_RESPONSE = {
+    "hits": {"total": 10},
+    "aggregations": {
+        "1": {
+            "buckets": [
+                {"key": "Jane Doe", "doc_count": 7},
+                {"key": "John Smith", "doc_count": 3}
+            ]
+        }
+    }
+}
+
+
+class TestQueryBatch(unittest.TestCase):
+    """Tests for the batches of metric queries"""
+
+    def setUp(self):
+        self.start = datetime(2018, 5, 1)
+        self.end = datetime(2018, 6, 30)
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_execute(self, get_client):
+        """Test whether the queries are sent together and the responses parsed"""
+
+        es = get_client.return_value
+        es.msearch.return_value = {"responses": [TS_RESPONSE, LIST_RESPONSE]}
+
+        commits = git.Commits(ES_URL, "git", start=self.start, end=self.end)
+        authors = git.Authors(ES_URL, "git", start=self.start, end=self.end)
+
+        batch = QueryBatch(ES_URL)
+        ts = batch.add(commits, 'ts')
+        top = batch.add(authors, 'list')
+        results = []
+        batch.add_callback(lambda: results.append(ts.result['value']))
+
+        with self.assertRaises(RuntimeError):
+            ts.result
+
+        batch.execute()
+
+        self.assertEqual(es.msearch.call_count, 1)
+        body = es.msearch.call_args[1]['body']
+        self.assertEqual(len(body), 4)
+        self.assertDictEqual(body[0], {"index": "git"})
+        self.assertDictEqual(body[1], commits.get_query(True))
+        self.assertDictEqual(body[3], authors.get_list_query())
+
+        self.assertListEqual(ts.result['value'], [3, 4])
+        self.assertListEqual(ts.result['unixtime'], [1525132800, 1527811200])
+        self.assertListEqual(top.result['author_name'], ["Jane Doe", "John Smith"])
+        self.assertListEqual(results, [[3, 4]])
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_max_queries(self, get_client):
+        """Test whether the queries are split in several requests"""
+
+        es = get_client.return_value
+        es.msearch.side_effect = lambda body: {"responses": [TS_RESPONSE] * (len(body) // 2)}
+
+        batch = QueryBatch(ES_URL, max_queries=2)
+        items = []
+        for i in range(5):
+            # different indexes, so the metrics are not planned in the same query
+            commits = git.Commits(ES_URL, "git_%i" % i, start=self.start, end=self.end)
+            items.append(batch.add(commits, 'trend'))
+        batch.execute()
+
+        self.assertEqual(es.msearch.call_count, 3)
+        self.assertEqual(batch.requests, 3)
+        for item in items:
+            self.assertEqual(item.result, (4, 25))
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_plan(self, get_client):
+        """Test whether the metrics with the same index, dates and filters are computed in one query"""
+
+        es = get_client.return_value
+        es.msearch.return_value = {"responses": [{
+            "hits": {"total": 10},
+            "aggregations": {
+                "1": {
+                    "buckets": [
+                        {"key": 1525132800000, "key_as_string": "2018-05-01T00:00:00.000Z",
+                         "doc_count": 4, "2": {"value": 3}, "3": {"value": 2}},
+                        {"key": 1527811200000, "key_as_string": "2018-06-01T00:00:00.000Z",
+                         "doc_count": 6, "2": {"value": 4}, "3": {"value": 1}}
+                    ]
+                }
+            }
+        }, TS_RESPONSE]}
+
+        commits = git.Commits(ES_URL, "git", start=self.start, end=self.end)
+        authors = git.Authors(ES_URL, "git", start=self.start, end=self.end)
+        project_commits = git.Commits(ES_URL, "git", start=self.start, end=self.end,
+                                      esfilters={"project": "grimoirelab"})
+
+        batch = QueryBatch(ES_URL)
+        items = [batch.add(commits, 'ts'), batch.add(authors, 'ts'), batch.add(project_commits, 'ts')]
+        batch.execute()
+
+        body = es.msearch.call_args[1]['body']
+        self.assertEqual(len(body), 4)
+        histogram = body[1]['aggs'][1]
+        self.assertEqual(histogram['aggs'][2]['cardinality']['field'], commits.FIELD_COUNT)
+        self.assertEqual(histogram['aggs'][3]['cardinality']['field'], authors.FIELD_COUNT)
+        self.assertEqual(body[1]['query'], commits.get_query(True)['query'])
+        self.assertDictEqual(body[3], project_commits.get_query(True))
+
+        self.assertListEqual([item.result['value'] for item in items], [[3, 4], [2, 1], [3, 4]])
+        self.assertListEqual(items[1].result['unixtime'], [1525132800, 1527811200])
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_split(self, get_client):
+        """Test whether the queries for several projects are sent as one query split by project"""
+
+        bucket = dict(TS_RESPONSE['aggregations'], key="grimoirelab", doc_count=10)
+        es = get_client.return_value
+        es.msearch.side_effect = [
+            {"responses": [{"hits": {"total": 10}, "aggregations": {"split": {"buckets": [bucket]}}}]},
+            {"responses": [TS_RESPONSE]}
+        ]
+
+        batch = QueryBatch(ES_URL, split_field="project")
+        items = []
+        for project in ["grimoirelab", "perceval"]:
+            commits = git.Commits(ES_URL, "git", start=self.start, end=self.end,
+                                  esfilters={"project": project})
+            items.append(batch.add(commits, 'ts'))
+        batch.execute()
+
+        # perceval is not in the buckets, so its own query is sent
+        self.assertEqual(es.msearch.call_count, 2)
+        split_body, body = [call[1]['body'] for call in es.msearch.call_args_list]
+        commits = git.Commits(ES_URL, "git", start=self.start, end=self.end)
+        query = commits.get_query(True)
+        self.assertDictEqual(split_body[1]['query'], query['query'])
+        terms = split_body[1]['aggs']['split']
+        self.assertDictEqual(terms['terms'], {"field": "project", "include": ["grimoirelab", "perceval"],
+                                              "size": 2, "min_doc_count": 0})
+        self.assertDictEqual(terms['aggs'], query['aggs'])
+        self.assertDictEqual(body[1], items[1].metric.get_query(True))
+
+        self.assertListEqual([item.result['value'] for item in items], [[3, 4], [3, 4]])
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_error(self, get_client):
+        """Test whether an error in a query is raised"""
+
+        es = get_client.return_value
+        es.msearch.return_value = {"responses": [{"error": {"type": "index_not_found_exception"},
+                                                  "status": 404}]}
+
+        batch = QueryBatch(ES_URL)
+        batch.add(git.Commits(ES_URL, "git", start=self.start, end=self.end), 'agg')
+        with self.assertRaises(RuntimeError):
+            batch.execute()
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import sys
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esclient import ClientRegistry, get_client
+
+
+class TestClientRegistry(unittest.TestCase):
+    """Tests for the shared Elasticsearch clients"""
+
+    def setUp(self):
+        ClientRegistry.reset()
+
+    def tearDown(self):
+        ClientRegistry.reset()
+
+    def test_normalize_url(self):
+        """Test whether the URLs are converted to the same key"""
+
+        self.assertEqual(ClientRegistry.normalize_url("localhost:9200"), "http://localhost:9200")
+        self.assertEqual(ClientRegistry.normalize_url("http://localhost:9200/"), "http://localhost:9200")
+        self.assertEqual(ClientRegistry.normalize_url("https://es.example.com"), "https://es.example.com")
+        self.assertEqual(ClientRegistry.normalize_url(None), ClientRegistry.DEFAULT_URL)
+
+    def test_get_client(self):
+        """Test whether clients are shared between the same URLs"""
+
+        es1 = get_client("localhost:9200")
+        es2 = get_client("http://localhost:9200")
+        es3 = get_client("http://127.0.0.1:9200")
+
+        self.assertIs(es1, es2)
+        self.assertIsNot(es1, es3)
+        self.assertDictEqual(ClientRegistry.get_stats(), {"opened": 2, "reused": 1})
+
+    def test_configure(self):
+        """Test whether the connection params can be configured"""
+
+        maxsize = ClientRegistry.maxsize
+        try:
+            ClientRegistry.configure(maxsize=50, keep_alive=False)
+            params = ClientRegistry.get_params()
+            self.assertEqual(params['maxsize'], 50)
+            self.assertNotIn('headers', params)
+        finally:
+            ClientRegistry.configure(maxsize=maxsize, keep_alive=True)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import sys
+import unittest
+
+from datetime import datetime, timezone
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esbatch import QueryBatch
+from manuscripts.esclient import ClientRegistry
+from manuscripts.esexplain import ExplainClient, get_empty_response
+from manuscripts.esprojects import ProjectDiscovery
+from manuscripts.metrics import git, github_issues
+
+ES_URL = "http://localhost:9200"
+
+
+class TestExplainClient(unittest.TestCase):
+    """Tests for the client recording the queries of a report"""
+
+    def setUp(self):
+        ClientRegistry.reset()
+        self.es = ExplainClient()
+        ClientRegistry.set_client(ES_URL, self.es)
+
+    def tearDown(self):
+        ClientRegistry.reset()
+
+    def test_empty_response(self):
+        """Test whether the date histograms get their buckets without data"""
+
+        query = {
+            "query": {"range": {"grimoire_creation_date": {"gte": "2018-01-15T00:00:00+00:00",
+                                                           "lte": "2018-03-15T00:00:00+00:00"}}},
+            "aggs": {"1": {"date_histogram": {"field": "grimoire_creation_date", "interval": "month"},
+                           "aggs": {"2": {"terms": {"field": "author_uuid", "size": 5}}}}}
+        }
+        res, buckets = get_empty_response(query)
+
+        dates = [bucket['key_as_string'] for bucket in res['aggregations']['1']['buckets']]
+        self.assertListEqual(dates, ["2018-01-01T00:00:00.000Z", "2018-02-01T00:00:00.000Z",
+                                     "2018-03-01T00:00:00.000Z"])
+        self.assertListEqual(res['aggregations']['1']['buckets'][0]['2']['buckets'], [])
+        # each month with up to 5 authors
+        self.assertEqual(buckets, 3 * (1 + 5))
+
+    def test_summary(self):
+        """Test whether the queries of a batch are recorded without connecting to Elasticsearch"""
+
+        start = datetime(2018, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2018, 6, 30, tzinfo=timezone.utc)
+        commits = git.Commits(ES_URL, "git", start=start, end=end)
+        authors = git.Authors(ES_URL, "git", start=start, end=end, esfilters={"project": "grimoirelab"})
+
+        batch = QueryBatch(ES_URL)
+        item = batch.add(commits, 'ts')
+        batch.add(authors, 'agg')
+        batch.execute()
+        # the same query in another batch
+        batch = QueryBatch(ES_URL)
+        batch.add(authors, 'agg')
+        batch.execute()
+
+        self.assertListEqual(item.result['value'], [0] * 6)
+        self.assertEqual(self.es.requests, 2)
+        summary = self.es.get_summary()
+        self.assertIn("Queries: 3 in 2 requests (2 unique, 1 duplicated)", summary)
+        self.assertIn("2 times query 2 to git", summary)
+
+    def test_projects(self):
+        """Test whether the projects given are found, and their queries split by project recorded"""
+
+        self.es = ExplainClient(projects=["grimoirelab", "perceval"])
+        ClientRegistry.set_client(ES_URL, self.es)
+
+        start = datetime(2018, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2018, 6, 30, tzinfo=timezone.utc)
+        sources = [git.Projects(ES_URL, "git", start=start),
+                   github_issues.Projects(ES_URL, "github", start=start)]
+        discovery = ProjectDiscovery(ES_URL, sources, end=end)
+        self.assertListEqual(discovery.get_projects(), ["grimoirelab", "perceval"])
+        counts = discovery.get_range_counts()
+        self.assertDictEqual(counts["perceval"], {"git": 1, "github_issues": 1})
+
+        batch = QueryBatch(ES_URL, split_field="project")
+        items = []
+        for project in ["perceval", "kibiter"]:
+            commits = git.Commits(ES_URL, "git", start=start, end=end, esfilters={"project": project})
+            items.append(batch.add(commits, 'ts'))
+        batch.execute()
+
+        # discovery and range counts in each index, and the split query
+        # plus the one of kibiter, which is not found in the split one
+        self.assertEqual(len(self.es.queries), 2 + 2 + 2)
+        self.assertListEqual([item.result['value'] for item in items], [[0] * 6, [0] * 6])
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
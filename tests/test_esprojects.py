@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import json
+import sys
+import unittest
+
+from datetime import datetime
+from unittest import mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esprojects import ProjectDiscovery
+from manuscripts.metrics import git, github_issues, github_prs
+
+ES_URL = "http://localhost:9200"
+
+
+def projects_response(counts, after_key=None, composite=True):
+    """Build the response to a projects query from the counts of each project"""
+
+    buckets = []
+    for project, sources in counts.items():
+        source_buckets = {name: {"doc_count": count} for name, count in sources.items()}
+        key = {"project": project} if composite else project
+        buckets.append({"key": key, "doc_count": sum(sources.values()),
+                        "sources": {"buckets": source_buckets}})
+    agg = {"buckets": buckets}
+    if after_key:
+        agg['after_key'] = after_key
+    return {"hits": {"total": 10}, "aggregations": {"projects": agg}}
+
+
+class TestProjectDiscovery(unittest.TestCase):
+    """Tests for the discovery of the projects"""
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_get_counts(self, get_client):
+        """Test whether the projects of all the data sources are fetched page by page"""
+
+        es = get_client.return_value
+        es.msearch.side_effect = [
+            {"responses": [
+                projects_response({"perceval": {"git": 5}}, after_key={"project": "perceval"}),
+                projects_response({"grimoirelab": {"github_issues": 2, "github_prs": 0}})
+            ]},
+            {"responses": [projects_response({"sortinghat": {"git": 0}})]}
+        ]
+
+        start = datetime(2018, 1, 1)
+        sources = [git.Projects(ES_URL, "git", start=start),
+                   github_issues.Projects(ES_URL, "github", start=start),
+                   github_prs.Projects(ES_URL, "github", start=start)]
+        discovery = ProjectDiscovery(ES_URL, sources, page_size=1)
+
+        counts = discovery.get_counts()
+        self.assertListEqual(list(counts), ["grimoirelab", "perceval", "sortinghat"])
+        self.assertDictEqual(dict(counts["grimoirelab"]), {"git": 0, "github_issues": 2, "github_prs": 0})
+        self.assertDictEqual(dict(counts["perceval"]), {"git": 5, "github_issues": 0, "github_prs": 0})
+        self.assertListEqual(discovery.get_projects(), ["grimoirelab", "perceval"])
+
+        # One query per index, and just the index with more projects in the second page
+        self.assertEqual(es.msearch.call_count, 2)
+        first, second = [call[1]['body'] for call in es.msearch.call_args_list]
+        self.assertListEqual([first[0], first[2], second[0]], [{"index": "git"}, {"index": "github"}, {"index": "git"}])
+        filters = first[3]['aggs']['projects']['aggs']['sources']['filters']['filters']
+        self.assertListEqual(list(filters), ["github_issues", "github_prs"])
+        self.assertDictEqual(second[1]['aggs']['projects']['composite']['after'], {"project": "perceval"})
+
+        # The projects are discovered just once
+        discovery.get_projects()
+        self.assertEqual(es.msearch.call_count, 2)
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_get_range_counts(self, get_client):
+        """Test whether the items in range of each data source are counted in one request"""
+
+        es = get_client.return_value
+        es.msearch.side_effect = [
+            {"responses": [projects_response({"grimoirelab": {"git": 3}, "perceval": {"git": 5}}),
+                           projects_response({"perceval": {"github_issues": 1}})]},
+            {"responses": [
+                projects_response({"perceval": {"git": 2}}, composite=False),
+                projects_response({"perceval": {"github_issues": 0}}, composite=False)
+            ]}
+        ]
+
+        start = datetime(2018, 1, 1)
+        end = datetime(2018, 6, 30)
+        sources = [git.Projects(ES_URL, "git", start=start),
+                   github_issues.Projects(ES_URL, "github", start=start)]
+        date_fields = {"github_issues": ["grimoire_creation_date", "closed_at"]}
+        discovery = ProjectDiscovery(ES_URL, sources, end=end, date_fields=date_fields)
+
+        counts = discovery.get_range_counts()
+        self.assertDictEqual(dict(counts["grimoirelab"]), {"git": 0, "github_issues": 0})
+        self.assertDictEqual(dict(counts["perceval"]), {"git": 2, "github_issues": 0})
+        self.assertEqual(es.msearch.call_count, 2)
+
+        body = es.msearch.call_args[1]['body']
+        terms = body[1]['aggs']['projects']['terms']
+        self.assertDictEqual(terms, {"field": "project", "include": ["grimoirelab", "perceval"], "size": 2})
+        # An item of GitHub issues is in range if it is created or closed in range
+        issues_filter = body[3]['aggs']['projects']['aggs']['sources']['filters']['filters']['github_issues']
+        ranges = [query['bool']['filter'] for query in issues_filter['bool']['should']]
+        self.assertIn('grimoire_creation_date', json.dumps(ranges[0]))
+        self.assertIn('closed_at', json.dumps(ranges[1]))
+        self.assertIn(end.isoformat(), json.dumps(ranges[1]))
+
+        discovery.get_range_counts()
+        self.assertEqual(es.msearch.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
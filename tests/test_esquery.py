@@ -25,12 +25,13 @@ import unittest
 
 from datetime import datetime
 from collections import OrderedDict
+from unittest import mock
 
 # Hack to make sure that tests import the right packages
 # due to setuptools behaviour
 sys.path.insert(0, '..')
 
-from manuscripts.esquery import ElasticQuery
+from manuscripts.esquery import ElasticQuery, get_first_dates_of_indexes, get_periods_start
 
 
 def sort_order(query):
@@ -424,6 +425,140 @@ class TestEsquery(unittest.TestCase):
                                              end=self.end, filters=self.filters, agg_type="cardinality",
                                              offset=None, interval=self.interval), test_agg_dict2)
 
+    def test_get_agg_template(self):
+        """Test whether the queries with the same structure are built from the same template"""
+
+        get_template = self.es._ElasticQuery__get_agg_template
+        get_template.cache_clear()
+
+        for project, start in [("grimoirelab", self.start), ("perceval", datetime(2016, 1, 1, 12, 30))]:
+            filters = OrderedDict(self.filters)
+            filters['project'] = project
+            for interval in [None, self.interval]:
+                query = self.es.get_agg(field=self.field, date_field=self.date_field, start=start,
+                                        end=self.end, filters=filters, agg_type="cardinality",
+                                        interval=interval)
+                expected = self.es._ElasticQuery__build_agg(field=self.field, date_field=self.date_field,
+                                                            start=start, end=self.end, filters=filters,
+                                                            agg_type="cardinality", interval=interval)
+                self.assertDictEqual(query, expected)
+
+        # one template with interval and other without it, for both projects
+        self.assertEqual(get_template.cache_info().misses, 2)
+        self.assertEqual(get_template.cache_info().hits, 2)
+
+    def test_get_agg_filters(self):
+        """Test the aggregation of several sets of filters in a single query"""
+
+        sets = OrderedDict()
+        sets['set1'] = {"name4": "value4"}
+        sets['set2'] = {}
+        aggs = [(self.field, self.date_field, "count", sets)]
+        filters = {"name1": "value1"}
+
+        test_agg_dict = {
+            "query": {
+                "bool": {
+                    "must": [{"match_phrase": {"name1": "value1"}}]
+                }
+            },
+            "aggs": {
+                1: {
+                    "filter": {
+                        "range": {
+                            "DATE_FIELD": {
+                                "gte": "2017-05-23T00:00:00",
+                                "lte": "2018-05-23T00:00:00"
+                            }
+                        }
+                    },
+                    "aggs": {
+                        1: {
+                            "date_histogram": {
+                                "field": "DATE_FIELD",
+                                "interval": "1y",
+                                "time_zone": "UTC",
+                                "min_doc_count": 0,
+                                "extended_bounds": {
+                                    "min": 1495497600000.0,
+                                    "max": 1527033600000.0
+                                }
+                            },
+                            "aggs": {
+                                2: {
+                                    "filters": {
+                                        "filters": {
+                                            "set1": {"bool": {"must": [{"match_phrase": {"name4": "value4"}}]}},
+                                            "set2": {"match_all": {}}
+                                        }
+                                    },
+                                    "aggs": {
+                                        3: {
+                                            "cardinality": {
+                                                "field": "AGG_FIELD",
+                                                "precision_threshold": 3000
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "size": 0
+        }
+        self.assertDictEqual(self.es.get_agg_filters(aggs, start=self.start, end=self.end,
+                                                     filters=filters, interval=self.interval),
+                             test_agg_dict)
+
+        # without interval the filters aggregation is just inside the range one
+        query = self.es.get_agg_filters(aggs, start=self.start, end=self.end, filters=filters)
+        self.assertDictEqual(query['aggs'][1]['aggs'],
+                             test_agg_dict['aggs'][1]['aggs'][1]['aggs'])
+
+    def test_get_periods_start(self):
+        """Test the start of the last periods of a date histogram"""
+
+        end = datetime(2018, 5, 23, 23, 59, 59)
+        self.assertEqual(get_periods_start(end, "month"), datetime(2018, 4, 1))
+        self.assertEqual(get_periods_start(end, "1M", periods=3), datetime(2018, 3, 1))
+        self.assertEqual(get_periods_start(end, "quarter"), datetime(2018, 1, 1))
+        self.assertEqual(get_periods_start(end, "year"), datetime(2017, 1, 1))
+        self.assertEqual(get_periods_start(end, "week"), datetime(2018, 5, 14))
+        # intervals start offset days after the calendar ones
+        self.assertEqual(get_periods_start(end, "month", offset="+31d"), datetime(2018, 4, 2))
+        self.assertEqual(get_periods_start(end, "month", offset="-2d"), datetime(2018, 3, 29))
+        # not calendar intervals
+        self.assertIsNone(get_periods_start(end, "30d"))
+
+    @mock.patch('manuscripts.esquery.get_client')
+    def test_get_first_dates_of_indexes(self, get_client):
+        """Test whether the first date of several indexes is queried in one request"""
+
+        def min_response(date):
+            value = {"value": None} if date is None else {"value": 0, "value_as_string": date}
+            return {"hits": {"total": 10}, "aggregations": {"1": value}}
+
+        es = get_client.return_value
+        es.msearch.side_effect = [
+            {"responses": [min_response("2016-03-02T10:00:00.000Z"), min_response(None)]},
+            {"responses": [min_response("2015-01-01T00:00:00.000Z")]}
+        ]
+
+        url = "http://first-dates:9200"
+        dates = get_first_dates_of_indexes(url, ["git", "gerrit"])
+        self.assertDictEqual(dates, {"git": "2016-03-02", "gerrit": None})
+        body = es.msearch.call_args[1]['body']
+        self.assertListEqual(body[0::2], [{"index": "git"}, {"index": "gerrit"}])
+        self.assertDictEqual(body[1]['aggs'], {"1": {"min": {"field": "grimoire_creation_date"}}})
+
+        # Just the new index is queried
+        dates = get_first_dates_of_indexes(url, ["mbox", "git"])
+        self.assertDictEqual(dates, {"mbox": "2015-01-01", "git": "2016-03-02"})
+        self.assertEqual(es.msearch.call_count, 2)
+        self.assertListEqual(es.msearch.call_args[1]['body'][0::2], [{"index": "mbox"}])
+
 
 if __name__ == "__main__":
     # logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(message)s')
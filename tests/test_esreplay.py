@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from datetime import datetime, timezone
+from unittest import mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esbatch import QueryBatch
+from manuscripts.esclient import ClientRegistry
+from manuscripts.esreplay import ReplayClient, SyntheticClient
+from manuscripts.metrics import git
+
+ES_URL = "http://localhost:9200"
+
+START = datetime(2018, 1, 1, tzinfo=timezone.utc)
+END = datetime(2018, 6, 30, tzinfo=timezone.utc)
+
+
+def compute(kinds):
+    """Compute the commits and the projects with a batch, returning their values"""
+
+    commits = git.Commits(ES_URL, "git", start=START, end=END)
+    projects = git.Projects(ES_URL, "git", start=START, end=END)
+    batch = QueryBatch(ES_URL)
+    items = [batch.add(commits, kinds[0]), batch.add(projects, kinds[1])]
+    batch.execute()
+    return [item.result for item in items]
+
+
+class TestSyntheticClient(unittest.TestCase):
+    """Tests for the client answering with synthetic responses"""
+
+    def tearDown(self):
+        ClientRegistry.reset()
+
+    def test_projects_months(self):
+        """Test whether the responses have the projects and months of the items"""
+
+        ClientRegistry.set_client(ES_URL, SyntheticClient(projects=3, months=3, end=END))
+        ts, projects = compute(['ts', 'list'])
+
+        self.assertListEqual(projects['project'], ["project-0", "project-1", "project-2"])
+        self.assertEqual(len(ts['value']), 6)
+        # just the last three months have items
+        self.assertListEqual(ts['value'][:3], [0, 0, 0])
+
+        # the same queries get the same responses
+        ClientRegistry.set_client(ES_URL, SyntheticClient(projects=3, months=3, end=END))
+        self.assertListEqual(compute(['ts', 'list']), [ts, projects])
+
+
+class TestReplayClient(unittest.TestCase):
+    """Tests for the client answering with recorded responses"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        self.file_path = os.path.join(self.data_dir, 'responses.json')
+
+    def tearDown(self):
+        ClientRegistry.reset()
+        shutil.rmtree(self.data_dir)
+
+    def test_record_replay(self):
+        """Test whether the recorded responses are replayed without Elasticsearch"""
+
+        es = mock.Mock(wraps=SyntheticClient(projects=2, months=6, end=END))
+        client = ReplayClient(self.file_path, es=es)
+        ClientRegistry.set_client(ES_URL, client)
+        recorded = compute(['agg', 'list'])
+        self.assertEqual(es.search.call_count, 2)
+        client.save()
+
+        ClientRegistry.set_client(ES_URL, ReplayClient(self.file_path))
+        self.assertListEqual(compute(['agg', 'list']), recorded)
+
+        # a query not recorded
+        with self.assertRaises(RuntimeError):
+            compute(['ts', 'list'])
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
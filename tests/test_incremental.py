@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import shutil
+import sys
+import tempfile
+import unittest
+
+from datetime import datetime, timezone
+from unittest import mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esbatch import QueryBatch
+from manuscripts.incremental import TimeSeriesStore
+from manuscripts.metrics import git
+
+ES_URL = "http://localhost:9200"
+
+MAY = 1525132800
+JUNE = 1527811200
+JULY = 1530403200
+
+
+def ts_response(buckets):
+    """Build the response for a time series query with a value for each (unixtime, value)"""
+    return {
+        "hits": {"total": 10},
+        "aggregations": {"1": {"buckets": [
+            {"key": unixtime * 1000,
+             "key_as_string": datetime.fromtimestamp(unixtime, timezone.utc).isoformat(),
+             "doc_count": value, "2": {"value": value}}
+            for unixtime, value in buckets]}}
+    }
+
+
+class TestTimeSeriesStore(unittest.TestCase):
+    """Tests for the time series of previous reports"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        self.start = datetime(2018, 5, 1, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_merge(self):
+        """Test whether the stored periods before since are kept"""
+
+        stored = {"date": ["may", "june"], "value": [1, 2], "unixtime": [MAY, JUNE]}
+        new = {"date": ["june", "july"], "value": [3, 4], "unixtime": [JUNE, JULY]}
+        since = datetime(2018, 6, 1, tzinfo=timezone.utc)
+
+        ts = TimeSeriesStore.merge(stored, new, since)
+        self.assertDictEqual(ts, {"date": ["may", "june", "july"], "value": [1, 3, 4],
+                                  "unixtime": [MAY, JUNE, JULY]})
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_add_ts(self, get_client):
+        """Test whether just the periods from the last stored one are queried"""
+
+        es = get_client.return_value
+
+        # First report, until June
+        es.msearch.return_value = {"responses": [ts_response([(MAY, 1), (JUNE, 2)])]}
+        store = TimeSeriesStore(self.data_dir)
+        commits = git.Commits(ES_URL, "git", start=self.start,
+                              end=datetime(2018, 6, 15, tzinfo=timezone.utc))
+        batch = QueryBatch(ES_URL)
+        item = store.add_ts(batch, commits)
+        batch.execute()
+        self.assertListEqual(item.result['value'], [1, 2])
+        store.save()
+
+        # Next report, until July, reading the stored time series
+        es.msearch.return_value = {"responses": [ts_response([(JUNE, 3), (JULY, 4)])]}
+        store = TimeSeriesStore(self.data_dir)
+        commits = git.Commits(ES_URL, "git", start=self.start,
+                              end=datetime(2018, 7, 15, tzinfo=timezone.utc))
+        batch = QueryBatch(ES_URL)
+        item = store.add_ts(batch, commits)
+        batch.execute()
+
+        query = es.msearch.call_args[1]['body'][1]
+        date_range = query['query']['bool']['filter'][0]['range']['grimoire_creation_date']
+        self.assertEqual(date_range['gte'], "2018-06-01T00:00:00+00:00")
+        self.assertListEqual(item.result['value'], [1, 3, 4])
+        self.assertListEqual(item.result['unixtime'], [MAY, JUNE, JULY])
+
+        # A different start date needs the full time series
+        commits = git.Commits(ES_URL, "git", start=datetime(2018, 4, 1, tzinfo=timezone.utc),
+                              end=datetime(2018, 7, 15, tzinfo=timezone.utc))
+        batch = QueryBatch(ES_URL)
+        store.add_ts(batch, commits)
+        self.assertIs(batch.items[0].metric, commits)
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import sys
+import unittest
+
+from datetime import datetime
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.metrics import gerrit, git
+
+ES_URL = "http://localhost:9200"
+
+
+def ts_bucket(key, key_as_string, values):
+    """Build a date_histogram bucket with a filters aggregation"""
+    return {"key": key, "key_as_string": key_as_string, "doc_count": sum(values.values()),
+            "2": {"buckets": {name: {"doc_count": value, "3": {"value": value}}
+                              for name, value in values.items()}}}
+
+
+class TestCompositeMetrics(unittest.TestCase):
+    """Tests for the metrics computed from other metrics in a single query"""
+
+    def setUp(self):
+        self.start = datetime(2018, 5, 1)
+        self.end = datetime(2018, 6, 30)
+        self.bmi = gerrit.BMI(ES_URL, "gerrit", start=self.start, end=self.end,
+                              esfilters={"project": "grimoirelab"})
+
+    def test_get_query(self):
+        """Test whether the submetrics are grouped by date field in one query"""
+
+        query = self.bmi.get_query(True)
+
+        self.assertDictEqual(query['query'],
+                             {"bool": {"must": [{"match_phrase": {"project": "grimoirelab"}}]}})
+        # merged and abandoned use the closed date, submitted the creation date
+        closed = query['aggs'][1]
+        self.assertEqual(closed['aggs'][1]['date_histogram']['field'], 'closed')
+        self.assertListEqual(sorted(closed['aggs'][1]['aggs'][2]['filters']['filters']),
+                             ['abandoned', 'merged'])
+        submitted = query['aggs'][2]
+        self.assertEqual(submitted['aggs'][1]['date_histogram']['field'], 'grimoire_creation_date')
+        self.assertDictEqual(submitted['aggs'][1]['aggs'][2]['filters']['filters'],
+                             {"submitted": {"match_all": {}}})
+
+    def test_parse_ts(self):
+        """Test whether the time series is computed from the buckets of each submetric"""
+
+        res = {
+            "hits": {"total": 20},
+            "aggregations": {
+                "1": {
+                    "doc_count": 10,
+                    "1": {"buckets": [
+                        ts_bucket(1525132800000, "2018-05-01T00:00:00.000Z", {"merged": 2, "abandoned": 1}),
+                        ts_bucket(1527811200000, "2018-06-01T00:00:00.000Z", {"merged": 3, "abandoned": 3})
+                    ]}
+                },
+                "2": {
+                    "doc_count": 10,
+                    "1": {"buckets": [
+                        ts_bucket(1525132800000, "2018-05-01T00:00:00.000Z", {"submitted": 4}),
+                        ts_bucket(1527811200000, "2018-06-01T00:00:00.000Z", {"submitted": 0})
+                    ]}
+                }
+            }
+        }
+
+        ts = self.bmi.parse_ts(res)
+
+        self.assertListEqual(ts['value'], [0.75, 0])
+        self.assertListEqual(ts['unixtime'], [1525132800, 1527811200])
+
+    def test_parse_agg(self):
+        """Test whether the aggregated value is computed from the buckets of each submetric"""
+
+        res = {
+            "hits": {"total": 20},
+            "aggregations": {
+                "1": {"doc_count": 10,
+                      "2": {"buckets": {"merged": {"doc_count": 5, "3": {"value": 5}},
+                                        "abandoned": {"doc_count": 1, "3": {"value": 1}}}}},
+                "2": {"doc_count": 10,
+                      "2": {"buckets": {"submitted": {"doc_count": 8, "3": {"value": 8}}}}}
+            }
+        }
+
+        self.assertEqual(self.bmi.parse_agg(res), 0.75)
+
+
+class TestTrend(unittest.TestCase):
+    """Tests for the trend of the metrics"""
+
+    def test_get_trend_query(self):
+        """Test whether just the last two intervals are queried for the trend"""
+
+        start = datetime(2010, 1, 1)
+        end = datetime(2018, 6, 30, 23, 59, 59)
+
+        commits = git.Commits(ES_URL, "git", start=start, end=end, interval="quarter")
+        query = commits.get_trend_query()
+        date_range = query['query']['bool']['filter'][0]['range']['grimoire_creation_date']
+        self.assertEqual(date_range['gte'], datetime(2018, 1, 1).isoformat())
+        self.assertEqual(date_range['lte'], end.isoformat())
+        self.assertEqual(commits.start, start)
+
+        # the time series is shorter than two intervals
+        commits = git.Commits(ES_URL, "git", start=datetime(2018, 6, 1), end=end,
+                              interval="month")
+        self.assertDictEqual(commits.get_trend_query(), commits.get_query(True))
+
+    def test_calc_trend(self):
+        """Test the trend between the last two values"""
+
+        self.assertEqual(git.Commits.calc_trend({"value": [8, 4, 5]}), (5, 20))
+        self.assertEqual(git.Commits.calc_trend({"value": [4, 0]}), (0, -100))
+        self.assertEqual(git.Commits.calc_trend({"value": [0, 0]}), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
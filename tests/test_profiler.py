@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from datetime import datetime
+from unittest import mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.esbatch import QueryBatch
+from manuscripts.metrics import git
+from manuscripts.profiler import QueryProfiler, set_profiler
+
+ES_URL = "http://localhost:9200"
+
+RESPONSE = {"took": 20, "hits": {"total": 10},
+            "aggregations": {"1": {"buckets": [{"key": "a", "doc_count": 5, "2": {"buckets": []}},
+                                               {"key": "b", "doc_count": 5, "2": {"buckets": [{}]}}]}}}
+
+
+class TestQueryProfiler(unittest.TestCase):
+    """Tests for the profile of the metric queries"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='manuscripts_')
+        self.profiler = QueryProfiler()
+        set_profiler(self.profiler)
+
+    def tearDown(self):
+        set_profiler(None)
+        shutil.rmtree(self.data_dir)
+
+    def test_count_buckets(self):
+        """Test whether the buckets of the nested aggregations are counted"""
+
+        self.assertEqual(QueryProfiler.count_buckets(RESPONSE['aggregations']), 3)
+        self.assertEqual(QueryProfiler.count_buckets(None), 0)
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_batch(self, get_client):
+        """Test whether the queries of a batch are profiled for each metric and project"""
+
+        es = get_client.return_value
+        es.msearch.side_effect = lambda body: {"responses": [{"took": 10, "hits": {"total": 10},
+                                                              "aggregations": {"1": {"value": 7}}},
+                                                             RESPONSE]}
+
+        start = datetime(2018, 5, 1)
+        end = datetime(2018, 6, 30)
+        commits = git.Commits(ES_URL, "git", start=start, end=end)
+        authors = git.Authors(ES_URL, "git", start=start, end=end, esfilters={"project": "grimoirelab"})
+
+        batch = QueryBatch(ES_URL)
+        batch.add(commits, 'agg')
+        batch.add(authors, 'list')
+        batch.execute()
+
+        queries = self.profiler.queries
+        self.assertListEqual([query['metric'] for query in queries], ["git.Commits", "git.Authors"])
+        self.assertListEqual([query['project'] for query in queries], [None, "grimoirelab"])
+        self.assertListEqual([query['took'] for query in queries], [0.01, 0.02])
+        self.assertEqual(queries[1]['buckets'], 3)
+        self.assertEqual(queries[1]['bytes'], len(json.dumps(RESPONSE)))
+        # the second query took twice the time in Elasticsearch
+        self.assertAlmostEqual(queries[1]['wall_time'], 2 * queries[0]['wall_time'])
+
+        profile = self.profiler.get_metrics_profile()
+        self.assertEqual(profile[0]['metric'], "git.Authors")
+        self.assertIn("git.Authors", self.profiler.get_summary())
+
+        self.profiler.write(self.data_dir)
+        with open(os.path.join(self.data_dir, QueryProfiler.JSON_FILE)) as f:
+            self.assertEqual(len(json.load(f)['queries']), 2)
+        with open(os.path.join(self.data_dir, QueryProfiler.CSV_FILE)) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows[1]['project'], "grimoirelab")
+
+    @mock.patch('manuscripts.esbatch.get_client')
+    def test_split(self, get_client):
+        """Test whether the projects of a query split by project are profiled"""
+
+        buckets = [{"key": project, "doc_count": 5, "1": {"value": 7}} for project in ["grimoirelab", "perceval"]]
+        es = get_client.return_value
+        es.msearch.return_value = {"responses": [{"took": 10, "hits": {"total": 10},
+                                                  "aggregations": {"split": {"buckets": buckets}}}]}
+
+        start = datetime(2018, 5, 1)
+        end = datetime(2018, 6, 30)
+        batch = QueryBatch(ES_URL, split_field="project")
+        for project in ["grimoirelab", "perceval"]:
+            batch.add(git.Commits(ES_URL, "git", start=start, end=end, esfilters={"project": project}), 'agg')
+        batch.execute()
+
+        queries = self.profiler.queries
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]['metric'], "git.Commits")
+        self.assertEqual(queries[0]['project'], "grimoirelab+perceval")
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
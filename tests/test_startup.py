@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import os
+import subprocess
+import sys
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.report import CHART_BACKENDS, Report
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANUSCRIPTS = os.path.join(BASE_DIR, 'bin', 'manuscripts')
+
+
+def get_import_times(args):
+    """
+    Run manuscripts with -X importtime and get the modules imported at startup
+
+    :param args: list with the command line params for manuscripts
+    :return: a list of (module, depth, microseconds) tuples, with the depth of each
+             module in the tree of imports and the cumulative time importing it
+    """
+    res = subprocess.run([sys.executable, '-X', 'importtime', MANUSCRIPTS] + args,
+                         cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                         universal_newlines=True, check=True)
+    times = []
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        # The imported modules are indented two spaces more than the importer one
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), depth, int(cumulative)))
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    """Tests for the modules imported when the command line starts"""
+
+    IMPORT_BUDGET = 1.0  # max seconds importing modules in manuscripts --help
+    LAZY_MODULES = ['numpy', 'matplotlib', 'prettyplotlib', 'pandas', 'elasticsearch',
+                    'elasticsearch_dsl', 'grimoire_elk', 'manuscripts.metrics.git',
+                    'manuscripts.timeseries', 'manuscripts.mplchart', 'manuscripts.epschart']
+
+    def test_help(self):
+        """Test whether the slow modules are not imported to show the help"""
+
+        times = get_import_times(['--help'])
+        modules = [module for module, depth, cumulative in times]
+        self.assertIn('manuscripts.report', modules)
+        for module in self.LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+        seconds = sum(cumulative for module, depth, cumulative in times if depth == 0) / 10 ** 6
+        self.assertLess(seconds, self.IMPORT_BUDGET)
+
+    def test_lazy_classes(self):
+        """Test whether the data source classes are imported when they are used"""
+
+        self.assertEqual(len(Report.ds2class), 7)
+        git = Report.ds2class['git']
+        self.assertEqual(git.__module__, 'manuscripts.metrics.git')
+        self.assertEqual(Report.class2ds[git], 'git')
+        self.assertEqual(Report.ds2index[git], Report.GIT_INDEX)
+        self.assertEqual(Report.ds2index[Report.ds2class['mailinglist']], Report.EMAIL_INDEX)
+        with self.assertRaises(KeyError):
+            Report.ds2index[Report]
+
+    def test_lazy_chart_backends(self):
+        """Test whether the chart backends are imported when they are used"""
+
+        self.assertListEqual(sorted(CHART_BACKENDS), ['eps', 'figure', 'pyplot'])
+        self.assertEqual(CHART_BACKENDS['eps'].name, 'eps')
+        self.assertEqual(CHART_BACKENDS['pyplot'].__module__, 'manuscripts.mplchart')
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')
@@ -21,6 +21,7 @@
 #     Alvaro del Castillo <acs@bitergia.com>
 
 
+import json
 import os
 import sys
 import shutil
@@ -28,17 +29,34 @@ import tempfile
 import unittest
 import subprocess
 
+from collections import OrderedDict
+from unittest import mock
+
 from dateutil import parser
 
 # Hack to make sure that tests import the right packages
 # due to setuptools behaviour
 sys.path.insert(0, '..')
 
+from manuscripts.epschart import EPSBackend
+from manuscripts.esclient import ClientRegistry
+from manuscripts.esreplay import SyntheticClient
 from manuscripts.report import Report
 
 CONF_FILE = 'test.cfg'
 
 
+def read_files(path):
+    """Read the content of the files in the data and figs dirs of a report"""
+
+    files = {}
+    for dir_name in ['data', 'figs']:
+        for file_name in sorted(os.listdir(os.path.join(path, dir_name))):
+            with open(os.path.join(path, dir_name, file_name)) as f:
+                files[os.path.join(dir_name, file_name)] = f.read()
+    return files
+
+
 class TestReport(unittest.TestCase):
     """Basic tests for the Report class """
 
@@ -134,6 +152,108 @@ class TestReport(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             Report.build_period_name(period_date, interval="day")
 
+    def test_eps_backend(self):
+        """Test whether the bar charts are written directly as EPS files"""
+
+        temp_path = tempfile.mkdtemp(prefix='manuscripts_')
+        file_name = os.path.join(temp_path, "figs", "commits.eps")
+
+        EPSBackend.bar_chart("Commits (árbol)", ["18-01", "18-02", "18-03"], [1, None, 3], file_name,
+                             [2, 4, 0], legend=["Opened", "Closed"])
+
+        with open(file_name) as f:
+            eps = f.read()
+        self.assertTrue(eps.startswith("%!PS-Adobe-3.0 EPSF-3.0\n"))
+        self.assertIn("(Commits \\(\\341rbol\\))", eps)
+        self.assertIn("(18-02)", eps)
+        self.assertIn("(Closed)", eps)
+        # the bars, one per value, and the two legend boxes
+        self.assertEqual(eps.count("rectfill"), 8)
+        self.assertTrue(eps.endswith("showpage\n%%EOF\n"))
+
+        shutil.rmtree(temp_path)
+
+    def test_draw_chart(self):
+        """Test whether the charts drawn with the same data are not drawn again"""
+
+        temp_path = tempfile.mkdtemp(prefix='manuscripts_')
+        file_name = os.path.join(temp_path, "figs", "commits.eps")
+        report = Report(self.es_url, self.start, self.end, data_dir=temp_path,
+                        data_sources=self.data_sources, render_workers=0, chart_backend='eps')
+
+        with mock.patch.object(EPSBackend, 'write_chart', wraps=EPSBackend.write_chart) as write_chart:
+            report.draw_chart(report.chart_backend.bar_chart, "Commits", ["18-01"], [1], file_name)
+            report.draw_chart(report.chart_backend.bar_chart, "Commits", ["18-01"], [1], file_name)
+            self.assertEqual(write_chart.call_count, 1)
+
+            report.draw_chart(report.chart_backend.bar_chart, "Commits", ["18-01"], [2], file_name)
+            self.assertEqual(write_chart.call_count, 2)
+
+        self.assertListEqual(list(report.render_times), [file_name])
+
+        shutil.rmtree(temp_path)
+
+    def test_render_workers(self):
+        """Test whether the charts are drawn in other processes, and their errors raised"""
+
+        temp_path = tempfile.mkdtemp(prefix='manuscripts_')
+        commits = os.path.join(temp_path, "figs", "commits.eps")
+        authors = os.path.join(temp_path, "figs", "authors.eps")
+        report = Report(self.es_url, self.start, self.end, data_dir=temp_path,
+                        data_sources=self.data_sources, render_workers=2, chart_backend='eps')
+
+        def draw_charts(file_names):
+            for file_name in file_names:
+                report.draw_chart(report.chart_backend.bar_chart, "Chart", ["18-01", "18-02"], [1, 2], file_name)
+
+        with mock.patch.object(Report, 'sections',
+                               return_value=OrderedDict(charts=lambda: draw_charts([commits, authors]))):
+            report.create_data_figs()
+
+        self.assertTrue(os.path.exists(commits))
+        self.assertTrue(os.path.exists(authors))
+        self.assertListEqual(sorted(report.render_times), [authors, commits])
+        with open(os.path.join(temp_path, Report.CHARTS_FILE)) as f:
+            self.assertListEqual(sorted(json.load(f)), [authors, commits])
+        self.assertIsNone(report.chart_pool)
+
+        # the directory of the chart can't be created in the chart process
+        with open(os.path.join(temp_path, "file"), "w") as f:
+            f.write("Not a dir")
+        broken = os.path.join(temp_path, "file", "figs", "broken.eps")
+        issues = os.path.join(temp_path, "figs", "issues.eps")
+        with mock.patch.object(Report, 'sections',
+                               return_value=OrderedDict(charts=lambda: draw_charts([broken, issues]))):
+            with self.assertRaises(OSError):
+                report.create_data_figs()
+
+        # the charts drawn are recorded, but not the failed one
+        self.assertListEqual(list(report.render_times), [issues])
+        with open(os.path.join(temp_path, Report.CHARTS_FILE)) as f:
+            self.assertListEqual(sorted(json.load(f)), [authors, commits, issues])
+
+        shutil.rmtree(temp_path)
+
+    def test_workers(self):
+        """Test whether the projects generated concurrently give the same files"""
+
+        start = parser.parse('2017-07-01T00:00:00+00:00')
+        end = parser.parse('2018-06-30T23:59:59+00:00')
+        files = []
+        for workers in [1, 4]:
+            ClientRegistry.set_client(self.es_url, SyntheticClient(projects=6, months=12, end=end))
+            temp_path = tempfile.mkdtemp(prefix='manuscripts_')
+            report = Report(self.es_url, start, end, data_dir=temp_path, data_sources=['git', 'github'],
+                            projects=True, workers=workers, render_workers=0, chart_backend='eps')
+            report.create_data_figs()
+            files.append(read_files(temp_path))
+            ClientRegistry.reset()
+            shutil.rmtree(temp_path)
+
+        self.assertIn(os.path.join('data', 'git_authors_project-3.csv'), files[0])
+        self.assertIn(os.path.join('figs', 'git_commits_git_authors_project-3.eps'), files[0])
+        self.assertDictEqual(files[0], files[1])
+
     def tearDown(self):
         pass
 
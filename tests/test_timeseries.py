@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Fifth Floor, Boston, MA 02110-1335, USA.
+#
+
+import json
+import sys
+import unittest
+
+from datetime import date
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from manuscripts.timeseries import TimeSeries
+
+BUCKETS = [
+    {"key": 1525132800000, "key_as_string": "2018-05-01T00:00:00.000Z", "doc_count": 4},
+    {"key": 1527811200000, "key_as_string": "2018-06-01T00:00:00.000Z", "doc_count": 0},
+    {"key": 1530403200000, "key_as_string": "2018-07-01T00:00:00.000Z", "doc_count": 3}
+]
+
+MEDIANS = [{"values": {"50.0": 2.5}}, {"values": {"50.0": "NaN"}}, {"values": {"50.0": 4}}]
+
+
+class TestTimeSeries(unittest.TestCase):
+    """Tests for the time series of the metrics"""
+
+    def test_from_buckets(self):
+        """Test whether the time series is built from the buckets of a date histogram"""
+
+        ts = TimeSeries.from_buckets(BUCKETS, "2")
+        self.assertDictEqual(ts, {"date": [bucket['key_as_string'] for bucket in BUCKETS],
+                                  "value": [4, 0, 3],
+                                  "unixtime": [1525132800.0, 1527811200.0, 1530403200.0]})
+        self.assertEqual(json.dumps(ts), json.dumps(dict(ts)))
+
+        buckets = [dict(bucket, **{"2": median}) for bucket, median in zip(BUCKETS, MEDIANS)]
+        ts = TimeSeries.from_buckets(buckets, "2", dates=True)
+        self.assertListEqual(ts['value'], [2.5, None, 4])
+        self.assertListEqual(ts['date'], [date(2018, 5, 1), date(2018, 6, 1), date(2018, 7, 1)])
+        self.assertListEqual(ts.mask.tolist(), [False, True, False])
+
+    def test_operations(self):
+        """Test whether the values are added and divided keeping their types"""
+
+        merged = TimeSeries.from_buckets(BUCKETS, "2")
+        abandoned = {"date": merged['date'], "value": [1, 0, 3], "unixtime": merged['unixtime']}
+        submitted = {"date": merged['date'], "value": [2, 0, 4], "unixtime": merged['unixtime']}
+
+        closed = merged.add(abandoned)
+        self.assertListEqual(closed['value'], [5, 0, 6])
+        self.assertListEqual([type(value) for value in closed['value']], [int, int, int])
+        self.assertListEqual(closed['date'], merged['date'])
+
+        bmi = closed.divide(submitted)
+        self.assertListEqual(bmi['value'], [2.5, 0, 1.5])
+        self.assertListEqual([type(value) for value in bmi['value']], [float, int, float])
+
+    def test_period_labels(self):
+        """Test whether the periods are named by month or quarter"""
+
+        ts = TimeSeries.from_dict(dict(TimeSeries.from_buckets(BUCKETS, "2")))
+        self.assertListEqual(ts.get_period_labels('month', None), ['18-05', '18-06', '18-07'])
+        self.assertListEqual(ts.get_period_labels('quarter', lambda pdate: pdate.strftime('%m/%y')),
+                             ['05/18', '06/18', '07/18'])
+
+
+if __name__ == "__main__":
+    unittest.main(buffer=True, warnings='ignore')